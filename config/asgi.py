@@ -11,6 +11,7 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Routes the read-heavy pages to their async views
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings_asgi')
 
 application = get_asgi_application()
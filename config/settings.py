@@ -10,7 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
-from decouple import config
+from decouple import Csv, config
 from pathlib import Path
 import os
 
@@ -44,20 +44,26 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its timings cover every other middleware
+    'events.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'events.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# config.settings_asgi switches this to config.urls_asgi, which serves the
+# read-heavy pages with async views
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render time recorded by RequestMetricsMiddleware
+        'BACKEND': 'events.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -77,13 +83,111 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
+# DATABASE_ENGINE=postgresql selects the production profile; otherwise the
+# SQLite file below is used, as in development.
+DATABASE_ENGINE = config('DATABASE_ENGINE', default='sqlite3')
+
+# Tuning for sites that run on SQLite:
+# - WAL lets readers carry on while a write commits.
+# - synchronous=NORMAL only syncs at checkpoints, which is still safe in
+#   WAL mode.
+# - busy_timeout (ms) makes a writer wait for the lock instead of failing.
+# - mmap_size (bytes) and cache_size (negative means KiB) keep hot pages
+#   in memory.
+# IMMEDIATE transactions take the write lock when they begin.
+SQLITE_OPTIONS = {
+    'pragmas': {
+        'journal_mode': config('SQLITE_JOURNAL_MODE', default='wal'),
+        'synchronous': config('SQLITE_SYNCHRONOUS', default='normal'),
+        'busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int),
+        'mmap_size': config('SQLITE_MMAP_SIZE', default=128 * 1024 * 1024, cast=int),
+        'cache_size': config('SQLITE_CACHE_SIZE', default=-32000, cast=int),
+    },
+    'transaction_mode': config('SQLITE_TRANSACTION_MODE', default='IMMEDIATE'),
+}
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DATABASE_NAME', default='eventplanner'),
+            'USER': config('DATABASE_USER', default='eventplanner'),
+            'PASSWORD': config('DATABASE_PASSWORD', default=''),
+            'HOST': config('DATABASE_HOST', default='localhost'),
+            'PORT': config('DATABASE_PORT', default='5432'),
+            # Persistent connections, checked before each request reuses one
+            # so a restarted server or dropped connection isn't an error
+            'CONN_MAX_AGE': config('DATABASE_CONN_MAX_AGE', default=60, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'connect_timeout': config('DATABASE_CONNECT_TIMEOUT', default=5, cast=int)},
+        }
+    }
+    # Streaming replicas of the primary, one alias per host (or host:port)
+    for index, replica in enumerate(config('DATABASE_REPLICA_HOSTS', default='', cast=Csv())):
+        host, _, port = replica.partition(':')
+        DATABASES[f'replica_{index}'] = dict(
+            DATABASES['default'], HOST=host, PORT=port or DATABASES['default']['PORT'], TEST={'MIRROR': 'default'},
+        )
+else:
+    DATABASES = {
+        'default': {
+            # Django's SQLite backend plus the pragmas and transaction_mode options
+            'ENGINE': 'events.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': SQLITE_OPTIONS,
+            # A file (rather than shared-cache in-memory) test database lets the
+            # concurrency tests wait on SQLite's lock instead of failing outright
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+
+# Reads of the events app made by EVENTS_REPLICA_VIEWS go to one of these
+# aliases. A client that wrote to the primary reads from it again for the
+# next EVENTS_REPLICA_PIN_SECONDS, so it always sees its own RSVPs and edits.
+DATABASE_ROUTERS = ['events.routers.PrimaryReplicaRouter']
+EVENTS_DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+EVENTS_REPLICA_VIEWS = ('home', 'event_detail')
+EVENTS_REPLICA_PIN_SECONDS = config('EVENTS_REPLICA_PIN_SECONDS', default=10, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Switch to e.g. django.core.cache.backends.filebased.FileBasedCache or
+# django.core.cache.backends.redis.RedisCache (LOCATION=redis://...) via .env
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='eventplanner'),
     }
 }
 
+# Seconds a rendered home page grid may be served; also bounds how long an
+# event that just started can linger on the upcoming listing
+EVENTS_HOME_CACHE_TIMEOUT = config('EVENTS_HOME_CACHE_TIMEOUT', default=60, cast=int)
+
+
+# Sessions and auth
+# cached_db reads sessions from the cache and writes them through to the
+# database; django.contrib.sessions.backends.signed_cookies needs no storage
+# at all. Signed-in users are cached for EVENTS_USER_CACHE_TIMEOUT seconds.
+# Both rely on a cache shared by every process (see CACHE_BACKEND), or a
+# logout or password change only reaches the process that handled it, so
+# sessions stay in the database while the cache is local to one process
+# (`check --deploy` warns about the user cache too).
+
+SESSION_ENGINE = config(
+    'SESSION_ENGINE',
+    default='django.contrib.sessions.backends.db'
+    if CACHES['default']['BACKEND'].endswith('.LocMemCache') else 'django.contrib.sessions.backends.cached_db',
+)
+AUTHENTICATION_BACKENDS = [
+    'events.auth.CachedModelBackend',
+    # Resolves sessions that were signed in before CachedModelBackend
+    'django.contrib.auth.backends.ModelBackend',
+]
+EVENTS_USER_CACHE_TIMEOUT = config('EVENTS_USER_CACHE_TIMEOUT', default=300, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -126,6 +230,17 @@ STATIC_URL = 'static/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# collectstatic fingerprints every asset (app.css -> app.3f2a….css) and
+# writes .gz/.br copies; config/wsgi.py serves them with
+# events.staticfiles.PrecompressedStaticFiles
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'events.staticfiles.CompressedManifestStaticFilesStorage'},
+}
+# Cache lifetime (seconds) of static files requested by their unhashed
+# name; fingerprinted names are cached for a year as immutable
+EVENTS_STATIC_MAX_AGE = config('EVENTS_STATIC_MAX_AGE', default=60, cast=int)
+
 # No need for STATICFILES_DIRS if you don’t have custom static files
 # STATICFILES_DIRS = [
 #     os.path.join(BASE_DIR, 'static'),
@@ -143,6 +258,74 @@ AWS_SECRET_ACCESS_KEY = config("AWS_SECRET_ACCESS_KEY")
 AWS_STORAGE_BUCKET_NAME = config("AWS_STORAGE_BUCKET_NAME")  # Load bucket name from .env
 AWS_S3_REGION_NAME = config("AWS_S3_REGION_NAME", default="us-west-2")  # Default region
 AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
+AWS_S3_MAX_POOL_CONNECTIONS = config("AWS_S3_MAX_POOL_CONNECTIONS", default=20, cast=int)
+
+# Background tasks (image uploads) run on an in-process thread pool.
+# Set EVENTS_TASK_BACKEND=sync to run them inline instead.
+EVENTS_TASK_BACKEND = config("EVENTS_TASK_BACKEND", default="thread")
+EVENTS_TASK_WORKERS = config("EVENTS_TASK_WORKERS", default=4, cast=int)
+
+# Widths (px) of the resized copies generated for every uploaded event image
+EVENTS_IMAGE_WIDTHS = (360, 720, 1440)
+
+# Browser uploads straight to S3 through presigned URLs
+EVENTS_IMAGE_CONTENT_TYPES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+}
+EVENTS_IMAGE_MAX_UPLOAD_SIZE = config("EVENTS_IMAGE_MAX_UPLOAD_SIZE", default=10 * 1024 * 1024, cast=int)
+EVENTS_PRESIGNED_UPLOAD_EXPIRY = config("EVENTS_PRESIGNED_UPLOAD_EXPIRY", default=300, cast=int)
+
+# Unused S3 objects are queued and removed by `manage.py drain_s3_deletions`;
+# failed deletes are retried after RETRY_BASE * 2**(attempts - 1) seconds
+EVENTS_DELETION_RETRY_BASE = config("EVENTS_DELETION_RETRY_BASE", default=30, cast=int)
+EVENTS_DELETION_RETRY_MAX = config("EVENTS_DELETION_RETRY_MAX", default=6 * 60 * 60, cast=int)
+# How long a drain may hold claimed keys while S3 deletes them; a crashed
+# drain's claims expire after this and the keys are retried
+EVENTS_DELETION_CLAIM_SECONDS = config("EVENTS_DELETION_CLAIM_SECONDS", default=300, cast=int)
+
+# Offline geocoding of Event.location: a dotted path to a callable returning
+# (latitude, longitude) or None. The default looks locations up in a local
+# CSV with location,latitude,longitude columns; no network is involved.
+EVENTS_GEOCODER = config("EVENTS_GEOCODER", default="events.geo.table_geocoder")
+EVENTS_GEOCODING_TABLE = config("EVENTS_GEOCODING_TABLE", default="")
+
+# iCalendar feeds: rendered VEVENTs are cached per event version, and feeds
+# include events that ended up to EVENTS_CALENDAR_PAST_DAYS ago
+EVENTS_CALENDAR_CACHE_TIMEOUT = config("EVENTS_CALENDAR_CACHE_TIMEOUT", default=24 * 60 * 60, cast=int)
+EVENTS_CALENDAR_PAST_DAYS = config("EVENTS_CALENDAR_PAST_DAYS", default=30, cast=int)
+
+# Request metrics: Server-Timing headers and a Prometheus text endpoint at
+# /metrics/, answered only with this bearer token (disabled while empty)
+EVENTS_METRICS_TOKEN = config("EVENTS_METRICS_TOKEN", default="")
+
+# Most SQL queries a request to each view may run, sessions and auth
+# included. Exceeding one is logged, or raises when STRICT is set.
+EVENTS_QUERY_BUDGETS = {
+    'home': 4,
+    'search': 4,
+    'event_detail': 4,
+    # Cancelling with a waitlist: lock, pick the head, promote, recount
+    'toggle_rsvp': 9,
+    'create_event': 3,
+    # Plus filling the waitlist when the capacity changes
+    'update_event': 10,
+    # Plus releasing the event's image, and queueing its S3 objects for
+    # deletion when no other event uses it
+    'delete_event': 8,
+    # Streamed rows are fetched after the response leaves the middleware
+    'export_events': 2,
+    'export_attendees': 3,
+    'attending_calendar': 1,
+    'organiser_calendar': 2,
+    'api_event_list': 1,
+    'api_event_detail': 1,
+    'api_events_nearby': 1,
+    'rsvp_status': 4,
+}
+EVENTS_QUERY_BUDGET_STRICT = config("EVENTS_QUERY_BUDGET_STRICT", default=False, cast=bool)
 
 # # Media files
 # DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
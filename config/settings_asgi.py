@@ -0,0 +1,9 @@
+"""
+Settings for ASGI servers, which config/asgi.py selects.
+
+The same as config.settings, except that config.urls_asgi serves the
+read-heavy pages with their async views.
+"""
+from .settings import *  # noqa: F401,F403
+
+ROOT_URLCONF = 'config.urls_asgi'
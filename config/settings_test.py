@@ -0,0 +1,55 @@
+"""
+Settings for the test suite, which manage.py selects for `manage.py test`.
+
+By default two SQLite databases stand in for a primary and a replica. With
+DATABASE_ENGINE=postgresql the suite runs on the configured PostgreSQL
+server instead, with a second database there as the 'replica'. Nothing is
+routed to the replica unless a test opts in by overriding
+EVENTS_DATABASE_REPLICAS. Without the opt-in, every test would need to
+copy its rows to the replica. Streaming replicas from
+DATABASE_REPLICA_HOSTS are kept as mirrors of the test database, for the
+tests that pause replication on a real standby.
+
+Passwords are hashed with MD5, as the suite creates and signs in hundreds
+of users; never use it outside tests. Static files use the plain storage,
+so templates render without running collectstatic first.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASE_ENGINE, DATABASES, SQLITE_OPTIONS, STORAGES
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = dict(DATABASES, replica=dict(
+        DATABASES['default'],
+        # A separate database, so tests can show replication lag
+        TEST={'NAME': f"test_{DATABASES['default']['NAME']}_replica"},
+    ))
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'events.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': SQLITE_OPTIONS,
+            # A file (rather than shared-cache in-memory) test database lets the
+            # concurrency tests wait on SQLite's lock instead of failing outright
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        },
+        'replica': {
+            'ENGINE': 'events.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': SQLITE_OPTIONS,
+            # A separate database, so tests can show replication lag
+            'TEST': {'NAME': BASE_DIR / 'test_replica.sqlite3'},
+        },
+    }
+EVENTS_DATABASE_REPLICAS = []
+
+# Any view going over its query budget fails the test that requested it
+EVENTS_QUERY_BUDGET_STRICT = True
+
+# The suite runs in one process, so the local-memory cache is safe to keep
+# sessions in, as a shared cache would in production
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+STORAGES = dict(STORAGES, staticfiles={'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'})
@@ -0,0 +1,17 @@
+"""
+URL configuration for ASGI servers.
+
+The same routes as config.urls, except that the read-heavy pages are served
+by their async views so they don't hold a thread while waiting on the cache
+or database. config/asgi.py selects it through config.settings_asgi.
+"""
+from django.urls import path
+
+from events import views
+from .urls import urlpatterns as wsgi_urlpatterns
+
+# Listed first, so these win over the sync views at the same paths
+urlpatterns = [
+    path('', views.home_async, name='home'),
+    path('event/<int:event_id>/', views.event_detail_async, name='event_detail'),
+] + wsgi_urlpatterns
@@ -13,4 +13,7 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_wsgi_application()
+# Static files are answered before Django's request handling starts
+from events.staticfiles import PrecompressedStaticFiles  # noqa: E402
+
+application = PrecompressedStaticFiles(get_wsgi_application())
@@ -0,0 +1,113 @@
+import hashlib
+
+from django.http import JsonResponse
+from django.utils.http import urlencode
+from django.views.decorators.http import condition, require_GET
+
+from .geo import nearby_events
+from .models import Event
+from .pagination import KeysetPaginator
+
+# Columns fetched with .values(), so no model instances are built
+EVENT_LIST_FIELDS = (
+    'id', 'title', 'date', 'location', 'capacity', 'attendee_count',
+    'image', 'image_variants', 'created_at', 'updated_at',
+)
+EVENT_DETAIL_FIELDS = EVENT_LIST_FIELDS + ('description', 'created_by__username')
+
+EVENTS_PER_PAGE = 20
+
+NEARBY_DEFAULT_RADIUS_KM = 25
+NEARBY_MAX_RADIUS_KM = 500
+NEARBY_MAX_RESULTS = 100
+
+
+def _serialize(row):
+    row = dict(row)
+    if 'created_by__username' in row:
+        row['organiser'] = row.pop('created_by__username')
+    row['image'] = row['image'] or None
+    return row
+
+
+def _version(row):
+    return f"{row['id']}:{row['created_at'].isoformat()}:{row['updated_at'].isoformat()}"
+
+
+# The validators and the views share one fetch per request, memoized on it
+
+def _event_page(request):
+    if '_api_event_page' not in request.__dict__:
+        events = Event.objects.all() if request.GET.get('include_past') == '1' else Event.objects.upcoming()
+        paginator = KeysetPaginator(events.values(*EVENT_LIST_FIELDS), EVENTS_PER_PAGE)
+        request._api_event_page = paginator.get_page(request.GET)
+    return request._api_event_page
+
+
+def _event_row(request, event_id):
+    if '_api_event_row' not in request.__dict__:
+        request._api_event_row = Event.objects.filter(pk=event_id).values(*EVENT_DETAIL_FIELDS).first()
+    return request._api_event_row
+
+
+def _list_etag(request):
+    page = _event_page(request)
+    # Covers the rows on the page and the links to the neighbouring pages
+    state = [page.number, page.has_previous, page.has_next] + [_version(row) for row in page]
+    return hashlib.sha1(repr(state).encode()).hexdigest()
+
+
+def _list_last_modified(request):
+    return max((row['updated_at'] for row in _event_page(request)), default=None)
+
+
+def _detail_etag(request, event_id):
+    row = _event_row(request, event_id)
+    return hashlib.sha1(_version(row).encode()).hexdigest() if row else None
+
+
+def _detail_last_modified(request, event_id):
+    row = _event_row(request, event_id)
+    return row['updated_at'] if row else None
+
+
+def _page_url(request, **params):
+    if request.GET.get('include_past') == '1':
+        params['include_past'] = '1'
+    return request.build_absolute_uri(f'{request.path}?{urlencode(params)}')
+
+
+@require_GET
+@condition(etag_func=_list_etag, last_modified_func=_list_last_modified)
+def event_list(request):
+    page = _event_page(request)
+    return JsonResponse({
+        'results': [_serialize(row) for row in page],
+        'next': _page_url(request, after=page.next_cursor) if page.next_cursor else None,
+        'previous': _page_url(request, before=page.previous_cursor) if page.previous_cursor else None,
+    })
+
+
+@require_GET
+@condition(etag_func=_detail_etag, last_modified_func=_detail_last_modified)
+def event_detail(request, event_id):
+    row = _event_row(request, event_id)
+    if row is None:
+        return JsonResponse({'error': 'No Event matches the given query.'}, status=404)
+    return JsonResponse(_serialize(row))
+
+
+@require_GET
+def nearby(request):
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['lon'])
+        radius = float(request.GET.get('radius', NEARBY_DEFAULT_RADIUS_KM))
+        limit = int(request.GET.get('limit', EVENTS_PER_PAGE))
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'lat and lon are required numbers.'}, status=400)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or not 0 < radius <= NEARBY_MAX_RADIUS_KM:
+        return JsonResponse({'error': 'Coordinates or radius out of range.'}, status=400)
+
+    rows = nearby_events(Event.objects.all(), latitude, longitude, radius, min(max(limit, 1), NEARBY_MAX_RESULTS))
+    return JsonResponse({'results': rows})
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class EventsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'events'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+
+        from . import checks, metrics, signals  # noqa: F401
+
+        post_migrate.connect(signals.repair_search_index, sender=self)
+        connection_created.connect(metrics.install_query_recorder)
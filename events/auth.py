@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+def user_cache_key(user_id):
+    return f'events:user:{user_id}'
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that serves the users of signed-in sessions from the cache,
+    so a request costs no user SELECT. Saving or deleting a user drops its
+    entry, so a password change still signs out its other sessions at once.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                # The timeout bounds how long a save racing this load can
+                # leave a stale copy behind
+                cache.set(key, user, settings.EVENTS_USER_CACHE_TIMEOUT)
+        return user
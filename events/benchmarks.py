@@ -0,0 +1,499 @@
+import asyncio
+import io
+import json
+import math
+import platform
+import random
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest.mock import patch
+
+import django
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, connections, transaction
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import metrics, tasks
+from .cache import bump_events_version
+from .management.commands.rebuild_attendee_counts import attendee_count_subquery
+from .models import Event, RSVP
+from .pagination import KeysetPaginator
+from .fakes import FakeS3Client
+
+SEED_BATCH_SIZE = 1000
+BENCHMARK_PASSWORD = 'benchmark-password'
+LOCATIONS = ('Amsterdam', 'Berlin', 'Lisbon', 'Madrid', 'Paris', 'Prague', 'Rome', 'Vienna')
+# Fractions of the upcoming listing at which home_deep opens a page
+DEEP_PAGE_POSITIONS = (0.25, 0.5, 0.75, 0.95)
+
+# Metrics compared between runs; a run regresses when one grows by more
+# than the tolerance (or, for query counts, at all)
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'queries_per_request')
+
+# Read-only scenarios that --concurrency runs under both request paths:
+# sync views on a thread per request (WSGI) and, with config.urls_asgi,
+# async views on one event loop (ASGI)
+CONCURRENT_SCENARIOS = ('home_deep', 'event_detail', 'rsvp_status')
+TRANSPORTS = {'wsgi': 'config.urls', 'asgi': 'config.urls_asgi'}
+
+# --write-contention compares the configured SQLite OPTIONS against what a
+# plain django.db.backends.sqlite3 entry gets: a rollback journal and
+# deferred transactions. RSVPs and reads all go to HOT_EVENTS, while
+# organisers delete events of their own.
+SQLITE_DEFAULT_OPTIONS = {'pragmas': {'journal_mode': 'delete'}, 'transaction_mode': 'DEFERRED'}
+CONTENTION_ROLES = ('toggle_rsvp', 'delete_event', 'event_detail')
+HOT_EVENTS = 3
+
+
+class BenchmarkData:
+    """Ids and cursors of a seeded database that the scenarios pick from."""
+
+    def __init__(self, user, event_ids, deep_cursors, image):
+        self.user = user
+        self.event_ids = event_ids
+        self.deep_cursors = deep_cursors
+        # JPEG uploaded with every create_event request
+        self.image = image
+
+
+def seed(users, events, rsvps, seed=0):
+    """
+    Fill an empty database with ``users`` users, ``events`` events spread
+    over the coming year and ``rsvps`` distinct RSVPs, using bulk inserts.
+    The same arguments always produce the same rows.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    # Hashing once keeps seeding fast; every user shares the password
+    password = make_password(BENCHMARK_PASSWORD)
+
+    with transaction.atomic():
+        User.objects.bulk_create(
+            (User(username=f'bench{n}', password=password) for n in range(max(users, 1))),
+            batch_size=SEED_BATCH_SIZE,
+        )
+        user_ids = list(User.objects.filter(username__startswith='bench').order_by('id').values_list('id', flat=True))
+
+        Event.objects.bulk_create(
+            (
+                Event(
+                    title=f'Benchmark event {n}',
+                    description=f'Event {n} of the benchmark data set, held in {LOCATIONS[n % len(LOCATIONS)]}.',
+                    date=now + timedelta(minutes=rng.randrange(60, 365 * 24 * 60)),
+                    location=LOCATIONS[n % len(LOCATIONS)],
+                    created_by_id=rng.choice(user_ids),
+                )
+                for n in range(events)
+            ),
+            batch_size=SEED_BATCH_SIZE,
+        )
+        event_ids = list(Event.objects.order_by('id').values_list('id', flat=True))
+
+        # Distinct (user, event) pairs drawn from the full cross product
+        pairs = rng.sample(range(len(user_ids) * len(event_ids)), min(rsvps, len(user_ids) * len(event_ids)))
+        RSVP.objects.bulk_create(
+            (RSVP(user_id=user_ids[pair // len(event_ids)], event_id=event_ids[pair % len(event_ids)]) for pair in pairs),
+            batch_size=SEED_BATCH_SIZE,
+        )
+        Event.objects.update(attendee_count=attendee_count_subquery(), updated_at=timezone.now())
+    bump_events_version()
+
+
+def load_data(per_page=5):
+    events = Event.objects.upcoming()
+    total = events.count()
+    paginator = KeysetPaginator(events, per_page)
+    deep_cursors = []
+    for position in DEEP_PAGE_POSITIONS:
+        offset = int(total * position)
+        row = events.order_by(*paginator.key_fields).values(*paginator.key_fields)[offset:offset + 1].first()
+        if row is not None:
+            deep_cursors.append(paginator.encode_cursor(row, offset // per_page + 1))
+    return BenchmarkData(
+        user=User.objects.filter(username__startswith='bench').order_by('id').first(),
+        event_ids=list(Event.objects.values_list('id', flat=True)),
+        deep_cursors=deep_cursors,
+        image=jpeg_bytes(),
+    )
+
+
+def jpeg_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 600), color='teal').save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def request_home(client, data, rng):
+    return client.get(reverse('home'))
+
+
+def request_home_deep(client, data, rng):
+    return client.get(reverse('home'), {'after': rng.choice(data.deep_cursors)})
+
+
+def request_event_detail(client, data, rng):
+    return client.get(reverse('event_detail', args=[rng.choice(data.event_ids)]))
+
+
+def request_rsvp_status(client, data, rng):
+    return client.get(reverse('rsvp_status', args=[rng.choice(data.event_ids)]))
+
+
+def request_toggle_rsvp(client, data, rng):
+    return client.post(reverse('toggle_rsvp', args=[rng.choice(data.event_ids)]))
+
+
+def request_create_event(client, data, rng):
+    return client.post(reverse('create_event'), {
+        'title': 'Benchmark upload',
+        'description': 'Created by the benchmark.',
+        'date': (timezone.now() + timedelta(days=30)).strftime('%Y-%m-%d %H:%M'),
+        'location': rng.choice(LOCATIONS),
+        'image': SimpleUploadedFile('benchmark.jpg', data.image, content_type='image/jpeg'),
+    })
+
+
+# (name, signed in, expected status codes, request function)
+SCENARIOS = (
+    # Anonymous visitors are mostly served from the home page cache
+    ('home', False, {200}, request_home),
+    # Signed-in users skip that cache; keyset cursors deep into the listing
+    ('home_deep', True, {200}, request_home_deep),
+    ('event_detail', True, {200}, request_event_detail),
+    ('rsvp_status', True, {200}, request_rsvp_status),
+    ('toggle_rsvp', True, {302}, request_toggle_rsvp),
+    ('create_event', True, {302}, request_create_event),
+)
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of ``samples``, which must be sorted."""
+    if not samples:
+        return None
+    return samples[max(math.ceil(len(samples) * fraction) - 1, 0)]
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def summarize(latencies, elapsed, queries, errors):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': _ms(percentile(latencies, 0.50)),
+        'p95_ms': _ms(percentile(latencies, 0.95)),
+        'p99_ms': _ms(percentile(latencies, 0.99)),
+        'mean_ms': _ms(sum(latencies) / len(latencies)) if latencies else None,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'queries_per_request': round(queries / len(latencies), 2) if latencies else None,
+    }
+
+
+def production_settings():
+    # DEBUG off, but static URLs need no collectstatic manifest
+    return override_settings(DEBUG=False, STORAGES=dict(
+        settings.STORAGES, staticfiles={'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    ))
+
+
+def make_client(client_class, signed_in, data):
+    client = client_class()
+    if signed_in:
+        client.force_login(data.user)
+    return client
+
+
+def recorded_queries():
+    # Counted by RequestMetricsMiddleware, so sessions and auth are included
+    return sum(totals['queries'] for totals in metrics.registry.snapshot().values())
+
+
+def run_scenario(signed_in, expected, make_request, data, requests, warmup, rng):
+    client = make_client(Client, signed_in, data)
+    for _ in range(warmup):
+        make_request(client, data, rng)
+
+    metrics.registry.reset()
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = make_request(client, data, rng)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code not in expected:
+            errors += 1
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, recorded_queries(), errors)
+
+
+def _shares(requests, concurrency):
+    return [requests // concurrency + (n < requests % concurrency) for n in range(concurrency)]
+
+
+def run_wsgi_concurrently(signed_in, expected, make_request, data, requests, concurrency, rng):
+    clients = [make_client(Client, signed_in, data) for _ in range(concurrency)]
+
+    def worker(client, count):
+        timings = []
+        try:
+            for _ in range(count):
+                start = time.perf_counter()
+                response = make_request(client, data, rng)
+                timings.append((time.perf_counter() - start, response.status_code in expected))
+        finally:
+            connections.close_all()
+        return timings
+
+    metrics.registry.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        timings = [timing for outcome in pool.map(worker, clients, _shares(requests, concurrency)) for timing in outcome]
+    elapsed = time.perf_counter() - started
+    return summarize([t for t, _ in timings], elapsed, recorded_queries(), sum(not ok for _, ok in timings))
+
+
+def run_asgi_concurrently(signed_in, expected, make_request, data, requests, concurrency, rng):
+    clients = [make_client(AsyncClient, signed_in, data) for _ in range(concurrency)]
+
+    async def worker(client, count):
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = await make_request(client, data, rng)
+            timings.append((time.perf_counter() - start, response.status_code in expected))
+        return timings
+
+    async def run():
+        return await asyncio.gather(*map(worker, clients, _shares(requests, concurrency)))
+
+    metrics.registry.reset()
+    started = time.perf_counter()
+    timings = [timing for outcome in async_to_sync(run)() for timing in outcome]
+    elapsed = time.perf_counter() - started
+    return summarize([t for t, _ in timings], elapsed, recorded_queries(), sum(not ok for _, ok in timings))
+
+
+def run_concurrency_benchmarks(data, concurrency, requests=200, seed=0, scenarios=None, log=None):
+    """
+    Run the read-only scenarios with ``concurrency`` clients in flight, once
+    through the WSGI handler on threads and once through the ASGI handler
+    on an event loop. Results are keyed ``<scenario>@<wsgi|asgi>``.
+    """
+    runners = {'wsgi': run_wsgi_concurrently, 'asgi': run_asgi_concurrently}
+    results = {}
+    with production_settings():
+        for name, signed_in, expected, make_request in SCENARIOS:
+            if name not in CONCURRENT_SCENARIOS or (scenarios and name not in scenarios):
+                continue
+            for transport, urlconf in TRANSPORTS.items():
+                key = f'{name}@{transport}'
+                with override_settings(ROOT_URLCONF=urlconf):
+                    results[key] = runners[transport](
+                        signed_in, expected, make_request, data, requests, concurrency,
+                        random.Random(f'{seed}:{key}'),
+                    )
+                if log:
+                    log(key, results[key])
+    return results
+
+
+def _locked(error):
+    return 'database is locked' in str(error)
+
+
+def contention_request(role, client, event_id):
+    if role == 'event_detail':
+        return client.get(reverse('event_detail', args=[event_id])).status_code == 200
+    return client.post(reverse(role, args=[event_id])).status_code == 302
+
+
+def contention_clients(users, data, requests):
+    """
+    One signed-in client per user, cycling through CONTENTION_ROLES, each
+    with the events it will request. Deleting clients get events of their
+    own, with an RSVP each so the delete has to collect it first.
+    """
+    hot_events = data.event_ids[:HOT_EVENTS]
+    roles = [CONTENTION_ROLES[n % len(CONTENTION_ROLES)] for n in range(len(users))]
+    clients = []
+    for role, user in zip(roles, users):
+        client = Client()
+        client.force_login(user)
+        count = requests // roles.count(role) or 1
+        if role == 'delete_event':
+            events = Event.objects.bulk_create(
+                Event(
+                    title='Contention event', date=timezone.now() + timedelta(days=30),
+                    location=LOCATIONS[0], created_by=user,
+                )
+                for _ in range(count)
+            )
+            RSVP.objects.bulk_create(RSVP(user=user, event=event) for event in events)
+            event_ids = [event.pk for event in events]
+        else:
+            event_ids = hot_events
+        clients.append((role, client, event_ids, count))
+    return clients
+
+
+def run_contention(clients, rng):
+    def worker(role, client, event_ids, count):
+        timings = []
+        try:
+            for n in range(count):
+                event_id = event_ids[n] if role == 'delete_event' else rng.choice(event_ids)
+                start = time.perf_counter()
+                try:
+                    ok = contention_request(role, client, event_id)
+                except OperationalError as e:
+                    if not _locked(e):
+                        raise
+                    ok = False
+                timings.append((role, time.perf_counter() - start, ok))
+        finally:
+            connections.close_all()
+        return timings
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(len(clients)) as pool:
+        futures = [pool.submit(worker, *client) for client in clients]
+        timings = [timing for future in futures for timing in future.result()]
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for role in CONTENTION_ROLES:
+        mine = [(t, ok) for r, t, ok in timings if r == role]
+        if mine:
+            # Queries are not counted: a failed request stops partway through
+            results[role] = summarize([t for t, _ in mine], elapsed, 0, sum(not ok for _, ok in mine))
+    return results
+
+
+def run_write_contention(data, writers, requests=200, seed=0, log=None):
+    """
+    Run ``writers`` clients per CONTENTION_ROLES entry at once against the
+    same few events, first with SQLite's defaults and then with the
+    configured OPTIONS. ``errors`` counts requests that failed with
+    "database is locked". Results are keyed ``<view>@<default|tuned>``;
+    other databases are skipped.
+    """
+    if connection.vendor != 'sqlite':
+        return {}
+    users = list(User.objects.filter(username__startswith='bench').order_by('id')[:writers * len(CONTENTION_ROLES)])
+    settings_dict = connection.settings_dict
+    configured = settings_dict['OPTIONS']
+    results = {}
+    try:
+        for profile, options in (('default', SQLITE_DEFAULT_OPTIONS), ('tuned', configured)):
+            # The journal mode only changes while nothing else is connected
+            connections.close_all()
+            settings_dict['OPTIONS'] = options
+            connection.ensure_connection()
+
+            clients = contention_clients(users, data, requests)
+            with production_settings(), \
+                    patch('events.views.delete_image_from_s3'):
+                outcome = run_contention(clients, random.Random(f'{seed}:contention:{profile}'))
+            for role, result in outcome.items():
+                key = f'{role}@{profile}'
+                results[key] = result
+                if log:
+                    log(key, result)
+    finally:
+        connections.close_all()
+        settings_dict['OPTIONS'] = configured
+    return results
+
+
+def run_benchmarks(data, requests=200, warmup=20, seed=0, scenarios=None, log=None):
+    """
+    Drive each scenario through the test client against the current
+    database and return its latency, throughput and query figures.
+
+    Runs with DEBUG off and S3 replaced by an in-memory fake. Image uploads
+    queued by create_event run after its timings are taken, as the worker
+    pool would run them after the response.
+    """
+    queued = []
+    results = {}
+    with production_settings(), \
+            patch('events.utils.get_s3_client', return_value=FakeS3Client()), \
+            patch('events.views.run_in_background', lambda func, *args, **kwargs: queued.append((func, args, kwargs))):
+        for name, signed_in, expected, make_request in SCENARIOS:
+            if scenarios and name not in scenarios:
+                continue
+            results[name] = run_scenario(
+                signed_in, expected, make_request, data, requests, warmup, random.Random(f'{seed}:{name}'),
+            )
+            if log:
+                log(name, results[name])
+            with override_settings(EVENTS_TASK_BACKEND='sync'):
+                for func, args, kwargs in queued:
+                    tasks.run_in_background(func, *args, **kwargs)
+            queued.clear()
+    return results
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f'{revision}-dirty' if dirty else revision
+
+
+def build_report(parameters, results):
+    return {
+        'revision': git_revision(),
+        'created_at': timezone.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'machine': platform.machine(),
+        },
+        'parameters': parameters,
+        'results': results,
+    }
+
+
+def compare(baseline, report, tolerance=0.2):
+    """
+    Compare ``report`` with an earlier ``baseline`` report. Returns rows of
+    ``(scenario, metric, before, after, regressed)``; latencies regress when
+    they grow by more than ``tolerance``, query counts when they grow at all.
+    """
+    rows = []
+    for name, result in report['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            limit = old if metric == 'queries_per_request' else old * (1 + tolerance)
+            rows.append((name, metric, old, new, new > limit))
+    return rows
+
+
+def load_report(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,48 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+EVENTS_VERSION_KEY = 'events:version'
+
+# Query parameters that select a page of the home listing
+HOME_PAGE_PARAMS = ('page', 'after', 'before', 'include_past')
+
+
+def get_events_version():
+    version = cache.get(EVENTS_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted counter never reuses an old version
+        cache.add(EVENTS_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(EVENTS_VERSION_KEY)
+    return version
+
+
+async def aget_events_version():
+    version = await cache.aget(EVENTS_VERSION_KEY)
+    if version is None:
+        await cache.aadd(EVENTS_VERSION_KEY, time.time_ns(), timeout=None)
+        version = await cache.aget(EVENTS_VERSION_KEY)
+    return version
+
+
+def bump_events_version():
+    try:
+        return cache.incr(EVENTS_VERSION_KEY)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(EVENTS_VERSION_KEY, version, timeout=None)
+        return version
+
+
+def _home_page_digest(params):
+    selector = '&'.join(f'{name}={params.get(name, "")}' for name in HOME_PAGE_PARAMS)
+    return hashlib.sha1(selector.encode()).hexdigest()
+
+
+def home_page_cache_key(params):
+    return f'events:home:{get_events_version()}:{_home_page_digest(params)}'
+
+
+async def ahome_page_cache_key(params):
+    return f'events:home:{await aget_events_version()}:{_home_page_digest(params)}'
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Sessions and users kept in the cache, which must then be shared by every
+# server process
+CACHED_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.cache',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if not settings.CACHES['default']['BACKEND'].endswith('.LocMemCache'):
+        return []
+    cached = [
+        name for name, used in (
+            ('sessions', settings.SESSION_ENGINE in CACHED_SESSION_ENGINES),
+            ('signed-in users', 'events.auth.CachedModelBackend' in settings.AUTHENTICATION_BACKENDS),
+        ) if used
+    ]
+    if not cached:
+        return []
+    return [Warning(
+        f'{" and ".join(cached).capitalize()} are cached in a local-memory cache, which each server process '
+        'keeps to itself, so a logout or password change only reaches the process that handled it.',
+        hint='Set CACHE_BACKEND to a shared cache such as Redis before running more than one process.',
+        id='events.W001',
+    )]
@@ -0,0 +1,95 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Event, RSVP
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Rows fetched per database round trip; memory stays bounded by this
+EXPORT_CHUNK_SIZE = 2000
+
+EVENT_COLUMNS = {
+    'id': lambda event: event.id,
+    'title': lambda event: event.title,
+    'date': lambda event: event.date,
+    'location': lambda event: event.location,
+    'capacity': lambda event: event.capacity,
+    'attendee_count': lambda event: event.attendee_count,
+    'created_at': lambda event: event.created_at,
+}
+
+ATTENDEE_COLUMNS = {
+    'username': lambda rsvp: rsvp.user.username,
+    'email': lambda rsvp: rsvp.user.email,
+    'status': lambda rsvp: rsvp.status,
+    'rsvped_at': lambda rsvp: rsvp.timestamp,
+}
+
+
+# Spreadsheets evaluate cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    # csv.writer target that hands each formatted line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def event_rows(events):
+    events = events.only(*EVENT_COLUMNS).order_by('date', 'id')
+    for event in events.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {name: get(event) for name, get in EVENT_COLUMNS.items()}
+
+
+def attendee_rows(event_id):
+    rsvps = (
+        RSVP.objects.filter(event_id=event_id)
+        .select_related('user')
+        .only('status', 'timestamp', 'user__username', 'user__email')
+        .order_by('timestamp', 'id')
+    )
+    for rsvp in rsvps.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {name: get(rsvp) for name, get in ATTENDEE_COLUMNS.items()}
+
+
+def csv_cell(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    # Titles, locations and usernames are user input: a leading quote keeps
+    # them from running as formulas when the file is opened in a spreadsheet
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(rows, columns):
+    writer = csv.writer(Echo())
+    yield writer.writerow(list(columns))
+    for row in rows:
+        yield writer.writerow([csv_cell(value) for value in row.values()])
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def iter_export(rows, columns, export_format):
+    """Yield the rows as text lines in ``export_format`` ('csv' or 'ndjson')."""
+    if export_format == 'csv':
+        return iter_csv(rows, columns)
+    return iter_ndjson(rows)
+
+
+def export_events(organiser, export_format):
+    return iter_export(event_rows(Event.objects.filter(created_by=organiser)), EVENT_COLUMNS, export_format)
+
+
+def export_attendees(event_id, export_format):
+    return iter_export(attendee_rows(event_id), ATTENDEE_COLUMNS, export_format)
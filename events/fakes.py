@@ -0,0 +1,91 @@
+import base64
+import hashlib
+import threading
+
+from botocore.exceptions import ClientError
+
+
+class FakeS3Client:
+    """
+    In-memory stand-in for the boto3 S3 client used by events.utils, for the
+    test suite and the benchmarks.
+    """
+
+    def __init__(self, fail_uploads=False):
+        self.objects = {}
+        self.fail_uploads = fail_uploads
+        self.lock = threading.Lock()
+        self.uploads = 0
+        self.downloads = []
+        self.delete_batches = []
+        self.undeletable = set()
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None):
+        if self.fail_uploads:
+            raise ConnectionError('S3 is unavailable')
+        data = fileobj.read()
+        with self.lock:
+            self.uploads += 1
+            self.objects[key] = {'Body': data, 'ExtraArgs': ExtraArgs or {}}
+
+    def head_object(self, Bucket, Key, ChecksumMode=None):
+        with self.lock:
+            stored = self.objects.get(Key)
+        if stored is None:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        head = {
+            'ContentLength': len(stored['Body']),
+            'ContentType': stored['ExtraArgs'].get('ContentType', 'binary/octet-stream'),
+        }
+        if ChecksumMode == 'ENABLED' and 'ChecksumSHA256' in stored['ExtraArgs']:
+            head['ChecksumSHA256'] = stored['ExtraArgs']['ChecksumSHA256']
+        return head
+
+    def get_object(self, Bucket, Key):
+        with self.lock:
+            self.downloads.append(Key)
+            stored = self.objects[Key]
+        return {'Body': FakeStreamingBody(stored['Body'])}
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600):
+        return {
+            'url': f'https://{Bucket}.s3.amazonaws.com/',
+            'fields': dict(Fields or {}, key=Key, policy='fake-policy'),
+            'conditions': Conditions,
+        }
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600):
+        return f"https://{Params['Bucket']}.s3.amazonaws.com/{Params['Key']}?X-Amz-Signature=fake"
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        checksum = kwargs.get('ChecksumSHA256')
+        if checksum and checksum != base64.b64encode(hashlib.sha256(Body).digest()).decode():
+            raise ClientError({'Error': {'Code': 'BadDigest', 'Message': 'Checksum mismatch'}}, 'PutObject')
+        with self.lock:
+            self.objects[Key] = {'Body': Body, 'ExtraArgs': kwargs}
+        return {}
+
+    def delete_object(self, Bucket, Key):
+        with self.lock:
+            self.objects.pop(Key, None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        self.delete_batches.append([item['Key'] for item in Delete['Objects']])
+        errors = []
+        with self.lock:
+            for item in Delete['Objects']:
+                if item['Key'] in self.undeletable:
+                    errors.append({'Key': item['Key'], 'Code': 'AccessDenied', 'Message': 'Access Denied'})
+                else:
+                    self.objects.pop(item['Key'], None)
+        return {'Errors': errors} if errors else {}
+
+
+class FakeStreamingBody:
+    def __init__(self, data):
+        self.data = data
+
+    def iter_chunks(self, chunk_size=1024):
+        for start in range(0, len(self.data), chunk_size):
+            yield self.data[start:start + chunk_size]
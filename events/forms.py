@@ -1,7 +1,10 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
+from .geo import locate
 from .models import Event
+from .utils import direct_upload_prefix, head_s3_object
 
 class RegisterForm(UserCreationForm):
     email = forms.EmailField()
@@ -17,20 +20,51 @@ class RegisterForm(UserCreationForm):
 
 
 class EventForm(forms.ModelForm):
+    # Key of an image the browser already uploaded with a presigned URL
+    image_key = forms.CharField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = Event
-        fields = ['title', 'description', 'date', 'location', 'image']
+        fields = ['title', 'description', 'date', 'location', 'capacity', 'image']
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, user=None, **kwargs):
+        self.user = user
         super(EventForm, self).__init__(*args, **kwargs)
         placeholders = {
             'title': 'Enter event title',
             'description': 'Describe the event...',
             'date': 'YYYY-MM-DD HH:MM',
             'location': 'Where is the event?',
+            'capacity': 'Leave empty for unlimited',
             'image': '',
         }
         for field_name, field in self.fields.items():
             field.widget.attrs['class'] = 'form-control'
             field.widget.attrs['placeholder'] = placeholders.get(field_name, '')
 
+
+    def save(self, commit=True):
+        event = super().save(commit=False)
+        if 'location' in self.changed_data or event.latitude is None:
+            locate(event)
+        if commit:
+            event.save()
+            self._save_m2m()
+        return event
+
+    def clean_image_key(self):
+        key = self.cleaned_data.get('image_key')
+        if not key:
+            return ''
+        # Only accept objects uploaded through this user's presigned URLs
+        if self.user is None or not key.startswith(direct_upload_prefix(self.user)) or '..' in key:
+            raise forms.ValidationError('Invalid image upload.')
+
+        head = head_s3_object(key)
+        if head is None:
+            raise forms.ValidationError('The uploaded image could not be found. Please upload it again.')
+        if head.get('ContentLength', 0) > settings.EVENTS_IMAGE_MAX_UPLOAD_SIZE:
+            raise forms.ValidationError('The uploaded image is too large.')
+        if head.get('ContentType') not in settings.EVENTS_IMAGE_CONTENT_TYPES:
+            raise forms.ValidationError('Upload a valid image.')
+        return key
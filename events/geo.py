@@ -0,0 +1,169 @@
+import csv
+import functools
+import math
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return the ``(height, width)`` in degrees of a geohash cell."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+# Upper bound on the cells (and so index range scans) one search uses
+MAX_COVER_CELLS = 16
+
+
+def _cover(latitude, longitude, radius_km, precision):
+    # Row and column indices of the geohash grid at ``precision`` that cover
+    # the bounding box of the circle
+    height, width = cell_size(precision)
+    lat_span = math.degrees(radius_km / EARTH_RADIUS_KM)
+    # Longitude degrees shrink towards the pole, so use the box's polar edge
+    shrink = max(math.cos(math.radians(min(abs(latitude) + lat_span, 90.0))), 0.01)
+    lon_span = lat_span / shrink
+
+    row_count, column_count = round(180.0 / height), round(360.0 / width)
+    south = max(latitude - lat_span, -90.0)
+    north = min(latitude + lat_span, 90.0)
+    rows = range(int((south + 90.0) // height), min(int((north + 90.0) // height), row_count - 1) + 1)
+    if 2 * lon_span >= 360.0:
+        columns = range(column_count)
+    else:
+        first = int((longitude - lon_span + 180.0) // width)
+        last = int((longitude + lon_span + 180.0) // width)
+        columns = [column % column_count for column in range(first, last + 1)]
+    return rows, columns
+
+
+def precision_for_radius(latitude, longitude, radius_km):
+    # The finest precision that covers the circle with at most
+    # MAX_COVER_CELLS cells, which makes a cell about the radius across
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        rows, columns = _cover(latitude, longitude, radius_km, precision)
+        if len(rows) * len(columns) <= MAX_COVER_CELLS:
+            return precision
+    return 0
+
+
+def covering_cells(latitude, longitude, radius_km, precision):
+    """The geohash cells at ``precision`` covering the circle's bounding box."""
+    height, width = cell_size(precision)
+    rows, columns = _cover(latitude, longitude, radius_km, precision)
+    return sorted({
+        encode_geohash(-90.0 + (row + 0.5) * height, -180.0 + (column + 0.5) * width, precision)
+        for row in rows for column in columns
+    })
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def nearby_events(events, latitude, longitude, radius_km, limit, now=None):
+    """
+    Return up to ``limit`` upcoming events within ``radius_km`` of the point
+    as ``.values()`` dicts with a ``distance_km`` key, nearest first.
+
+    Candidates come from index range scans over the geohash prefixes of the
+    cells covering the circle, so the cost depends on how many events are
+    nearby, not on the size of the table.
+    """
+    precision = precision_for_radius(latitude, longitude, radius_km)
+    events = events.filter(date__gte=now or timezone.now())
+    if precision:
+        prefixes = Q()
+        for cell in covering_cells(latitude, longitude, radius_km, precision):
+            # A range rather than startswith, so every backend can use the index
+            prefixes |= Q(geohash__gte=cell, geohash__lt=cell + '~')
+        events = events.filter(prefixes)
+    else:
+        events = events.exclude(geohash='')
+
+    nearby = []
+    for row in events.values('id', 'title', 'date', 'location', 'latitude', 'longitude').iterator():
+        distance = haversine_km(latitude, longitude, row['latitude'], row['longitude'])
+        if distance <= radius_km:
+            row['distance_km'] = round(distance, 3)
+            nearby.append(row)
+    nearby.sort(key=lambda row: (row['distance_km'], row['date'], row['id']))
+    return nearby[:limit]
+
+
+def normalize_location(location):
+    return ' '.join(location.lower().split())
+
+
+@functools.lru_cache(maxsize=None)
+def load_geocoding_table(path):
+    # location,latitude,longitude rows, read once per process
+    with open(path, newline='', encoding='utf-8') as f:
+        return {
+            normalize_location(row['location']): (float(row['latitude']), float(row['longitude']))
+            for row in csv.DictReader(f)
+        }
+
+
+def table_geocoder(location):
+    """
+    Look ``location`` up in the EVENTS_GEOCODING_TABLE CSV. Tries the full
+    text first and then each comma-separated part from the end, so
+    "Hall 3, Amsterdam" falls back to "Amsterdam".
+    """
+    if not settings.EVENTS_GEOCODING_TABLE:
+        return None
+    table = load_geocoding_table(settings.EVENTS_GEOCODING_TABLE)
+    parts = [normalize_location(part) for part in location.split(',')]
+    for candidate in [normalize_location(location)] + parts[::-1]:
+        if candidate in table:
+            return table[candidate]
+    return None
+
+
+def geocode(location):
+    """Return ``(latitude, longitude)`` for ``location`` or ``None``, using EVENTS_GEOCODER."""
+    if not location or not settings.EVENTS_GEOCODER:
+        return None
+    return import_string(settings.EVENTS_GEOCODER)(location)
+
+
+def locate(event):
+    """Set the event's coordinates and geohash from its location."""
+    coordinates = geocode(event.location)
+    event.latitude, event.longitude = coordinates or (None, None)
+    # Also set here, not only by the pre_save signal: bulk_create() (used by
+    # the importer) sends no signals
+    event.geohash = encode_geohash(*coordinates) if coordinates else ''
+    return coordinates is not None
@@ -0,0 +1,142 @@
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Event, RSVP
+
+# Columns needed to render a VEVENT, fetched with .values()
+VEVENT_FIELDS = (
+    'id', 'title', 'description', 'location', 'date', 'latitude', 'longitude',
+    'created_at', 'updated_at',
+)
+
+# Events rendered and cached per round trip to the database and the cache
+CALENDAR_CHUNK_SIZE = 200
+
+FEED_TOKEN_SALT = 'events.ics.feed'
+
+
+def feed_token(user):
+    # Calendar clients cannot log in, so the feed URL carries a signed user id
+    return signing.dumps(user.pk, salt=FEED_TOKEN_SALT)
+
+
+def user_from_feed_token(token):
+    try:
+        return int(signing.loads(token, salt=FEED_TOKEN_SALT))
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+
+
+def feed_events(**filters):
+    # Upcoming events plus the recent past, so just-finished events stay visible
+    since = timezone.now() - timedelta(days=settings.EVENTS_CALENDAR_PAST_DAYS)
+    return Event.objects.filter(date__gte=since, **filters)
+
+
+def attending_events(user_id):
+    return feed_events(rsvp__user_id=user_id, rsvp__status=RSVP.Status.GOING)
+
+
+def organised_events(username):
+    return feed_events(created_by__username=username)
+
+
+def feed_state(events):
+    """``(etag, last_modified)`` for a feed, from one aggregate query."""
+    state = events.aggregate(count=Count('id'), last_modified=Max('updated_at'))
+    etag = hashlib.sha1(f"{state['count']}:{state['last_modified']}".encode()).hexdigest()
+    return etag, state['last_modified']
+
+
+def escape_text(value):
+    # RFC 5545 TEXT escaping
+    return (
+        value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n')
+    )
+
+
+def fold_line(line):
+    # Content lines are limited to 75 octets; longer ones continue on lines
+    # starting with a space, without splitting a UTF-8 character
+    data = line.encode()
+    if len(data) <= 75:
+        return line + '\r\n'
+    parts, start, limit = [], 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode())
+        start, limit = end, 74
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def render_vevent(row, base_url):
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:event-{row['id']}@eventplanner",
+        f"DTSTAMP:{format_utc(row['updated_at'])}",
+        f"DTSTART:{format_utc(row['date'])}",
+        f"CREATED:{format_utc(row['created_at'])}",
+        f"LAST-MODIFIED:{format_utc(row['updated_at'])}",
+        f"SUMMARY:{escape_text(row['title'])}",
+        f"DESCRIPTION:{escape_text(row['description'])}",
+        f"LOCATION:{escape_text(row['location'])}",
+        f"URL:{base_url}{reverse('event_detail', args=[row['id']])}",
+    ]
+    if row['latitude'] is not None and row['longitude'] is not None:
+        lines.append(f"GEO:{row['latitude']:.6f};{row['longitude']:.6f}")
+    lines.append('END:VEVENT')
+    return ''.join(fold_line(line) for line in lines)
+
+
+def vevent_cache_key(row, base_url):
+    # updated_at is part of the key, so saving an event invalidates its entry
+    site = hashlib.sha1(base_url.encode()).hexdigest()[:8]
+    return f"events:ics:{row['id']}:{row['updated_at'].timestamp()}:{site}"
+
+
+def render_vevents(rows, base_url):
+    """Return the VEVENTs for ``rows``, rendering only those not cached yet."""
+    keys = [vevent_cache_key(row, base_url) for row in rows]
+    cached = cache.get_many(keys)
+    missing = {}
+    for key, row in zip(keys, rows):
+        if key not in cached:
+            cached[key] = missing[key] = render_vevent(row, base_url)
+    if missing:
+        cache.set_many(missing, settings.EVENTS_CALENDAR_CACHE_TIMEOUT)
+    return ''.join(cached[key] for key in keys)
+
+
+def iter_calendar(events, name, base_url):
+    """Stream a VCALENDAR for ``events``, one chunk of cached VEVENTs at a time."""
+    yield ''.join(fold_line(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//EventPlanner//Events//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape_text(name)}',
+    ))
+    chunk = []
+    for row in events.values(*VEVENT_FIELDS).order_by('date', 'id').iterator(chunk_size=CALENDAR_CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) == CALENDAR_CHUNK_SIZE:
+            yield render_vevents(chunk, base_url)
+            chunk = []
+    if chunk:
+        yield render_vevents(chunk, base_url)
+    yield 'END:VCALENDAR\r\n'
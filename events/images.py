@@ -0,0 +1,40 @@
+import io
+
+from PIL import Image, ImageOps
+
+# Pillow save format -> (file extension, content type)
+DERIVATIVE_FORMATS = {
+    'WEBP': ('webp', 'image/webp'),
+    'JPEG': ('jpg', 'image/jpeg'),
+}
+
+
+def build_derivatives(image_file, widths, quality=80):
+    """
+    Yield ``(width, extension, content_type, data)`` for each target width.
+
+    The source is decoded once. For JPEGs ``draft()`` lets the decoder scale
+    by a power of two while reading, so a large banner never has to be held
+    in memory at full resolution. Each smaller size is then resized from the
+    previous one. Widths larger than the source are clamped to its width.
+    """
+    image_file.seek(0)
+    with Image.open(image_file) as source:
+        largest = min(max(widths), source.width)
+        source.draft('RGB', (largest, max(1, source.height * largest // source.width)))
+        current = ImageOps.exif_transpose(source).convert('RGB')
+
+    for width in sorted({min(w, current.width) for w in widths}, reverse=True):
+        if current.width > width:
+            height = max(1, round(current.height * width / current.width))
+            current = current.resize((width, height), Image.LANCZOS)
+        for image_format, (extension, content_type) in DERIVATIVE_FORMATS.items():
+            buffer = io.BytesIO()
+            current.save(buffer, image_format, quality=quality, optimize=True)
+            yield width, extension, content_type, buffer.getvalue()
+
+
+def srcset(variants, extension):
+    # variants: {"webp": {"360": url, ...}, "jpg": {...}}
+    urls = variants.get(extension, {})
+    return ', '.join(f'{urls[w]} {w}w' for w in sorted(urls, key=int))
@@ -0,0 +1,114 @@
+import csv
+import json
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .cache import bump_events_version
+from .forms import EventForm
+from .models import Event
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+IMPORT_BATCH_SIZE = 500
+
+
+class EventImportForm(EventForm):
+    # EventForm's rules without the image fields, which need an upload
+    image_key = None
+
+    class Meta(EventForm.Meta):
+        fields = ['title', 'description', 'date', 'location', 'capacity']
+
+
+class UnreadableRow:
+    # Stands in for an NDJSON line that is not a JSON object, so it is
+    # reported like an invalid row and still counts towards the position
+    def __init__(self, message):
+        self.errors = {'line': [message]}
+
+
+def read_rows(stream, import_format):
+    """Yield one dict per CSV row or NDJSON line, reading ``stream`` lazily."""
+    if import_format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield UnreadableRow(f'Invalid JSON: {e.msg}.')
+            continue
+        yield row if isinstance(row, dict) else UnreadableRow('Expected a JSON object.')
+
+
+def resolve_organisers(usernames, organisers):
+    # One query per batch for the usernames not seen yet; ``organisers`` is
+    # the cache shared by all batches (unknown names map to None)
+    missing = set(usernames) - organisers.keys()
+    if missing:
+        found = dict(User.objects.filter(username__in=missing).values_list('username', 'pk'))
+        organisers.update({username: found.get(username) for username in missing})
+
+
+def import_events(rows, batch_size=IMPORT_BATCH_SIZE, skip=0, on_batch=None, on_error=None):
+    """
+    Validate ``rows`` and insert them with ``bulk_create``, one transaction
+    per batch. The first ``skip`` rows are passed over, so an interrupted
+    import can resume from the last committed position.
+
+    ``on_batch(position, imported)`` runs inside each batch's transaction
+    with the number of rows consumed so far, so a checkpoint saved to the
+    database commits with the batch and one that cannot be saved rolls the
+    batch back; ``on_error(position, errors)`` is called
+    for each invalid or unreadable row, which is skipped. Returns
+    ``(imported, invalid)``.
+    """
+    organisers = {}
+    imported = invalid = 0
+    position = skip
+    rows = islice(rows, skip, None)
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        resolve_organisers(
+            (str(row.get('created_by', '')) for row in batch if not isinstance(row, UnreadableRow)), organisers,
+        )
+
+        events = []
+        for offset, row in enumerate(batch, start=position + 1):
+            if isinstance(row, UnreadableRow):
+                invalid += 1
+                if on_error:
+                    on_error(offset, row.errors)
+                continue
+            form = EventImportForm(row)
+            organiser_id = organisers.get(str(row.get('created_by', '')))
+            if not form.is_valid() or organiser_id is None:
+                errors = dict(form.errors)
+                if organiser_id is None:
+                    errors['created_by'] = ['Unknown username.']
+                invalid += 1
+                if on_error:
+                    on_error(offset, errors)
+                continue
+            event = form.save(commit=False)
+            event.created_by_id = organiser_id
+            events.append(event)
+
+        with transaction.atomic():
+            Event.objects.bulk_create(events)
+            if on_batch:
+                on_batch(position + len(batch), imported + len(events))
+        imported += len(events)
+        position += len(batch)
+
+    if imported:
+        # bulk_create sends no signals, so drop the cached listing pages by hand
+        bump_events_version()
+    return imported, invalid
@@ -0,0 +1,117 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from events import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database and measure latency, throughput and query counts '
+        'of the core views; optionally compare against an earlier run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help='Users to seed.')
+        parser.add_argument('--events', type=int, default=10000, help='Events to seed.')
+        parser.add_argument('--rsvps', type=int, default=50000, help='RSVPs to seed.')
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per scenario.')
+        parser.add_argument(
+            '--concurrency', type=int, default=0,
+            help='Also run the read-only scenarios with this many clients at once, under WSGI and ASGI.',
+        )
+        parser.add_argument(
+            '--write-contention', type=int, default=0, metavar='WRITERS',
+            help=(
+                'Also run this many clients each toggling RSVPs, deleting events and reading at once, '
+                'with the SQLite defaults and with the configured OPTIONS.'
+            ),
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the data and the requests.')
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            choices=[name for name, *_ in benchmarks.SCENARIOS],
+            help='Only run the given scenario (can be repeated).',
+        )
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--compare', help='JSON report of an earlier run to compare with.')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Latency growth (as a fraction) allowed before --compare reports a regression.',
+        )
+
+    def handle(self, *args, **options):
+        baseline = benchmarks.load_report(options['compare']) if options['compare'] else None
+        parameters = {
+            name: options[name] for name in (
+                'users', 'events', 'rsvps', 'requests', 'warmup', 'concurrency', 'write_contention', 'seed',
+            )
+        }
+        if baseline and baseline['parameters'] != parameters:
+            self.stderr.write('The baseline was run with different parameters; timings are not comparable.')
+
+        # Never touch the configured database: seed a fresh one beside it
+        old_name = connection.settings_dict['NAME']
+        connection.settings_dict['TEST'] = dict(connection.settings_dict['TEST'], NAME=self.database_name(old_name))
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write('Seeding {users} users, {events} events and {rsvps} RSVPs...'.format(**parameters))
+            benchmarks.seed(options['users'], options['events'], options['rsvps'], seed=options['seed'])
+            data = benchmarks.load_data()
+            results = benchmarks.run_benchmarks(
+                data, requests=options['requests'], warmup=options['warmup'],
+                seed=options['seed'], scenarios=options['scenarios'], log=self.log_result,
+            )
+            if options['concurrency'] > 0:
+                self.stdout.write(f"{options['concurrency']} concurrent clients:")
+                results.update(benchmarks.run_concurrency_benchmarks(
+                    data, options['concurrency'], requests=options['requests'],
+                    seed=options['seed'], scenarios=options['scenarios'], log=self.log_result,
+                ))
+            if options['write_contention'] > 0:
+                self.stdout.write(f"{options['write_contention']} clients each toggling RSVPs, deleting events and reading:")
+                results.update(benchmarks.run_write_contention(
+                    data, options['write_contention'], requests=options['requests'],
+                    seed=options['seed'], log=self.log_result,
+                ))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = benchmarks.build_report(parameters, results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}.")
+
+        if baseline:
+            self.compare(baseline, report, options['tolerance'])
+
+    def database_name(self, name):
+        if connection.vendor == 'sqlite':
+            return str(Path(name).with_name('benchmark_db.sqlite3'))
+        return f'benchmark_{name}'
+
+    def log_result(self, name, result):
+        self.stdout.write(
+            f"{name:<18} p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  "
+            f"p99 {result['p99_ms']:>8.2f}ms  {result['throughput_rps']:>7.1f} req/s  "
+            f"{result['queries_per_request']:>5.2f} queries  {result['errors']} error(s)"
+        )
+
+    def compare(self, baseline, report, tolerance):
+        self.stdout.write(f"Compared with {baseline['revision'] or 'an unknown revision'}:")
+        regressions = 0
+        for name, metric, before, after, regressed in benchmarks.compare(baseline, report, tolerance):
+            change = f'{(after - before) / before:+.0%}' if before else 'n/a'
+            line = f'{name:<18} {metric:<20} {before:>9} -> {after:<9} {change}'
+            if regressed:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(f'{line}  REGRESSION'))
+            else:
+                self.stdout.write(line)
+        if regressions:
+            raise CommandError(f'{regressions} metric(s) regressed beyond the tolerance.')
+        self.stdout.write(self.style.SUCCESS('No regressions.'))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from events.utils import drain_pending_deletions
+
+
+class Command(BaseCommand):
+    help = 'Delete queued S3 objects in batches, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Keys per delete_objects call (max 1000).')
+        parser.add_argument('--loop', action='store_true', help='Keep draining instead of exiting when idle.')
+        parser.add_argument('--interval', type=float, default=30, help='Seconds to sleep between idle polls.')
+
+    def handle(self, *args, **options):
+        total_resolved = total_failed = 0
+        while True:
+            resolved, failed = drain_pending_deletions(batch_size=options['batch_size'])
+            total_resolved += resolved
+            total_failed += failed
+            if resolved or failed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Resolved {total_resolved} queued deletion(s); {total_failed} failure(s) will be retried.'
+        ))
@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from events import exports
+from events.exports import EXPORT_FORMATS
+from events.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Stream events or an event\'s attendee list to CSV/NDJSON without loading every row into memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        target = parser.add_mutually_exclusive_group()
+        target.add_argument('--organiser', help='Only export events created by this username.')
+        target.add_argument('--attendees', type=int, metavar='EVENT_ID', help='Export the RSVPs of this event.')
+        parser.add_argument('--output', help='File to write to (default: stdout).')
+
+    def handle(self, *args, **options):
+        export_format = options['format']
+        if options['attendees']:
+            if not Event.objects.filter(pk=options['attendees']).exists():
+                raise CommandError(f"Event {options['attendees']} does not exist.")
+            lines = exports.export_attendees(options['attendees'], export_format)
+        else:
+            events = Event.objects.all()
+            if options['organiser']:
+                try:
+                    organiser = User.objects.get(username=options['organiser'])
+                except User.DoesNotExist:
+                    raise CommandError(f"User {options['organiser']!r} does not exist.")
+                events = events.filter(created_by=organiser)
+            lines = exports.iter_export(exports.event_rows(events), exports.EVENT_COLUMNS, export_format)
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+            self.stderr.write(self.style.SUCCESS(f"Exported to {options['output']}."))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
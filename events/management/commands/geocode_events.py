@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from events.cache import bump_events_version
+from events.geo import encode_geohash, geocode
+from events.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Fill in Event latitude/longitude/geohash from the location with the offline geocoder.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-geocode events that already have coordinates.')
+
+    def handle(self, *args, **options):
+        events = Event.objects.all()
+        if not options['all']:
+            events = events.filter(latitude__isnull=True)
+
+        # Many events share a location: geocode each distinct one once and
+        # update all of its events with a single UPDATE
+        located = updated = unknown = 0
+        locations = events.order_by().values_list('location', flat=True).distinct()
+        for location in locations.iterator():
+            coordinates = geocode(location)
+            if coordinates is None:
+                unknown += 1
+                continue
+            located += 1
+            updated += events.filter(location=location).update(
+                latitude=coordinates[0], longitude=coordinates[1],
+                geohash=encode_geohash(*coordinates), updated_at=timezone.now(),
+            )
+
+        if updated:
+            bump_events_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Geocoded {updated} event(s) at {located} location(s); {unknown} location(s) not found.'
+        ))
@@ -0,0 +1,73 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from events.imports import IMPORT_BATCH_SIZE, IMPORT_FORMATS, import_events, read_rows
+from events.models import ImportCheckpoint
+
+
+class Command(BaseCommand):
+    help = 'Bulk import events from a CSV or NDJSON file, in batches that can be resumed after a failure.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for stdin.')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Input format (default: from the file extension).')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Rows per bulk_create transaction.')
+        parser.add_argument(
+            '--checkpoint',
+            help='Name under which committed progress is recorded; an existing checkpoint resumes the import.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        import_format = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        checkpoint = options['checkpoint']
+        skip = self.read_checkpoint(checkpoint)
+        if skip:
+            self.stdout.write(f'Resuming after row {skip}.')
+
+        def on_batch(position, imported):
+            if checkpoint:
+                self.write_checkpoint(checkpoint, position)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{position} row(s) read, {imported} imported, {self.rate(imported, started)}')
+
+        def on_error(position, errors):
+            details = '; '.join(f'{field}: {" ".join(messages)}' for field, messages in errors.items())
+            self.stderr.write(f'Row {position} skipped: {details}')
+
+        started = time.monotonic()
+        try:
+            stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError(e)
+        try:
+            imported, invalid = import_events(
+                read_rows(stream, import_format), batch_size=options['batch_size'],
+                skip=skip, on_batch=on_batch, on_error=on_error,
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if checkpoint:
+            ImportCheckpoint.objects.filter(name=checkpoint).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} event(s) in {time.monotonic() - started:.1f}s '
+            f'({self.rate(imported, started)}); {invalid} invalid row(s) skipped.'
+        ))
+
+    def rate(self, imported, started):
+        elapsed = time.monotonic() - started
+        return f'{imported / elapsed if elapsed else 0:.0f} rows/s'
+
+    def read_checkpoint(self, checkpoint):
+        if not checkpoint:
+            return 0
+        return ImportCheckpoint.objects.filter(name=checkpoint).values_list('position', flat=True).first() or 0
+
+    def write_checkpoint(self, checkpoint, position):
+        # Runs inside the batch's transaction, so it commits (or rolls back)
+        # together with the rows
+        ImportCheckpoint.objects.update_or_create(name=checkpoint, defaults={'position': position})
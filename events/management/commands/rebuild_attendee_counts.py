@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from events.models import Event, RSVP
+
+
+def attendee_count_subquery():
+    # Correlated COUNT(*) of attending RSVPs per event, usable inside a single UPDATE
+    counts = (
+        RSVP.objects.filter(event=OuterRef('pk'), status=RSVP.Status.GOING)
+        .order_by()
+        .values('event')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized Event.attendee_count values from the RSVP table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--event', type=int, action='append', dest='event_ids',
+            help='Only rebuild the given event id (can be repeated).',
+        )
+
+    def handle(self, *args, **options):
+        events = Event.objects.all()
+        if options['event_ids']:
+            events = events.filter(pk__in=options['event_ids'])
+
+        # One UPDATE ... SET attendee_count = (SELECT COUNT(*) ...) for all rows
+        with transaction.atomic():
+            updated = events.update(attendee_count=attendee_count_subquery(), updated_at=timezone.now())
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt attendee counts for {updated} event(s).'))
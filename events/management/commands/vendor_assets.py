@@ -0,0 +1,32 @@
+import urllib.request
+from urllib.error import URLError
+
+from django.core.management.base import BaseCommand, CommandError
+
+from events.staticfiles import VENDOR_ASSETS, VENDOR_ROOT, sri_hash, strip_source_map
+
+
+class Command(BaseCommand):
+    help = (
+        'Download the pinned third-party assets into events/static/events/vendor/, '
+        'checking each against its Subresource Integrity hash.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for each download.')
+
+    def handle(self, *args, **options):
+        for url, path, integrity in VENDOR_ASSETS:
+            try:
+                with urllib.request.urlopen(url, timeout=options['timeout']) as response:
+                    data = response.read()
+            except URLError as e:
+                raise CommandError(f'Could not download {url}: {e}')
+            if sri_hash(data) != integrity:
+                raise CommandError(f'{url} does not match its pinned hash {integrity}.')
+
+            target = VENDOR_ROOT / path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(strip_source_map(data))
+            self.stdout.write(f'{path} ({len(data)} bytes)')
+        self.stdout.write(self.style.SUCCESS(f'Vendored {len(VENDOR_ASSETS)} asset(s) into {VENDOR_ROOT}.'))
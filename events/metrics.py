@@ -0,0 +1,230 @@
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    @property
+    def wall_time(self):
+        return time.perf_counter() - self.started
+
+
+# Metrics of the request being handled; a ContextVar so that concurrent
+# async requests and sync_to_async threads each see their own
+_current = ContextVar('events_request_metrics', default=None)
+
+
+# An atomic() block issues BEGIN when it is the outermost one and savepoints
+# when nested (as in every TestCase); neither is counted, so budgets hold
+# in both
+TRANSACTION_CONTROL = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None or sql.startswith(TRANSACTION_CONTROL):
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def install_query_recorder(connection, **kwargs):
+    # connection_created receiver; execute_wrappers outlive reconnects, so
+    # the recorder is only added once
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        metrics.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            # Templates rendered inside another template are already counted
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render time added to the request metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class MetricsRegistry:
+    """Process-local totals per view, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def observe(self, view, metrics, wall_time):
+        with self.lock:
+            totals = self.views.setdefault(view, {
+                'requests': 0, 'queries': 0, 'db': 0.0, 'template': 0.0, 'wall': 0.0,
+                'buckets': [0] * len(DURATION_BUCKETS),
+            })
+            totals['requests'] += 1
+            totals['queries'] += metrics.queries
+            totals['db'] += metrics.db_time
+            totals['template'] += metrics.template_time
+            totals['wall'] += wall_time
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if wall_time <= bound:
+                    totals['buckets'][index] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {view: dict(totals, buckets=list(totals['buckets'])) for view, totals in self.views.items()}
+
+    def render(self):
+        views = sorted(self.snapshot().items())
+        lines = []
+
+        def counter(name, help_text, key):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for view, totals in views:
+                lines.append(f'{name}{{view="{view}"}} {totals[key]}')
+
+        counter('eventplanner_requests_total', 'Requests handled.', 'requests')
+        counter('eventplanner_db_queries_total', 'SQL queries executed while handling requests.', 'queries')
+        counter('eventplanner_db_seconds_total', 'Time spent in SQL queries.', 'db')
+        counter('eventplanner_template_seconds_total', 'Time spent rendering templates.', 'template')
+
+        name = 'eventplanner_request_duration_seconds'
+        lines.append(f'# HELP {name} Wall time to handle a request.')
+        lines.append(f'# TYPE {name} histogram')
+        for view, totals in views:
+            for bound, count in zip(DURATION_BUCKETS, totals['buckets']):
+                lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {totals["requests"]}')
+            lines.append(f'{name}_sum{{view="{view}"}} {totals["wall"]}')
+            lines.append(f'{name}_count{{view="{view}"}} {totals["requests"]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name
+
+
+def server_timing(metrics, wall_time):
+    return ', '.join([
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+        f'tpl;dur={metrics.template_time * 1000:.1f}',
+        f'total;dur={wall_time * 1000:.1f}',
+    ])
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the SQL query count, DB time, template time and wall time of
+    every request per resolved view name. Adds a Server-Timing header and
+    feeds the /metrics/ endpoint. A view that runs more queries than its
+    EVENTS_QUERY_BUDGETS entry is logged, or raises QueryBudgetExceeded
+    when EVENTS_QUERY_BUDGET_STRICT is set (as the tests do).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _current.set(RequestMetrics())
+        try:
+            response = self.get_response(request)
+            return self.finish(request, response)
+        finally:
+            _current.reset(token)
+
+    async def __acall__(self, request):
+        token = _current.set(RequestMetrics())
+        try:
+            response = await self.get_response(request)
+            return self.finish(request, response)
+        finally:
+            _current.reset(token)
+
+    def finish(self, request, response):
+        metrics = _current.get()
+        wall_time = metrics.wall_time
+        view = view_name(request)
+        registry.observe(view, metrics, wall_time)
+        response['Server-Timing'] = server_timing(metrics, wall_time)
+
+        budget = settings.EVENTS_QUERY_BUDGETS.get(view)
+        if budget is not None and metrics.queries > budget:
+            message = f'{view} ran {metrics.queries} queries; its budget is {budget}.'
+            if settings.EVENTS_QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def metrics_view(request):
+    # Prometheus text exposition; only served to scrapers sending
+    # "Authorization: Bearer <EVENTS_METRICS_TOKEN>", since behind a proxy
+    # every request comes from the proxy's address
+    token = settings.EVENTS_METRICS_TOKEN
+    if not token or not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
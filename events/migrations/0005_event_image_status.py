@@ -0,0 +1,24 @@
+# Generated by Django 4.2.20 on 2026-10-17 06:03
+
+from django.db import migrations, models
+
+
+def mark_existing_images_ready(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    Event.objects.exclude(image__isnull=True).exclude(image='').update(image_status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_event_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='image_status',
+            field=models.CharField(blank=True, choices=[('', 'No image'), ('pending', 'Upload pending'), ('ready', 'Ready'), ('failed', 'Upload failed')], default='', editable=False, max_length=10),
+        ),
+        migrations.RunPython(mark_existing_images_ready, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.20 on 2026-10-17 06:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_stored_images(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    StoredImage = apps.get_model('events', 'StoredImage')
+    prefix = f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/"
+    stored = {}
+    events = Event.objects.exclude(image__isnull=True).exclude(image='')
+    for image, variants in events.values_list('image', 'image_variants').iterator():
+        key = image.replace(prefix, '')
+        entry = stored.setdefault(key, StoredImage(key=key, variants=variants or {}, ref_count=0))
+        entry.ref_count += 1
+    StoredImage.objects.bulk_create(stored.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0006_event_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('variants', models.JSONField(blank=True, default=dict)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_stored_images, migrations.RunPython.noop),
+    ]
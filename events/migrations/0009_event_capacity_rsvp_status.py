@@ -0,0 +1,28 @@
+# Generated by Django 4.2.20 on 2026-10-17 06:18
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0008_pendingdeletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='rsvp',
+            name='status',
+            field=models.CharField(choices=[('going', 'Going'), ('waitlisted', 'Waitlisted')], default='going', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='rsvp',
+            index=models.Index(fields=['event', 'status', 'timestamp', 'id'], name='rsvp_waitlist_idx'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 4.2.20 on 2026-10-17 06:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+SQLITE_FORWARD = [
+    # External-content FTS5 table: the text lives in events_event only
+    """CREATE VIRTUAL TABLE events_event_fts USING fts5(
+        title, description, location,
+        content='events_event', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    # Title matches count most, then location, then description
+    "INSERT INTO events_event_fts(events_event_fts, rank) VALUES('rank', 'bm25(10.0, 1.0, 5.0)')",
+    """CREATE TRIGGER events_event_fts_insert AFTER INSERT ON events_event BEGIN
+        INSERT INTO events_event_fts(rowid, title, description, location)
+        VALUES (new.id, new.title, new.description, new.location);
+    END""",
+    """CREATE TRIGGER events_event_fts_delete AFTER DELETE ON events_event BEGIN
+        INSERT INTO events_event_fts(events_event_fts, rowid, title, description, location)
+        VALUES ('delete', old.id, old.title, old.description, old.location);
+    END""",
+    """CREATE TRIGGER events_event_fts_update AFTER UPDATE OF title, description, location ON events_event BEGIN
+        INSERT INTO events_event_fts(events_event_fts, rowid, title, description, location)
+        VALUES ('delete', old.id, old.title, old.description, old.location);
+        INSERT INTO events_event_fts(rowid, title, description, location)
+        VALUES (new.id, new.title, new.description, new.location);
+    END""",
+    "INSERT INTO events_event_fts(events_event_fts) VALUES('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS events_event_fts_update',
+    'DROP TRIGGER IF EXISTS events_event_fts_delete',
+    'DROP TRIGGER IF EXISTS events_event_fts_insert',
+    'DROP TABLE IF EXISTS events_event_fts',
+]
+
+
+def postgres_search_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    # Must match events.search.search_vector() for the planner to use it
+    vector = (
+        SearchVector('title', weight='A', config='english')
+        + SearchVector('location', weight='B', config='english')
+        + SearchVector('description', weight='C', config='english')
+    )
+    return GinIndex(vector, name='event_search_idx')
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sql in SQLITE_FORWARD:
+            schema_editor.execute(sql)
+    elif vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('events', 'Event'), postgres_search_index())
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sql in SQLITE_BACKWARD:
+            schema_editor.execute(sql)
+    elif vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('events', 'Event'), postgres_search_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0010_event_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventSearchIndex',
+            fields=[
+                ('event', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='events.event')),
+                ('document', models.TextField(db_column='events_event_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'events_event_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-17 07:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0012_event_geolocation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingdeletion',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-17 07:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0013_pendingdeletion_claimed_until'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='image',
+            field=models.ImageField(blank=True, max_length=255, null=True, upload_to=''),
+        ),
+    ]
@@ -1,27 +1,160 @@
+from django.core.validators import MinValueValidator
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
+from .images import srcset
+
+
+class EventQuerySet(models.QuerySet):
+    def upcoming(self, now=None):
+        # Range scan on the (date, id) index rather than a full table scan
+        return self.filter(date__gte=now or timezone.now())
 
 
 class Event(models.Model):
+    class ImageStatus(models.TextChoices):
+        NONE = '', 'No image'
+        PENDING = 'pending', 'Upload pending'
+        READY = 'ready', 'Ready'
+        FAILED = 'failed', 'Upload failed'
+
     title = models.CharField(max_length=200)
     description = models.TextField()
     date = models.DateTimeField()
     location = models.CharField(max_length=255)
-    image = models.ImageField(null=True, blank=True)
+    # Filled from location by the offline geocoder (events.geo); the geohash
+    # is derived from them and indexed for proximity lookups
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, editable=False)
+    # Maximum number of attendees; further RSVPs join the waitlist
+    capacity = models.PositiveIntegerField(null=True, blank=True, validators=[MinValueValidator(1)])
+    # Holds the full S3 URL of a content-addressed object, which overflows
+    # the default max_length of 100
+    image = models.ImageField(max_length=255, null=True, blank=True)
+    # Images are uploaded to S3 in the background; image is filled in once ready
+    image_status = models.CharField(
+        max_length=10, choices=ImageStatus.choices, default=ImageStatus.NONE, blank=True, editable=False,
+    )
+    # Resized WebP/JPEG copies of image, keyed by extension and width
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also bumped by queryset update()s; backs the API's ETag/Last-Modified
+    updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized count of attending (not waitlisted) RSVPs, kept in sync by set_rsvp
+    attendee_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = EventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Backs the upcoming filter and (date, id) keyset pagination
+            models.Index(fields=['date', 'id'], name='event_date_id_idx'),
+            # Geohash prefix range scans for nearby_events()
+            models.Index(fields=['geohash', 'date'], name='event_geohash_date_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @property
+    def webp_srcset(self):
+        return srcset(self.image_variants, 'webp')
+
+    @property
+    def jpeg_srcset(self):
+        return srcset(self.image_variants, 'jpg')
+
+class FullTextMatch(models.Lookup):
+    # SQLite FTS5 full-text query: <fts table column> MATCH <query>
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class EventSearchIndex(models.Model):
+    # The SQLite FTS5 table over title, description and location, kept in
+    # sync with events_event by triggers (migration 0011). Not used on
+    # PostgreSQL, which searches a GIN expression index instead.
+    event = models.OneToOneField(
+        Event, primary_key=True, db_column='rowid', db_constraint=False,
+        on_delete=models.DO_NOTHING, related_name='search_index',
+    )
+    # FTS5's hidden column named after the table: the target of MATCH
+    document = models.TextField(db_column='events_event_fts')
+    # FTS5's hidden bm25 score (lower is better), only valid with a MATCH
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'events_event_fts'
+
+
+EventSearchIndex._meta.get_field('document').register_lookup(FullTextMatch)
+
+
 class RSVP(models.Model):
+    class Status(models.TextChoices):
+        GOING = 'going', 'Going'
+        WAITLISTED = 'waitlisted', 'Waitlisted'
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.GOING)
     timestamp = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('user', 'event')  # Prevent duplicate RSVPs
+        indexes = [
+            # Finds the head of an event's waitlist without sorting
+            models.Index(fields=['event', 'status', 'timestamp', 'id'], name='rsvp_waitlist_idx'),
+        ]
 
     def __str__(self):
+        if self.status == self.Status.WAITLISTED:
+            return f"{self.user.username} is waitlisted for {self.event.title}"
         return f"{self.user.username} RSVP'd to {self.event.title}"
+
+
+class StoredImage(models.Model):
+    # Reference count for a content-addressed image object in S3, so shared
+    # objects are only deleted once no Event points at them any more
+    key = models.CharField(max_length=255, unique=True)
+    variants = models.JSONField(default=dict, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.ref_count} refs)"
+
+
+class PendingDeletion(models.Model):
+    # S3 objects waiting to be removed in batches by drain_s3_deletions
+    key = models.CharField(max_length=255, unique=True)
+    # Image the key belongs to; the deletion is dropped if it is reused
+    source_key = models.CharField(max_length=255, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.CharField(max_length=255, blank=True)
+    # Set while a drain is deleting the key from S3, outside any transaction
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
+
+
+class ImportCheckpoint(models.Model):
+    # Rows consumed by a resumable import_events run, updated in the same
+    # transaction as each batch so it never disagrees with what committed
+    name = models.CharField(max_length=255, unique=True)
+    position = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} (row {self.position})"
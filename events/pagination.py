@@ -0,0 +1,192 @@
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlencode
+
+
+class KeysetPage:
+    def __init__(self, object_list, number, has_next, has_previous,
+                 next_cursor=None, previous_cursor=None, page_range=(), page_links=()):
+        self.object_list = object_list
+        self.number = number
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        # Windowed page numbers around the current page; never the full range
+        self.page_range = page_range
+        # (number, query string) for each of page_range; None for this page
+        self.page_links = page_links
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __repr__(self):
+        return f'<KeysetPage {self.number}>'
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """
+    Paginates a queryset on the unique ``(date, id)`` key without COUNT(*).
+
+    Next/previous links carry opaque signed cursors (``?after=`` /
+    ``?before=``) so every page costs one index range scan however deep it
+    is. The numbered links around the current page are cursors too, which
+    skip at most ``window - 1`` pages past their anchor row. ``?page=N`` is
+    only honoured within the first window and clamped beyond it, so no
+    request can ask for an OFFSET that grows with the page number.
+    """
+    cursor_salt = 'events.pagination.cursor'
+    # Ascending sort key; the second field must be the primary key
+    key_fields = ('date', 'id')
+
+    def __init__(self, queryset, per_page, window=2):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.window = window
+
+    def get_page(self, params):
+        queryset, build = self.page_query(params)
+        return build(list(queryset))
+
+    async def aget_page(self, params):
+        """``get_page()`` for async views, fetching rows with the async ORM."""
+        queryset, build = self.page_query(params)
+        return build([row async for row in queryset])
+
+    def page_query(self, params):
+        """
+        Return ``(queryset, build)`` for the page ``params`` select, where
+        ``build(rows)`` turns the rows of ``queryset`` into the page.
+        """
+        # Like Paginator.get_page(): bad input falls back to the first page
+        try:
+            if params.get('after'):
+                return self._after_query(params['after'])
+            if params.get('before'):
+                return self._before_query(params['before'])
+        except (signing.BadSignature, ValueError, TypeError):
+            return self._number_query(1)
+        try:
+            number = int(params.get('page') or 1)
+        except (TypeError, ValueError):
+            number = 1
+        return self._number_query(number)
+
+    def page(self, number):
+        queryset, build = self._number_query(number)
+        return build(list(queryset))
+
+    def _number_query(self, number):
+        number = min(max(number, 1), self.window + 1)
+        offset = (number - 1) * self.per_page
+        queryset = self._ascending()[offset:offset + self._lookahead()]
+        return queryset, lambda rows: self._forward_page(rows, number, has_previous=number > 1)
+
+    def _after_query(self, cursor):
+        value, pk, number, skip = self.decode_cursor(cursor)
+        field, pk_field = self.key_fields
+        queryset = self._ascending().filter(
+            Q(**{f'{field}__gt': value}) | Q(**{field: value, f'{pk_field}__gt': pk})
+        )
+        offset = skip * self.per_page
+        return (
+            queryset[offset:offset + self._lookahead()],
+            lambda rows: self._forward_page(rows, number + 1 + skip, has_previous=True),
+        )
+
+    def _before_query(self, cursor):
+        value, pk, number, skip = self.decode_cursor(cursor)
+        field, pk_field = self.key_fields
+        queryset = self.queryset.filter(
+            Q(**{f'{field}__lt': value}) | Q(**{field: value, f'{pk_field}__lt': pk})
+        )
+
+        def build(rows):
+            has_previous = len(rows) > self.per_page
+            object_list = rows[:self.per_page][::-1]
+            return self._build_page(object_list, max(number - 1 - skip, 1), has_next=True,
+                                    has_previous=has_previous, pages_ahead=min(skip + 1, self.window))
+
+        offset = skip * self.per_page
+        return queryset.order_by(f'-{field}', f'-{pk_field}')[offset:offset + self.per_page + 1], build
+
+    def encode_cursor(self, obj, number, skip=0):
+        # ``skip`` whole pages are passed over beyond the anchor row
+        value, pk = _row_key(obj, self.key_fields)
+        payload = [self.dump_key(value), pk, number]
+        if skip:
+            payload.append(skip)
+        return signing.dumps(payload, salt=self.cursor_salt)
+
+    def decode_cursor(self, cursor):
+        value, pk, number, *rest = signing.loads(cursor, salt=self.cursor_salt)
+        skip = int(rest[0]) if rest else 0
+        if not 0 <= skip < max(self.window, 1):
+            raise ValueError('Invalid cursor skip')
+        return self.load_key(value), int(pk), int(number), skip
+
+    def dump_key(self, date):
+        return date.isoformat()
+
+    def load_key(self, value):
+        date = parse_datetime(value)
+        if date is None:
+            raise ValueError('Invalid cursor date')
+        return date
+
+    def _ascending(self):
+        return self.queryset.order_by(*self.key_fields)
+
+    def _lookahead(self):
+        # Enough extra rows to know how many pages of the window follow
+        return self.per_page * (self.window + 1) + 1
+
+    def _forward_page(self, rows, number, has_previous):
+        object_list = rows[:self.per_page]
+        remaining = len(rows) - len(object_list)
+        pages_ahead = min(-(-remaining // self.per_page), self.window)
+        return self._build_page(object_list, number, has_next=remaining > 0,
+                                has_previous=has_previous, pages_ahead=pages_ahead)
+
+    def _build_page(self, object_list, number, has_next, has_previous, pages_ahead):
+        next_cursor = previous_cursor = None
+        if object_list and has_next:
+            next_cursor = self.encode_cursor(object_list[-1], number)
+        if object_list and has_previous:
+            previous_cursor = self.encode_cursor(object_list[0], number)
+        page_range = range(max(number - self.window, 1), number + pages_ahead + 1)
+        return KeysetPage(
+            object_list, number, has_next, has_previous,
+            next_cursor=next_cursor, previous_cursor=previous_cursor,
+            page_range=page_range, page_links=self._page_links(object_list, number, page_range),
+        )
+
+    def _page_links(self, object_list, number, page_range):
+        # Anchored on this page's first or last row, so a link to a nearby
+        # page costs the same however deep this page is
+        links = []
+        for num in page_range:
+            if num == number:
+                links.append((num, None))
+            elif not object_list:
+                links.append((num, urlencode({'page': num})))
+            elif num < number:
+                links.append((num, urlencode({'before': self.encode_cursor(object_list[0], number, number - num - 1)})))
+            else:
+                links.append((num, urlencode({'after': self.encode_cursor(object_list[-1], number, num - number - 1)})))
+        return links
+
+
+def _row_key(obj, key_fields):
+    # Works for model instances as well as .values() dicts
+    if isinstance(obj, dict):
+        return tuple(obj[field] for field in key_fields)
+    return tuple(getattr(obj, field) for field in key_fields)
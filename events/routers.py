@@ -0,0 +1,103 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Set for EVENTS_REPLICA_PIN_SECONDS after a request writes to the primary
+PIN_COOKIE = 'events_primary'
+
+
+class RoutingState:
+    def __init__(self):
+        self.use_replica = False
+        self.wrote = False
+
+
+# Routing state of the request being handled; None outside of requests, so
+# management commands and background tasks always use the primary
+_current = ContextVar('events_routing_state', default=None)
+
+
+def mark_written():
+    """
+    Record a write the router never saw, such as a raw SQL statement that
+    changed rows, so the client is pinned to the primary.
+    """
+    state = _current.get()
+    if state is not None:
+        state.wrote = True
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads of the events app to a random EVENTS_DATABASE_REPLICAS alias
+    while ReplicaRoutingMiddleware allows it, and everything else to the
+    primary. Sessions and users always come from the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state and state.use_replica and model._meta.app_label == 'events' and settings.EVENTS_DATABASE_REPLICAS:
+            return random.choice(settings.EVENTS_DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state and model._meta.app_label == 'events':
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets EVENTS_REPLICA_VIEWS read from the replicas, unless this client
+    wrote to the primary in the last EVENTS_REPLICA_PIN_SECONDS (replicas
+    may not have caught up with its RSVP or edit yet). The pin is a cookie,
+    so checking it costs no session lookup.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _current.set(state)
+        try:
+            return self.finish(state, self.get_response(request))
+        finally:
+            _current.reset(token)
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _current.set(state)
+        try:
+            return self.finish(state, await self.get_response(request))
+        finally:
+            _current.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _current.get()
+        if state is not None:
+            state.use_replica = (
+                request.resolver_match.view_name in settings.EVENTS_REPLICA_VIEWS
+                and PIN_COOKIE not in request.COOKIES
+            )
+
+    def finish(self, state, response):
+        if state.wrote and settings.EVENTS_DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.EVENTS_REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
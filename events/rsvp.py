@@ -0,0 +1,209 @@
+from django.db import connection, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .cache import bump_events_version
+from .models import Event, RSVP
+from .routers import mark_written
+
+
+def _user_rsvps(user, event_ids):
+    return RSVP.objects.filter(user=user, event_id__in=event_ids).values_list('event_id', 'status')
+
+
+def _rsvp_memo(request):
+    return request.__dict__.setdefault('_rsvp_memo', {'checked': set(), 'statuses': {}})
+
+
+def _going(statuses):
+    return {pk for pk, status in statuses.items() if status == RSVP.Status.GOING}
+
+
+def rsvp_statuses(request, event_ids):
+    """
+    Return ``{event_id: status}`` for the current user's RSVPs among ``event_ids``.
+
+    All unseen ids are resolved with one query and remembered on the request,
+    so repeated lookups while rendering a page never hit the database again.
+    """
+    if not request.user.is_authenticated:
+        return {}
+
+    event_ids = set(event_ids)
+    memo = _rsvp_memo(request)
+    missing = event_ids - memo['checked']
+    if missing:
+        memo['statuses'].update(_user_rsvps(request.user, missing))
+        memo['checked'].update(missing)
+    return {pk: status for pk, status in memo['statuses'].items() if pk in event_ids}
+
+
+async def arsvp_statuses(request, event_ids):
+    """``rsvp_statuses()`` for async views; ``request.user`` must already be loaded."""
+    if not request.user.is_authenticated:
+        return {}
+
+    event_ids = set(event_ids)
+    memo = _rsvp_memo(request)
+    missing = event_ids - memo['checked']
+    if missing:
+        memo['statuses'].update([row async for row in _user_rsvps(request.user, missing)])
+        memo['checked'].update(missing)
+    return {pk: status for pk, status in memo['statuses'].items() if pk in event_ids}
+
+
+def rsvped_event_ids(request, event_ids):
+    """Return the subset of ``event_ids`` the current user is attending."""
+    return _going(rsvp_statuses(request, event_ids))
+
+
+async def arsvped_event_ids(request, event_ids):
+    return _going(await arsvp_statuses(request, event_ids))
+
+
+def _execute_write(sql, params):
+    # Raw statements bypass the router, so report the write to it by hand
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        if cursor.rowcount:
+            mark_written()
+        return cursor.rowcount
+
+
+def _delete_rsvp(user_id, event_id, status):
+    # A single DELETE whose rowcount says whether the RSVP existed
+    qn = connection.ops.quote_name
+    return _execute_write(
+        f'DELETE FROM {qn(RSVP._meta.db_table)} '
+        f'WHERE {qn("user_id")} = %s AND {qn("event_id")} = %s AND {qn("status")} = %s',
+        [user_id, event_id, status],
+    )
+
+
+def _insert_rsvp(user_id, event_id, timestamp, status):
+    # INSERT ... SELECT only inserts when the event exists, and ON CONFLICT
+    # turns a concurrent duplicate into a no-op instead of an IntegrityError
+    qn = connection.ops.quote_name
+    return _execute_write(
+        f'INSERT INTO {qn(RSVP._meta.db_table)} '
+        f'({qn("user_id")}, {qn("event_id")}, {qn("status")}, {qn("timestamp")}) '
+        f'SELECT %s, {qn("id")}, %s, %s FROM {qn(Event._meta.db_table)} WHERE {qn("id")} = %s '
+        f'ON CONFLICT ({qn("user_id")}, {qn("event_id")}) DO NOTHING',
+        [user_id, status, connection.ops.adapt_datetimefield_value(timestamp), event_id],
+    )
+
+
+def _adjust_attendee_count(event_id, delta):
+    if delta > 0:
+        new_count = F('attendee_count') + delta
+    else:
+        new_count = Greatest(F('attendee_count') + delta, Value(0))
+    if delta:
+        Event.objects.filter(pk=event_id).update(attendee_count=new_count, updated_at=timezone.now())
+    # Raw SQL sends no signals, so drop the cached listing pages by hand
+    transaction.on_commit(bump_events_version)
+
+
+def _claim_seat(event_id):
+    # Compare-and-swap on the counter: it only moves while a seat is free,
+    # so concurrent admissions can never overbook
+    return Event.objects.filter(pk=event_id).filter(
+        Q(capacity__isnull=True) | Q(attendee_count__lt=F('capacity'))
+    ).update(attendee_count=F('attendee_count') + 1, updated_at=timezone.now())
+
+
+def _lock_event(event_id):
+    # Row lock on PostgreSQL; SQLite ignores it, but there the earlier write
+    # in the same transaction already holds the database write lock
+    return (
+        Event.objects.select_for_update(no_key=True)
+        .filter(pk=event_id)
+        .values('capacity', 'attendee_count')
+        .first()
+    )
+
+
+def _promote_waitlisted(event_id, seats):
+    # Oldest waitlisted RSVPs first; SKIP LOCKED lets concurrent promotions
+    # on PostgreSQL pick different rows instead of queueing on the same one
+    head = list(
+        RSVP.objects.select_for_update(skip_locked=True)
+        .filter(event_id=event_id, status=RSVP.Status.WAITLISTED)
+        .order_by('timestamp', 'id')
+        .values_list('pk', flat=True)[:seats]
+    )
+    if not head:
+        return 0
+    return RSVP.objects.filter(pk__in=head, status=RSVP.Status.WAITLISTED).update(status=RSVP.Status.GOING)
+
+
+def _release_seat(event_id):
+    # Hand the seat to the head of the waitlist, or give it back to the counter
+    event = _lock_event(event_id)
+    promoted = 0
+    if event is not None and event['capacity'] is not None:
+        # The counter still includes the seat being released
+        seats = event['capacity'] - event['attendee_count'] + 1
+        if seats > 0:
+            promoted = _promote_waitlisted(event_id, seats)
+    _adjust_attendee_count(event_id, promoted - 1)
+
+
+def fill_waitlist(event_id):
+    """
+    Promote waitlisted RSVPs into any free seats, oldest first, e.g. after an
+    event's capacity was raised or removed. Returns the number promoted.
+    """
+    with transaction.atomic():
+        event = _lock_event(event_id)
+        if event is None:
+            return 0
+        if event['capacity'] is None:
+            seats = None
+        else:
+            seats = event['capacity'] - event['attendee_count']
+        promoted = _promote_waitlisted(event_id, seats) if seats is None or seats > 0 else 0
+        if promoted:
+            _adjust_attendee_count(event_id, promoted)
+        return promoted
+
+
+def set_rsvp(user, event_id, attend=None):
+    """
+    Attend (``attend=True``), cancel (``False``) or toggle (``None``) a user's
+    RSVP and return the resulting ``RSVP.Status``, or ``None`` without one.
+
+    Every step is a single conditional statement, so concurrent submits can
+    neither raise IntegrityError, overbook a capacity-limited event nor leave
+    the attendee counter out of step. Cancelling an attending RSVP promotes
+    the earliest waitlisted user in the same transaction.
+    Raises ``Event.DoesNotExist`` for an unknown event.
+    """
+    with transaction.atomic():
+        if attend is not True:
+            if _delete_rsvp(user.pk, event_id, RSVP.Status.GOING):
+                _release_seat(event_id)
+                return None
+            if _delete_rsvp(user.pk, event_id, RSVP.Status.WAITLISTED):
+                return None
+
+        # New RSVPs start on the waitlist and move up only if they win a seat
+        if attend is not False and _insert_rsvp(user.pk, event_id, timezone.now(), RSVP.Status.WAITLISTED):
+            admitted = _claim_seat(event_id)
+            if not admitted and connection.features.has_select_for_update:
+                # A cancellation that ran before this RSVP was visible may have
+                # freed a seat without promoting it; retry behind the row lock
+                _lock_event(event_id)
+                admitted = _claim_seat(event_id)
+            if not admitted:
+                return RSVP.Status.WAITLISTED
+            RSVP.objects.filter(user=user, event_id=event_id).update(status=RSVP.Status.GOING)
+            transaction.on_commit(bump_events_version)
+            return RSVP.Status.GOING
+
+        # Nothing changed: either the state already matched or there is no event
+        status = RSVP.objects.filter(user=user, event_id=event_id).values_list('status', flat=True).first()
+        if status is None and not Event.objects.filter(pk=event_id).exists():
+            raise Event.DoesNotExist
+        return status
@@ -0,0 +1,133 @@
+import re
+
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+
+from .pagination import KeysetPaginator
+
+SEARCH_CONFIG = 'english'
+
+# Keep events_event_fts in step with events_event. They are also created by
+# migration 0011, but SQLite drops them whenever a migration rebuilds the
+# events_event table, so post_migrate puts back any that are missing.
+SQLITE_FTS_TRIGGERS = {
+    'events_event_fts_insert': """
+        CREATE TRIGGER events_event_fts_insert AFTER INSERT ON events_event BEGIN
+            INSERT INTO events_event_fts(rowid, title, description, location)
+            VALUES (new.id, new.title, new.description, new.location);
+        END""",
+    'events_event_fts_delete': """
+        CREATE TRIGGER events_event_fts_delete AFTER DELETE ON events_event BEGIN
+            INSERT INTO events_event_fts(events_event_fts, rowid, title, description, location)
+            VALUES ('delete', old.id, old.title, old.description, old.location);
+        END""",
+    'events_event_fts_update': """
+        CREATE TRIGGER events_event_fts_update AFTER UPDATE OF title, description, location ON events_event BEGIN
+            INSERT INTO events_event_fts(events_event_fts, rowid, title, description, location)
+            VALUES ('delete', old.id, old.title, old.description, old.location);
+            INSERT INTO events_event_fts(rowid, title, description, location)
+            VALUES (new.id, new.title, new.description, new.location);
+        END""",
+}
+
+
+def repair_sqlite_search_index(connection):
+    """
+    Recreate missing FTS5 sync triggers and rebuild the index from
+    events_event, since rows may have changed while they were gone.
+    Returns whether anything had to be repaired.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT type, name FROM sqlite_master WHERE name LIKE 'events_event_fts%'")
+        existing = {name for _, name in cursor.fetchall()}
+        if 'events_event_fts' not in existing:
+            return False
+        missing = [name for name in SQLITE_FTS_TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(SQLITE_FTS_TRIGGERS[name])
+        if missing:
+            cursor.execute("INSERT INTO events_event_fts(events_event_fts) VALUES('rebuild')")
+    return bool(missing)
+
+
+def search_vector():
+    # Must match the GIN expression index created in migration 0011
+    from django.contrib.postgres.search import SearchVector
+
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('location', weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def fts5_query(text):
+    # Quote every word so user input can never be read as FTS5 syntax; the
+    # last word is a prefix match so partially typed queries still hit
+    terms = re.findall(r'\w+', text)
+    if not terms:
+        return ''
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+
+def tsquery(text):
+    # fts5_query() for PostgreSQL: every word must match and the last one is
+    # a prefix; \w+ words in quotes can never be read as tsquery syntax
+    terms = re.findall(r'\w+', text)
+    if not terms:
+        return ''
+    return ' & '.join(f"'{term}'" for term in terms) + ':*'
+
+
+def search_events(events, text):
+    """
+    Filter ``events`` to those matching ``text`` in title, description or
+    location, annotated with ``rank`` where lower ranks are better matches.
+    """
+    if connection.vendor == 'sqlite':
+        query = fts5_query(text)
+        if not query:
+            return events.none().annotate(rank=Value(0.0, output_field=FloatField()))
+        return events.filter(search_index__document__match=query).annotate(rank=F('search_index__rank'))
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        raw = tsquery(text)
+        if not raw:
+            return events.none().annotate(rank=Value(0.0, output_field=FloatField()))
+        query = SearchQuery(raw, config=SEARCH_CONFIG, search_type='raw')
+        return (
+            events.annotate(search=search_vector())
+            .filter(search=query)
+            # Negated so that, as with bm25, lower ranks sort first
+            .annotate(rank=-SearchRank(F('search'), query))
+        )
+
+    # Other databases have no full-text index: fall back to a scan
+    return events.filter(
+        Q(title__icontains=text) | Q(description__icontains=text) | Q(location__icontains=text)
+    ).annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+class RankedPaginator(KeysetPaginator):
+    """
+    Keyset pagination over ``search_events()`` results by ``(rank, id)``.
+
+    Pages are only reachable through cursors, so no page ever costs an
+    OFFSET scan over the better-ranked results.
+    """
+    cursor_salt = 'events.search.cursor'
+    key_fields = ('rank', 'id')
+
+    def __init__(self, queryset, per_page):
+        super().__init__(queryset, per_page, window=0)
+
+    def _number_query(self, number):
+        return super()._number_query(1)
+
+    def dump_key(self, rank):
+        return rank
+
+    def load_key(self, value):
+        return float(value)
@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .auth import user_cache_key
+from .cache import bump_events_version
+from .geo import encode_geohash
+from .search import repair_sqlite_search_index
+from .models import Event, RSVP
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=RSVP)
+@receiver(post_delete, sender=RSVP)
+def invalidate_event_pages(sender, using, **kwargs):
+    # Bumping before COMMIT would let a concurrent request cache the old rows
+    # under the new version
+    transaction.on_commit(bump_events_version, using=using)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    cache.delete(user_cache_key(instance.pk))
+
+
+@receiver(pre_save, sender=Event)
+def sync_geohash(sender, instance, **kwargs):
+    if instance.latitude is None or instance.longitude is None:
+        instance.geohash = ''
+    else:
+        instance.geohash = encode_geohash(instance.latitude, instance.longitude)
+
+
+def repair_search_index(sender, using, **kwargs):
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        repair_sqlite_search_index(connection)
@@ -0,0 +1,203 @@
+import base64
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+
+try:
+    import brotli
+except ImportError:  # .br copies are skipped without the Brotli package
+    brotli = None
+
+# Third-party assets served from events/static/events/vendor/, fetched and
+# checked against their Subresource Integrity hashes by `manage.py
+# vendor_assets`: (URL, path under vendor/, SRI hash)
+VENDOR_ASSETS = (
+    (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css',
+        'bootstrap/css/bootstrap.min.css',
+        'sha384-QWTKZyjpPEjISv5WaRU9OFeRpok6YctnYmDr5pNlyT2bRjXh0JMhjY6hW+ALEwIH',
+    ),
+    (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js',
+        'bootstrap/js/bootstrap.bundle.min.js',
+        'sha384-YvpcrYf0tY3lHB60NNkmXc5s9fDVZLESaAA55NDzOxhy9GkcIdslK1eN7N6jIeHz',
+    ),
+)
+
+VENDOR_ROOT = Path(__file__).resolve().parent / 'static' / 'events' / 'vendor'
+
+# The .map files are not vendored, and ManifestStaticFilesStorage fails on
+# references to files it cannot find
+SOURCE_MAP_COMMENT = re.compile(rb'\n?(/\*# sourceMappingURL=[^*]*\*/|//# sourceMappingURL=\S*)\s*$')
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.json', '.map', '.svg', '.txt', '.xml', '.html', '.ico')
+# Smaller files gain little and cost a second lookup on every request
+COMPRESS_MIN_SIZE = 256
+
+# (Content-Encoding, file suffix) in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+BLOCK_SIZE = 64 * 1024
+
+
+def sri_hash(data):
+    return 'sha384-' + base64.b64encode(hashlib.sha384(data).digest()).decode()
+
+
+def strip_source_map(data):
+    return SOURCE_MAP_COMMENT.sub(b'\n', data)
+
+
+def compress(data):
+    """Return ``{suffix: bytes}`` of the encodings that make ``data`` smaller."""
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return {suffix: compressed for suffix, compressed in variants.items() if len(compressed) < len(data)}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also writes a gzip (and, with Brotli
+    installed, a brotli) copy of every text asset at collectstatic time,
+    next to both its hashed and its original name.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in paths:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            for path in {name, self.hashed_files.get(self.hash_key(self.clean_name(name)), name)}:
+                self.write_compressed(path)
+
+    def write_compressed(self, path):
+        with self.open(path) as f:
+            data = f.read()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return
+        for suffix, compressed in compress(data).items():
+            if self.exists(path + suffix):
+                self.delete(path + suffix)
+            self._save(path + suffix, ContentFile(compressed))
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for coding in header.split(','):
+        name, _, params = coding.partition(';')
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        try:
+            if match and float(match.group(1)) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def read_blocks(path):
+    with open(path, 'rb') as f:
+        while block := f.read(BLOCK_SIZE):
+            yield block
+
+
+class PrecompressedStaticFiles:
+    """
+    WSGI middleware serving STATIC_URL from STATIC_ROOT before Django sees
+    the request, picking the .br or .gz copy the client accepts. Files
+    named in the collectstatic manifest are content-hashed, so they are
+    cached as immutable; anything else gets EVENTS_STATIC_MAX_AGE. Missing
+    files, and direct requests for the .br/.gz copies, fall through to the
+    wrapped application.
+    """
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = str(root or settings.STATIC_ROOT)
+        self.prefix = prefix or settings.STATIC_URL
+        self.hashed_names = self.load_hashed_names()
+
+    def load_hashed_names(self):
+        try:
+            with open(os.path.join(self.root, ManifestStaticFilesStorage.manifest_name), encoding='utf-8') as f:
+                return set(json.load(f).get('paths', {}).values())
+        except (OSError, ValueError):
+            return set()
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if environ['REQUEST_METHOD'] in ('GET', 'HEAD') and path.startswith(self.prefix):
+            response = self.serve(environ, start_response, path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.application(environ, start_response)
+
+    def find(self, name):
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        return path if os.path.isfile(path) else None
+
+    def is_compressed_copy(self, name):
+        # app.css.gz on its own would be sent as opaque bytes without a
+        # Content-Encoding; it is only served in place of app.css
+        return any(name.endswith(suffix) and self.find(name[:-len(suffix)]) for _, suffix in ENCODINGS)
+
+    def serve(self, environ, start_response, name):
+        path = self.find(name)
+        if path is None or self.is_compressed_copy(name):
+            return None
+
+        headers = []
+        served = path
+        variants = [(encoding, path + suffix) for encoding, suffix in ENCODINGS if os.path.isfile(path + suffix)]
+        if variants:
+            headers.append(('Vary', 'Accept-Encoding'))
+            accepted = accepted_encodings(environ.get('HTTP_ACCEPT_ENCODING', ''))
+            for encoding, variant in variants:
+                if encoding in accepted:
+                    headers.append(('Content-Encoding', encoding))
+                    served = variant
+                    break
+
+        stat = os.stat(served)
+        max_age = settings.EVENTS_STATIC_MAX_AGE
+        headers.append((
+            'Cache-Control', IMMUTABLE_CACHE_CONTROL if name in self.hashed_names else f'public, max-age={max_age}',
+        ))
+        headers.append(('Last-Modified', http_date(stat.st_mtime)))
+
+        since = parse_http_date_safe(environ.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if since is not None and int(stat.st_mtime) <= since:
+            start_response('304 Not Modified', headers)
+            return []
+
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if content_type.startswith('text/'):
+            content_type += '; charset=utf-8'
+        headers.append(('Content-Type', content_type))
+        headers.append(('Content-Length', str(stat.st_size)))
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper:
+            return file_wrapper(open(served, 'rb'), BLOCK_SIZE)
+        return read_blocks(served)
@@ -0,0 +1,184 @@
+import hashlib
+import logging
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .cache import bump_events_version
+from .images import build_derivatives
+from .models import Event, StoredImage
+from .utils import (
+    acquire_image, content_key, delete_image_from_s3, enqueue_s3_deletion, head_s3_object, iter_s3_object,
+    reserve_image, s3_key_from_url, s3_object_sha256, s3_url_for_key, upload_bytes_to_s3, upload_image_to_s3,
+)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.EVENTS_TASK_WORKERS,
+                    thread_name_prefix='events-task',
+                )
+    return _executor
+
+
+def _run_task(func, args, kwargs, close_connections):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed', func.__name__)
+    finally:
+        if close_connections:
+            close_old_connections()
+
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Run ``func`` on the in-process worker pool.
+
+    With ``EVENTS_TASK_BACKEND = 'sync'`` the task runs inline instead, which
+    keeps tests and management commands deterministic.
+    """
+    if settings.EVENTS_TASK_BACKEND == 'sync':
+        _run_task(func, args, kwargs, close_connections=False)
+    else:
+        _get_executor().submit(_run_task, func, args, kwargs, True)
+
+
+def spool_chunks(chunks, name):
+    buffer = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+        buffer.write(chunk)
+    buffer.seek(0)
+    spooled = File(buffer, name=name)
+    spooled.sha256 = digest.hexdigest()
+    return spooled
+
+
+def spool_upload(uploaded_file):
+    # The request's upload is closed once the response is sent, so copy it
+    # somewhere the worker can still read from, hashing it on the way
+    return spool_chunks(uploaded_file.chunks(), uploaded_file.name)
+
+
+def upload_image_derivatives(image_file, stem=None, folder="media/events/derivatives"):
+    # Returns {"webp": {"360": url, ...}, "jpg": {...}} for Event.image_variants
+    stem = stem or uuid.uuid4()
+    variants = {}
+    for width, extension, content_type, data in build_derivatives(image_file, settings.EVENTS_IMAGE_WIDTHS):
+        key = f"{folder}/{stem}_{width}w.{extension}"
+        variants.setdefault(extension, {})[str(width)] = upload_bytes_to_s3(data, key, content_type)
+    return variants
+
+
+def upload_event_image(event_id, image_file):
+    digest = getattr(image_file, 'sha256', None)
+    try:
+        s3_url = upload_image_to_s3(image_file, digest=digest)
+    except Exception:
+        logger.exception('Uploading the image for event %s failed', event_id)
+        Event.objects.filter(pk=event_id).update(
+            image_status=Event.ImageStatus.FAILED, updated_at=timezone.now(),
+        )
+        image_file.close()
+        return
+
+    # Identical content was uploaded before: reuse its derivatives as well
+    stored = StoredImage.objects.filter(key=s3_key_from_url(s3_url)).first()
+    variants = stored.variants if stored else {}
+    if not variants:
+        # The original is usable on its own, so a derivative failure is not fatal
+        try:
+            variants = upload_image_derivatives(image_file, stem=digest)
+        except Exception:
+            logger.exception('Building image derivatives for event %s failed', event_id)
+        if stored and variants:
+            StoredImage.objects.filter(pk=stored.pk).update(variants=variants)
+    image_file.close()
+    # upload_image_to_s3() already took this event's reference
+    attach_event_image(event_id, s3_url, variants, reserved=True)
+
+
+def attach_event_image(event_id, s3_url, variants, reserved=False):
+    # ``reserved``: the caller already holds the reference for this event.
+    # The row lock keeps a concurrent upload to the same event from
+    # releasing the same previous image twice
+    with transaction.atomic():
+        event = Event.objects.select_for_update().filter(pk=event_id).values('image').first()
+        if not reserved:
+            acquire_image(s3_url, variants)
+        if event is None:
+            # The event was deleted while the upload was running; dropping the
+            # reference queues the objects unless another event uses them
+            delete_image_from_s3(s3_url)
+            return
+        previous = event['image']
+        Event.objects.filter(pk=event_id).update(
+            image=s3_url, image_variants=variants, image_status=Event.ImageStatus.READY,
+            updated_at=timezone.now(),
+        )
+        # Re-uploading the current image leaves it with a single reference
+        if previous:
+            delete_image_from_s3(previous)
+
+    # update() sends no signals, so drop the cached listing pages by hand
+    bump_events_version()
+
+
+def reuse_stored_image(event_id, key):
+    # Attach content stored before, derivatives included, without reading it
+    stored = StoredImage.objects.filter(key=key).first()
+    if not (stored and stored.variants):
+        return False
+    s3_url = s3_url_for_key(key)
+    stored, revived = reserve_image(s3_url)
+    if revived or not stored.variants:
+        # It was queued for deletion after all: give the reference back and
+        # upload the staged copy instead
+        delete_image_from_s3(s3_url)
+        return False
+    attach_event_image(event_id, s3_url, stored.variants, reserved=True)
+    return True
+
+
+def process_direct_upload(event_id, key):
+    # Move a browser upload from its staging key to content-addressed storage.
+    # When S3 verified a SHA-256 checksum on upload and that content is stored
+    # already, nothing is read. New content is still downloaded once, on a
+    # worker thread of the app process, to verify it and build derivatives.
+    try:
+        digest = s3_object_sha256(head_s3_object(key))
+        if digest and reuse_stored_image(event_id, content_key(digest, key)):
+            enqueue_s3_deletion([key])
+            return
+        image_file = spool_chunks(iter_s3_object(key), key.rsplit('/', 1)[-1])
+        with Image.open(image_file) as image:
+            image.verify()
+    except Exception:
+        logger.exception('Processing the direct upload %s for event %s failed', key, event_id)
+        Event.objects.filter(pk=event_id).update(
+            image_status=Event.ImageStatus.FAILED, updated_at=timezone.now(),
+        )
+        # Nothing refers to the staging copy any more
+        enqueue_s3_deletion([key])
+        return
+
+    upload_event_image(event_id, image_file)
+    enqueue_s3_deletion([key])
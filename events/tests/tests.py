@@ -1,16 +1,47 @@
 from datetime import datetime, timedelta
+import csv
+import gzip
+import hashlib
 import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from unittest import skipUnless
 from unittest.mock import patch
+from asgiref.sync import async_to_sync, sync_to_async
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.staticfiles import finders
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, connections, router, transaction
+from django.conf import settings
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 
-from events.models import Event, RSVP
+from config import settings_asgi
+from events.models import Event, ImportCheckpoint, PendingDeletion, RSVP, StoredImage
+from events.auth import CachedModelBackend
+from events.images import build_derivatives
+from events.imports import import_events
+from events.management.commands.import_events import Command as ImportCommand
+from events.pagination import KeysetPaginator
+from events.rsvp import rsvped_event_ids, set_rsvp
+from events.search import repair_sqlite_search_index
+from events.fakes import FakeS3Client
+from events import benchmarks, checks, exports, geo, ics, metrics, routers, staticfiles, tasks, utils
 
 
 class RegisterViewTest(TestCase):
@@ -137,16 +168,20 @@ class LogoutViewTest(TestCase):
 class HomeViewTest(TestCase):
 
     def setUp(self):
+        cache.clear()
+
         # Create a user for the 'created_by' field
         user = User.objects.create_user(username='testuser', password='password123')
 
-        # Create sample events for testing with the 'created_by' user
-        Event.objects.create(title='Event 1', date='2025-04-01', description='Description of event 1', created_by=user)
-        Event.objects.create(title='Event 2', date='2025-04-02', description='Description of event 2', created_by=user)
-        Event.objects.create(title='Event 3', date='2025-04-03', description='Description of event 3', created_by=user)
-        Event.objects.create(title='Event 4', date='2025-04-04', description='Description of event 4', created_by=user)
-        Event.objects.create(title='Event 5', date='2025-04-05', description='Description of event 5', created_by=user)
-        Event.objects.create(title='Event 6', date='2025-04-06', description='Description of event 6', created_by=user)
+        # Create sample upcoming events for testing with the 'created_by' user
+        start = timezone.now() + timedelta(days=1)
+        for i in range(1, 7):
+            Event.objects.create(
+                title=f'Event {i}',
+                date=start + timedelta(days=i),
+                description=f'Description of event {i}',
+                created_by=user,
+            )
 
     def test_home_view_with_pagination(self):
         # Test the home view with pagination (5 events per page)
@@ -179,6 +214,36 @@ class HomeViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'No upcoming events found.')
 
+    def test_home_view_hides_past_events(self):
+        user = User.objects.get(username='testuser')
+        Event.objects.create(
+            title='Past Event',
+            date=timezone.now() - timedelta(days=1),
+            description='Already happened',
+            created_by=user,
+        )
+        response = self.client.get(reverse('home'))
+        self.assertNotContains(response, 'Past Event')
+        self.assertContains(response, 'Event 1')
+
+    def test_home_view_include_past(self):
+        user = User.objects.get(username='testuser')
+        Event.objects.create(
+            title='Past Event',
+            date=timezone.now() - timedelta(days=1),
+            description='Already happened',
+            created_by=user,
+        )
+        response = self.client.get(reverse('home'), {'include_past': '1'})
+        self.assertContains(response, 'Past Event')
+        self.assertContains(response, 'include_past=1')
+
+    def test_upcoming_query_uses_date_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plan check is SQLite specific')
+        queryset = Event.objects.upcoming().order_by('date', 'id')[:5]
+        self.assertIn('event_date_id_idx', queryset.explain())
+
 
 class EventDetailViewTest(TestCase):
 
@@ -230,6 +295,7 @@ class EventDetailViewTest(TestCase):
         self.assertFalse(response.context['has_rsvped'])  # Check RSVP status is False
 
 
+@override_settings(EVENTS_TASK_BACKEND='sync')
 class CreateEventViewTestCase(TestCase):
     
     def setUp(self):
@@ -239,6 +305,11 @@ class CreateEventViewTestCase(TestCase):
         # URL for the create event page
         self.url = reverse('create_event')
 
+        # Keep any S3 traffic in memory
+        s3_patcher = patch('events.utils.get_s3_client', return_value=FakeS3Client())
+        s3_patcher.start()
+        self.addCleanup(s3_patcher.stop)
+
     def generate_test_image_file(self):
         image = Image.new('RGB', (100, 100), color='red')
         byte_io = io.BytesIO()
@@ -260,9 +331,10 @@ class CreateEventViewTestCase(TestCase):
             'image': image_file
         }
 
-        with patch('events.views.upload_image_to_s3') as mock_upload_image_to_s3:
+        with patch('events.tasks.upload_image_to_s3') as mock_upload_image_to_s3:
             mock_upload_image_to_s3.return_value = 'https://s3.amazonaws.com/fake-bucket/test_image.jpg'
-            response = self.client.post(self.url, event_data)
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(self.url, event_data)
 
             self.assertEqual(response.status_code, 302)
             self.assertRedirects(response, reverse('home'))
@@ -272,6 +344,7 @@ class CreateEventViewTestCase(TestCase):
             self.assertEqual(event.description, 'Test event description')
             self.assertEqual(event.created_by, self.user)
             self.assertEqual(event.image, 'https://s3.amazonaws.com/fake-bucket/test_image.jpg')
+            self.assertEqual(event.image_status, Event.ImageStatus.READY)
 
 
     def test_create_event_invalid_form(self):
@@ -301,6 +374,7 @@ class CreateEventViewTestCase(TestCase):
         self.assertRedirects(response, f'/login/?next={self.url}')
 
 
+@override_settings(EVENTS_TASK_BACKEND='sync')
 class UpdateEventViewTestCase(TestCase):
     def setUp(self):
         # Create a test user and log in
@@ -319,6 +393,11 @@ class UpdateEventViewTestCase(TestCase):
 
         self.url = reverse('update_event', args=[self.event.id])
 
+        # Keep any S3 traffic in memory
+        s3_patcher = patch('events.utils.get_s3_client', return_value=FakeS3Client())
+        s3_patcher.start()
+        self.addCleanup(s3_patcher.stop)
+
     def generate_test_image_file(self):
         image = Image.new('RGB', (100, 100), color='blue')
         byte_io = io.BytesIO()
@@ -337,10 +416,11 @@ class UpdateEventViewTestCase(TestCase):
             'image': updated_image
         }
 
-        with patch('events.views.upload_image_to_s3') as mock_upload_image_to_s3:
+        with patch('events.tasks.upload_image_to_s3') as mock_upload_image_to_s3:
             mock_upload_image_to_s3.return_value = 'https://s3.amazonaws.com/fake-bucket/updated.jpg'
 
-            response = self.client.post(self.url, updated_data)
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(self.url, updated_data)
 
             self.assertEqual(response.status_code, 302)
             self.assertRedirects(response, reverse('event_detail', args=[self.event.id]))
@@ -449,7 +529,2494 @@ class ToggleRSVPViewTestCase(TestCase):
         self.assertRedirects(response, reverse('event_detail', args=[self.event.id]))
         self.assertFalse(RSVP.objects.filter(user=self.user, event=self.event).exists())
 
+    def test_rsvp_toggle_updates_attendee_count(self):
+        self.client.post(self.url)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 1)
+
+        self.client.post(self.url)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 0)
+
     def test_toggle_rsvp_requires_login(self):
         self.client.logout()
         response = self.client.get(self.url)
         self.assertRedirects(response, f'/login/?next={self.url}')
+
+    def test_toggle_rsvp_is_post_only(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 405)
+        self.assertFalse(RSVP.objects.exists())
+
+    def test_toggle_rsvp_unknown_event(self):
+        response = self.client.post(reverse('toggle_rsvp', args=[self.event.id + 100]))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(RSVP.objects.exists())
+
+    def test_explicit_action_is_idempotent(self):
+        self.client.post(self.url, {'action': 'attend'})
+        self.client.post(self.url, {'action': 'attend'})
+        self.event.refresh_from_db()
+        self.assertEqual(RSVP.objects.filter(event=self.event).count(), 1)
+        self.assertEqual(self.event.attendee_count, 1)
+
+        self.client.post(self.url, {'action': 'cancel'})
+        self.client.post(self.url, {'action': 'cancel'})
+        self.event.refresh_from_db()
+        self.assertFalse(RSVP.objects.filter(event=self.event).exists())
+        self.assertEqual(self.event.attendee_count, 0)
+
+    def test_toggle_uses_single_statements(self):
+        def statements(ctx):
+            return [
+                q['sql'].split()[0] for q in ctx.captured_queries
+                if 'SAVEPOINT' not in q['sql']
+            ]
+
+        # Not attending or waitlisted, then insert, claim a seat, mark going
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(set_rsvp(self.user, self.event.id), RSVP.Status.GOING)
+        self.assertEqual(statements(ctx), ['DELETE', 'DELETE', 'INSERT', 'UPDATE', 'UPDATE'])
+
+        # Delete, read the capacity, release the seat
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertIsNone(set_rsvp(self.user, self.event.id))
+        self.assertEqual(statements(ctx), ['DELETE', 'SELECT', 'UPDATE'])
+
+
+class AttendeeCountTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.events = [
+            Event.objects.create(
+                title=f'Counted Event {i}',
+                description='Counter test',
+                location='Test Venue',
+                date=timezone.now() + timedelta(days=i + 1),
+                created_by=self.user,
+            )
+            for i in range(5)
+        ]
+
+    def test_home_query_count_does_not_depend_on_page_size(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('home'))
+
+        Event.objects.filter(pk=self.events[0].pk).delete()
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.client.get(reverse('home'))
+
+    def test_rebuild_attendee_counts_command(self):
+        attendees = [
+            User.objects.create_user(username=f'attendee{i}', password='testpassword')
+            for i in range(3)
+        ]
+        for attendee in attendees:
+            RSVP.objects.create(user=attendee, event=self.events[0])
+        RSVP.objects.create(user=attendees[0], event=self.events[1])
+        Event.objects.filter(pk=self.events[2].pk).update(attendee_count=7)
+
+        out = io.StringIO()
+        call_command('rebuild_attendee_counts', stdout=out)
+
+        counts = dict(Event.objects.values_list('pk', 'attendee_count'))
+        self.assertEqual(counts[self.events[0].pk], 3)
+        self.assertEqual(counts[self.events[1].pk], 1)
+        self.assertEqual(counts[self.events[2].pk], 0)
+        self.assertIn('5 event(s)', out.getvalue())
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='testuser', password='password123')
+        base = timezone.now() + timedelta(days=1)
+        # Pairs of events share a date so the id tie-breaker is exercised
+        self.events = [
+            Event.objects.create(
+                title=f'Paged Event {i:02d}',
+                description='Pagination test',
+                location='Test Venue',
+                date=base + timedelta(days=i // 2),
+                created_by=user,
+            )
+            for i in range(12)
+        ]
+
+    def test_walk_forward_and_back_with_cursors(self):
+        paginator = KeysetPaginator(Event.objects.all(), 5)
+
+        first = paginator.get_page({})
+        second = paginator.get_page({'after': first.next_cursor})
+        third = paginator.get_page({'after': second.next_cursor})
+
+        seen = [e.pk for page in (first, second, third) for e in page]
+        self.assertEqual(seen, [e.pk for e in self.events])
+        self.assertEqual([first.number, second.number, third.number], [1, 2, 3])
+        self.assertFalse(third.has_next)
+        self.assertIsNone(third.next_cursor)
+
+        back = paginator.get_page({'before': third.previous_cursor})
+        self.assertEqual([e.pk for e in back], [e.pk for e in second])
+        self.assertEqual(back.number, 2)
+        self.assertTrue(back.has_previous)
+
+    def test_page_number_mode_matches_cursor_mode(self):
+        paginator = KeysetPaginator(Event.objects.all(), 5)
+        by_number = paginator.get_page({'page': '2'})
+        by_cursor = paginator.get_page({'after': paginator.get_page({}).next_cursor})
+        self.assertEqual([e.pk for e in by_number], [e.pk for e in by_cursor])
+        self.assertEqual(list(by_number.page_range), [1, 2, 3])
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        paginator = KeysetPaginator(Event.objects.all(), 5)
+        page = paginator.get_page({'after': 'not-a-cursor'})
+        self.assertEqual(page.number, 1)
+        self.assertEqual([e.pk for e in page], [e.pk for e in self.events[:5]])
+
+    def _walk_to(self, paginator, number):
+        page = paginator.get_page({})
+        while page.number < number:
+            page = paginator.get_page({'after': page.next_cursor})
+        return page
+
+    def test_page_range_is_windowed(self):
+        paginator = KeysetPaginator(Event.objects.all(), 1, window=2)
+        page = self._walk_to(paginator, 6)
+        self.assertEqual(list(page.page_range), [4, 5, 6, 7, 8])
+
+    def test_page_links_are_cursors_to_the_right_pages(self):
+        paginator = KeysetPaginator(Event.objects.all(), 1, window=2)
+        page = self._walk_to(paginator, 6)
+        self.assertEqual([num for num, link in page.page_links], [4, 5, 6, 7, 8])
+        for num, link in page.page_links:
+            if link is None:
+                self.assertEqual(num, 6)
+                continue
+            self.assertNotIn('page=', link)
+            target = paginator.get_page(QueryDict(link))
+            self.assertEqual(target.number, num)
+            self.assertEqual([e.pk for e in target], [self.events[num - 1].pk])
+
+    def test_page_numbers_beyond_the_first_window_are_clamped(self):
+        paginator = KeysetPaginator(Event.objects.all(), 1, window=2)
+        page = paginator.get_page({'page': '500'})
+        self.assertEqual(page.number, 3)
+        self.assertEqual([e.pk for e in page], [self.events[2].pk])
+
+    def test_rendered_page_links_do_not_use_page_numbers(self):
+        second = self.client.get(reverse('home'), {'after': self.client.get(reverse('home')).context['page_obj'].next_cursor})
+        self.assertNotContains(second, '?page=')
+        self.assertContains(second, '?before=')
+
+    def test_deep_pages_do_not_count_rows(self):
+        first = self.client.get(reverse('home'))
+        cursor = first.context['page_obj'].next_cursor
+        with self.assertNumQueries(1) as ctx:
+            response = self.client.get(reverse('home'), {'after': cursor})
+        self.assertNotIn('COUNT(', ctx.captured_queries[0]['sql'].upper())
+        self.assertContains(response, 'Paged Event 05')
+        self.assertNotContains(response, 'Paged Event 04')
+
+
+class HomePageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.event = Event.objects.create(
+            title='Cached Event',
+            description='Cache test',
+            location='Test Venue',
+            date=timezone.now() + timedelta(days=1),
+            created_by=self.user,
+        )
+
+    def test_repeat_visit_is_served_from_cache(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Cached Event')
+
+    def test_pages_are_cached_separately(self):
+        self.client.get(reverse('home'))
+        response = self.client.get(reverse('home'), {'page': '2'})
+        self.assertNotContains(response, 'Cached Event')
+
+    def test_event_save_invalidates_cached_pages(self):
+        self.client.get(reverse('home'))
+        self.event.title = 'Renamed Event'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.save()
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Renamed Event')
+
+    def test_pages_are_invalidated_only_after_commit(self):
+        self.client.get(reverse('home'))
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.event.title = 'Renamed Event'
+            self.event.save()
+            # Until COMMIT the cached page stays, as other connections see the old row
+            self.assertContains(self.client.get(reverse('home')), 'Cached Event')
+
+        for callback in callbacks:
+            callback()
+        self.assertContains(self.client.get(reverse('home')), 'Renamed Event')
+
+    def test_event_delete_invalidates_cached_pages(self):
+        self.client.get(reverse('home'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.delete()
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'No upcoming events found.')
+
+    def test_rsvp_invalidates_cached_pages(self):
+        self.client.get(reverse('home'))
+        self.client.login(username='testuser', password='testpassword')
+        self.client.post(reverse('toggle_rsvp', args=[self.event.id]))
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, '1 people are attending')
+
+    def test_auth_and_messages_are_not_cached(self):
+        self.client.get(reverse('home'))
+        self.client.login(username='testuser', password='testpassword')
+        response = self.client.get(reverse('logout'), follow=True)
+        self.assertContains(response, 'You have successfully logged out!')
+        self.assertContains(response, 'Cached Event')
+
+        self.client.login(username='testuser', password='testpassword')
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Hello, testuser')
+
+
+class RSVPLookupTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.events = [
+            Event.objects.create(
+                title=f'Lookup Event {i}',
+                description='Lookup test',
+                location='Test Venue',
+                date=timezone.now() + timedelta(days=i + 1),
+                created_by=self.user,
+            )
+            for i in range(5)
+        ]
+        RSVP.objects.create(user=self.user, event=self.events[1])
+        RSVP.objects.create(user=self.user, event=self.events[3])
+
+    def make_request(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        return request
+
+    def test_lookup_is_one_query_and_memoized(self):
+        request = self.make_request(self.user)
+        ids = [event.id for event in self.events]
+
+        with self.assertNumQueries(1):
+            rsvped = rsvped_event_ids(request, ids)
+        self.assertEqual(rsvped, {self.events[1].id, self.events[3].id})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(rsvped_event_ids(request, [self.events[1].id]), {self.events[1].id})
+            self.assertEqual(rsvped_event_ids(request, [self.events[0].id]), set())
+
+    def test_anonymous_user_has_no_rsvps(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(rsvped_event_ids(self.make_request(AnonymousUser()), [1, 2]), set())
+
+    def test_home_shows_attending_badges(self):
+        self.client.login(username='testuser', password='testpassword')
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, "You're attending", count=2)
+        self.assertEqual(
+            response.context['rsvped_event_ids'],
+            {self.events[1].id, self.events[3].id},
+        )
+
+    def test_home_badges_cost_a_single_query(self):
+        self.client.login(username='testuser', password='testpassword')
+        # user (the session comes from the cache), events page, RSVP lookup
+        with self.assertNumQueries(3):
+            self.client.get(reverse('home'))
+
+
+@override_settings(EVENTS_TASK_BACKEND='sync')
+class BackgroundImageUploadTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.s3 = FakeS3Client()
+
+    def generate_test_image_file(self):
+        image = Image.new('RGB', (100, 100), color='green')
+        byte_io = io.BytesIO()
+        image.save(byte_io, 'JPEG')
+        return SimpleUploadedFile('banner.jpg', byte_io.getvalue(), content_type='image/jpeg')
+
+    def post_event(self):
+        return self.client.post(reverse('create_event'), {
+            'title': 'Upload Event',
+            'description': 'Upload test',
+            'location': 'Test location',
+            'date': '2030-05-01 10:30',
+            'image': self.generate_test_image_file(),
+        })
+
+    def test_event_is_saved_pending_before_upload_runs(self):
+        with patch('events.views.run_in_background') as mock_run:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post_event()
+
+        event = Event.objects.get(title='Upload Event')
+        self.assertEqual(event.image_status, Event.ImageStatus.PENDING)
+        self.assertFalse(event.image)
+        mock_run.assert_called_once()
+
+    def test_upload_fills_in_url_through_shared_client(self):
+        with patch('events.utils.get_s3_client', return_value=self.s3):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post_event()
+
+        event = Event.objects.get(title='Upload Event')
+        [key] = [k for k in self.s3.objects if '/derivatives/' not in k]
+        digest = hashlib.sha256(self.s3.objects[key]['Body']).hexdigest()
+        self.assertEqual(key, f'media/events/{digest}.jpg')
+        self.assertEqual(event.image, f'https://{settings.AWS_S3_CUSTOM_DOMAIN}/{key}')
+        self.assertEqual(event.image_status, Event.ImageStatus.READY)
+
+    def test_failed_upload_marks_event(self):
+        with patch('events.utils.get_s3_client', return_value=FakeS3Client(fail_uploads=True)):
+            with self.assertLogs('events.tasks', 'ERROR'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.post_event()
+
+        event = Event.objects.get(title='Upload Event')
+        self.assertEqual(event.image_status, Event.ImageStatus.FAILED)
+        self.assertFalse(event.image)
+
+    def test_update_keeps_current_image_until_upload_completes(self):
+        event = Event.objects.create(
+            title='Existing', description='Existing', location='Here',
+            date=timezone.now() + timedelta(days=1), created_by=self.user,
+            image='https://s3.amazonaws.com/fake-bucket/original.jpg',
+        )
+        with patch('events.views.run_in_background'):
+            self.client.post(reverse('update_event', args=[event.id]), {
+                'title': 'Existing', 'description': 'Existing', 'location': 'Here',
+                'date': '2030-05-01 10:30', 'image': self.generate_test_image_file(),
+            })
+        event.refresh_from_db()
+        self.assertEqual(event.image, 'https://s3.amazonaws.com/fake-bucket/original.jpg')
+        self.assertEqual(event.image_status, Event.ImageStatus.PENDING)
+
+    def test_update_can_clear_the_image(self):
+        with patch('events.utils.get_s3_client', return_value=self.s3):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post_event()
+            event = Event.objects.get(title='Upload Event')
+            image_key = utils.s3_key_from_url(str(event.image))
+
+            self.client.post(reverse('update_event', args=[event.id]), {
+                'title': 'Upload Event', 'description': 'Upload test', 'location': 'Test location',
+                'date': '2030-05-01 10:30', 'image-clear': 'on',
+            })
+
+        event.refresh_from_db()
+        self.assertFalse(event.image)
+        self.assertEqual(event.image_variants, {})
+        self.assertEqual(event.image_status, Event.ImageStatus.NONE)
+        self.assertFalse(StoredImage.objects.exists())
+        self.assertTrue(PendingDeletion.objects.filter(key=image_key).exists())
+
+    def test_s3_client_is_shared(self):
+        with patch.object(utils, '_s3_client', None):
+            self.assertIs(utils.get_s3_client(), utils.get_s3_client())
+
+    def test_thread_backend_runs_tasks_off_the_request_thread(self):
+        done = threading.Event()
+        seen = []
+
+        def task():
+            seen.append(threading.current_thread().name)
+            done.set()
+
+        with override_settings(EVENTS_TASK_BACKEND='thread'):
+            tasks.run_in_background(task)
+        self.assertTrue(done.wait(5))
+        self.assertTrue(seen[0].startswith('events-task'))
+
+
+@override_settings(EVENTS_TASK_BACKEND='sync', EVENTS_IMAGE_WIDTHS=(360, 720, 1440))
+class ImageDerivativeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.s3 = FakeS3Client()
+
+    def make_jpeg(self, size):
+        byte_io = io.BytesIO()
+        Image.new('RGB', size, color='orange').save(byte_io, 'JPEG')
+        byte_io.seek(0)
+        return byte_io
+
+    def test_build_derivatives_sizes_and_formats(self):
+        results = list(build_derivatives(self.make_jpeg((2000, 1000)), (360, 720, 1440)))
+        produced = {(width, extension) for width, extension, _, _ in results}
+        self.assertEqual(produced, {
+            (w, ext) for w in (360, 720, 1440) for ext in ('webp', 'jpg')
+        })
+        for width, extension, content_type, data in results:
+            with Image.open(io.BytesIO(data)) as image:
+                self.assertEqual(image.width, width)
+                self.assertEqual(image.height, width // 2)
+                self.assertEqual(image.get_format_mimetype(), content_type)
+
+    def test_small_images_are_not_upscaled(self):
+        results = list(build_derivatives(self.make_jpeg((100, 50)), (360, 720)))
+        self.assertEqual({width for width, _, _, _ in results}, {100})
+
+    def test_upload_stores_variants_and_renders_srcset(self):
+        upload = SimpleUploadedFile('wide.jpg', self.make_jpeg((1600, 800)).read(), content_type='image/jpeg')
+        with patch('events.utils.get_s3_client', return_value=self.s3):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('create_event'), {
+                    'title': 'Derivative Event',
+                    'description': 'Derivative test',
+                    'location': 'Test location',
+                    'date': '2030-05-01 10:30',
+                    'image': upload,
+                })
+
+        event = Event.objects.get(title='Derivative Event')
+        self.assertEqual(set(event.image_variants), {'webp', 'jpg'})
+        self.assertEqual(set(event.image_variants['webp']), {'360', '720', '1440'})
+        derivative_keys = [k for k in self.s3.objects if '/derivatives/' in k]
+        self.assertEqual(len(derivative_keys), 6)
+        webp_key = next(k for k in derivative_keys if k.endswith('_360w.webp'))
+        self.assertEqual(self.s3.objects[webp_key]['ExtraArgs']['ContentType'], 'image/webp')
+
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, event.image_variants['webp']['720'] + ' 720w')
+        response = self.client.get(reverse('event_detail', args=[event.id]))
+        self.assertContains(response, event.image_variants['jpg']['1440'] + ' 1440w')
+
+
+@override_settings(EVENTS_TASK_BACKEND='sync')
+class ContentAddressedImageTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.s3 = FakeS3Client()
+        s3_patcher = patch('events.utils.get_s3_client', return_value=self.s3)
+        s3_patcher.start()
+        self.addCleanup(s3_patcher.stop)
+
+        byte_io = io.BytesIO()
+        Image.new('RGB', (800, 400), color='purple').save(byte_io, 'JPEG')
+        self.banner = byte_io.getvalue()
+
+    def test_image_field_fits_content_addressed_urls(self):
+        # SQLite ignores varchar lengths; PostgreSQL rejects longer values
+        url = utils.s3_url_for_key(utils.content_key('0' * 64, 'banner.jpeg'))
+        self.assertLessEqual(len(url), Event._meta.get_field('image').max_length)
+
+    def create_event(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_event'), {
+                'title': title,
+                'description': 'Recurring event',
+                'location': 'Test location',
+                'date': '2030-05-01 10:30',
+                'image': SimpleUploadedFile('banner.jpg', self.banner, content_type='image/jpeg'),
+            })
+        return Event.objects.get(title=title)
+
+    def test_same_banner_is_uploaded_once(self):
+        first = self.create_event('Week 1')
+        objects_after_first = set(self.s3.objects)
+        second = self.create_event('Week 2')
+
+        self.assertEqual(first.image, second.image)
+        self.assertEqual(first.image_variants, second.image_variants)
+        self.assertEqual(self.s3.uploads, 1)
+        self.assertEqual(set(self.s3.objects), objects_after_first)
+        stored = StoredImage.objects.get()
+        self.assertEqual(stored.ref_count, 2)
+
+    def test_shared_object_deleted_with_last_reference(self):
+        first = self.create_event('Week 1')
+        second = self.create_event('Week 2')
+        self.assertTrue(self.s3.objects)
+
+        self.client.post(reverse('delete_event', args=[first.id]))
+        self.assertEqual(StoredImage.objects.get().ref_count, 1)
+        self.assertIn(utils.s3_key_from_url(first.image.name), self.s3.objects)
+
+        self.client.post(reverse('delete_event', args=[second.id]))
+        self.assertFalse(StoredImage.objects.exists())
+        call_command('drain_s3_deletions', stdout=io.StringIO())
+        self.assertEqual(self.s3.objects, {})
+
+    def test_reuploading_the_same_image_keeps_one_reference(self):
+        event = self.create_event('Week 1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('update_event', args=[event.id]), {
+                'title': 'Week 1',
+                'description': 'Recurring event',
+                'location': 'Test location',
+                'date': '2030-05-01 10:30',
+                'image': SimpleUploadedFile('banner.jpg', self.banner, content_type='image/jpeg'),
+            })
+        self.assertEqual(StoredImage.objects.get().ref_count, 1)
+
+        self.client.post(reverse('delete_event', args=[event.id]))
+        call_command('drain_s3_deletions', stdout=io.StringIO())
+
+        self.assertFalse(StoredImage.objects.exists())
+        self.assertEqual(self.s3.objects, {})
+
+    def test_replacing_image_releases_the_old_one(self):
+        event = self.create_event('Week 1')
+        old_key = utils.s3_key_from_url(event.image.name)
+
+        byte_io = io.BytesIO()
+        Image.new('RGB', (800, 400), color='teal').save(byte_io, 'JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('update_event', args=[event.id]), {
+                'title': 'Week 1',
+                'description': 'Recurring event',
+                'location': 'Test location',
+                'date': '2030-05-01 10:30',
+                'image': SimpleUploadedFile('new.jpg', byte_io.getvalue(), content_type='image/jpeg'),
+            })
+
+        event.refresh_from_db()
+        call_command('drain_s3_deletions', stdout=io.StringIO())
+        self.assertNotIn(old_key, self.s3.objects)
+        self.assertIn(utils.s3_key_from_url(event.image.name), self.s3.objects)
+        self.assertEqual(StoredImage.objects.get().key, utils.s3_key_from_url(event.image.name))
+
+
+@override_settings(EVENTS_TASK_BACKEND='sync', EVENTS_IMAGE_MAX_UPLOAD_SIZE=1024 * 1024)
+class PresignedUploadTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.s3 = FakeS3Client()
+        s3_patcher = patch('events.utils.get_s3_client', return_value=self.s3)
+        s3_patcher.start()
+        self.addCleanup(s3_patcher.stop)
+        self.url = reverse('presign_image_upload')
+
+    def stage_upload(self, key, content_type='image/jpeg', checksum=False):
+        # Simulate the browser's direct POST to S3
+        byte_io = io.BytesIO()
+        Image.new('RGB', (400, 200), color='navy').save(byte_io, 'JPEG')
+        data = byte_io.getvalue()
+        extra = {'ChecksumSHA256': utils.sha256_checksum(hashlib.sha256(data).hexdigest())} if checksum else {}
+        self.s3.put_object(Bucket='b', Key=key, Body=data, ContentType=content_type, **extra)
+        return data
+
+    def event_data(self, image_key):
+        return {
+            'title': 'Direct Upload Event',
+            'description': 'Direct upload test',
+            'location': 'Test location',
+            'date': '2030-05-01 10:30',
+            'image_key': image_key,
+        }
+
+    def test_presign_post_limits_size_and_type(self):
+        response = self.client.post(self.url, {'content_type': 'image/png', 'size': 2048})
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['method'], 'POST')
+        self.assertTrue(payload['key'].startswith(f'uploads/{self.user.pk}/'))
+        self.assertTrue(payload['key'].endswith('.png'))
+        self.assertEqual(payload['fields']['Content-Type'], 'image/png')
+        self.assertEqual(payload['fields']['key'], payload['key'])
+
+    def test_presign_put(self):
+        response = self.client.post(self.url, {'content_type': 'image/jpeg', 'size': 10, 'method': 'put'})
+        payload = response.json()
+        self.assertEqual(payload['method'], 'PUT')
+        self.assertEqual(payload['headers'], {'Content-Type': 'image/jpeg'})
+
+    def test_presign_signs_the_checksum(self):
+        digest = hashlib.sha256(b'image').hexdigest()
+        checksum = utils.sha256_checksum(digest)
+
+        post = self.client.post(self.url, {'content_type': 'image/png', 'size': 5, 'sha256': digest}).json()
+        put = self.client.post(self.url, {'content_type': 'image/png', 'size': 5, 'sha256': digest, 'method': 'put'}).json()
+
+        self.assertEqual(post['fields']['x-amz-checksum-sha256'], checksum)
+        self.assertEqual(post['fields']['x-amz-checksum-algorithm'], 'SHA256')
+        self.assertEqual(put['headers']['x-amz-checksum-sha256'], checksum)
+        response = self.client.post(self.url, {'content_type': 'image/png', 'size': 5, 'sha256': 'not-hex'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_stored_image_is_reused_without_downloading(self):
+        first_key = f'uploads/{self.user.pk}/first.jpg'
+        second_key = f'uploads/{self.user.pk}/second.jpg'
+        self.stage_upload(first_key, checksum=True)
+        self.stage_upload(second_key, checksum=True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_event'), self.event_data(first_key))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_event'), dict(self.event_data(second_key), title='Second Event'))
+
+        first = Event.objects.get(title='Direct Upload Event')
+        second = Event.objects.get(title='Second Event')
+        self.assertEqual(self.s3.downloads, [first_key])
+        self.assertEqual(second.image, first.image)
+        self.assertEqual(second.image_variants, first.image_variants)
+        self.assertEqual(second.image_status, Event.ImageStatus.READY)
+        self.assertEqual(StoredImage.objects.get().ref_count, 2)
+        self.assertTrue(PendingDeletion.objects.filter(key=second_key).exists())
+
+    def test_presign_rejects_bad_requests(self):
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        response = self.client.post(self.url, {'content_type': 'text/html', 'size': 10})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, {'content_type': 'image/jpeg', 'size': 2 * 1024 * 1024})
+        self.assertEqual(response.status_code, 400)
+
+    def test_presign_requires_login(self):
+        self.client.logout()
+        response = self.client.post(self.url, {'content_type': 'image/jpeg', 'size': 10})
+        self.assertRedirects(response, f'/login/?next={self.url}')
+
+    def test_create_event_with_uploaded_key(self):
+        key = f'uploads/{self.user.pk}/staged.jpg'
+        data = self.stage_upload(key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('create_event'), self.event_data(key))
+        self.assertRedirects(response, reverse('home'))
+
+        event = Event.objects.get(title='Direct Upload Event')
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(event.image, utils.s3_url_for_key(f'media/events/{digest}.jpg'))
+        self.assertEqual(event.image_status, Event.ImageStatus.READY)
+        self.assertTrue(event.image_variants)
+        # The staging copy is queued for the batched deletion worker
+        self.assertTrue(PendingDeletion.objects.filter(key=key).exists())
+
+    def test_failed_upload_queues_the_staging_copy(self):
+        key = f'uploads/{self.user.pk}/broken.jpg'
+        self.s3.put_object(Bucket='b', Key=key, Body=b'not an image', ContentType='image/jpeg')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_event'), self.event_data(key))
+
+        event = Event.objects.get(title='Direct Upload Event')
+        self.assertEqual(event.image_status, Event.ImageStatus.FAILED)
+        self.assertTrue(PendingDeletion.objects.filter(key=key).exists())
+
+    def test_rejects_key_of_another_user(self):
+        other = User.objects.create_user(username='other', password='testpassword')
+        key = f'uploads/{other.pk}/staged.jpg'
+        self.stage_upload(key)
+        response = self.client.post(reverse('create_event'), self.event_data(key))
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(response, 'form', 'image_key', 'Invalid image upload.')
+
+    def test_rejects_missing_or_wrong_type_object(self):
+        response = self.client.post(reverse('create_event'), self.event_data(f'uploads/{self.user.pk}/none.jpg'))
+        self.assertFormError(
+            response, 'form', 'image_key', 'The uploaded image could not be found. Please upload it again.',
+        )
+
+        key = f'uploads/{self.user.pk}/page.jpg'
+        self.stage_upload(key, content_type='text/html')
+        response = self.client.post(reverse('create_event'), self.event_data(key))
+        self.assertFormError(response, 'form', 'image_key', 'Upload a valid image.')
+
+
+@override_settings(EVENTS_DELETION_RETRY_BASE=30, EVENTS_DELETION_RETRY_MAX=3600)
+class DeferredDeletionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.s3 = FakeS3Client()
+        s3_patcher = patch('events.utils.get_s3_client', return_value=self.s3)
+        s3_patcher.start()
+        self.addCleanup(s3_patcher.stop)
+
+    def store(self, key):
+        self.s3.put_object(Bucket='b', Key=key, Body=b'data')
+        return utils.s3_url_for_key(key)
+
+    def test_delete_event_only_queues_the_image(self):
+        url = self.store('media/events/legacy.jpg')
+        event = Event.objects.create(
+            title='Delete Me', description='Queued', location='Nowhere',
+            date=timezone.now() + timedelta(days=1), created_by=self.user, image=url,
+        )
+        response = self.client.post(reverse('delete_event', args=[event.id]))
+
+        self.assertRedirects(response, reverse('home'))
+        self.assertIn('media/events/legacy.jpg', self.s3.objects)
+        self.assertEqual(self.s3.delete_batches, [])
+        self.assertTrue(PendingDeletion.objects.filter(key='media/events/legacy.jpg').exists())
+
+    def test_drain_sends_batches_of_at_most_1000_keys(self):
+        keys = [f'media/events/{i}.jpg' for i in range(1500)]
+        for key in keys:
+            self.store(key)
+        utils.enqueue_s3_deletion(keys)
+
+        out = io.StringIO()
+        call_command('drain_s3_deletions', stdout=out)
+
+        self.assertEqual([len(batch) for batch in self.s3.delete_batches], [1000, 500])
+        self.assertEqual(self.s3.objects, {})
+        self.assertFalse(PendingDeletion.objects.exists())
+        self.assertIn('Resolved 1500', out.getvalue())
+
+    def test_failed_keys_are_retried_with_backoff(self):
+        self.store('media/events/ok.jpg')
+        self.store('media/events/locked.jpg')
+        self.s3.undeletable.add('media/events/locked.jpg')
+        utils.enqueue_s3_deletion(['media/events/ok.jpg', 'media/events/locked.jpg'])
+
+        now = timezone.now()
+        self.assertEqual(utils.drain_pending_deletions(now=now), (1, 1))
+        pending = PendingDeletion.objects.get()
+        self.assertEqual(pending.key, 'media/events/locked.jpg')
+        self.assertEqual(pending.attempts, 1)
+        self.assertEqual(pending.last_error, 'Access Denied')
+        self.assertEqual(pending.next_attempt_at, now + timedelta(seconds=30))
+
+        # Not due yet, then due and failing again: the delay doubles
+        self.assertEqual(utils.drain_pending_deletions(now=now + timedelta(seconds=10)), (0, 0))
+        utils.drain_pending_deletions(now=now + timedelta(seconds=30))
+        pending.refresh_from_db()
+        self.assertEqual(pending.attempts, 2)
+        self.assertEqual(pending.next_attempt_at, now + timedelta(seconds=90))
+
+        self.s3.undeletable.clear()
+        self.assertEqual(utils.drain_pending_deletions(now=now + timedelta(seconds=90)), (1, 0))
+        self.assertEqual(self.s3.objects, {})
+
+    def test_connection_errors_keep_keys_queued(self):
+        utils.enqueue_s3_deletion(['media/events/a.jpg'])
+        with patch.object(self.s3, 'delete_objects', side_effect=ConnectionError('offline')):
+            with self.assertLogs('events.utils', 'WARNING'):
+                self.assertEqual(utils.drain_pending_deletions(), (0, 1))
+        self.assertEqual(PendingDeletion.objects.get().last_error, 'offline')
+
+    def test_reused_image_is_not_deleted(self):
+        url = self.store('media/events/shared.jpg')
+        utils.acquire_image(url)
+        utils.delete_image_from_s3(url)
+        self.assertTrue(PendingDeletion.objects.exists())
+
+        # Uploaded again before the queue was drained
+        utils.acquire_image(url)
+        call_command('drain_s3_deletions', stdout=io.StringIO())
+        self.assertIn('media/events/shared.jpg', self.s3.objects)
+        self.assertFalse(PendingDeletion.objects.exists())
+
+    def banner(self):
+        byte_io = io.BytesIO()
+        Image.new('RGB', (400, 200), color='teal').save(byte_io, 'JPEG')
+        return SimpleUploadedFile('banner.jpg', byte_io.getvalue(), content_type='image/jpeg')
+
+    def test_reupload_keeps_objects_the_drain_had_queued(self):
+        first = Event.objects.create(
+            title='Last year', description='Recurring', location='Hall',
+            date=timezone.now() + timedelta(days=1), created_by=self.user,
+        )
+        tasks.upload_event_image(first.id, self.banner())
+        first.refresh_from_db()
+        key = utils.s3_key_from_url(str(first.image))
+        utils.delete_image_from_s3(str(first.image))
+        first.delete()
+        self.assertTrue(PendingDeletion.objects.filter(key=key).exists())
+
+        # The drain runs while the re-upload is still building derivatives
+        second = Event.objects.create(
+            title='This year', description='Recurring', location='Hall',
+            date=timezone.now() + timedelta(days=1), created_by=self.user,
+        )
+        build = tasks.upload_image_derivatives
+
+        def drain_then_build(*args, **kwargs):
+            utils.drain_pending_deletions()
+            return build(*args, **kwargs)
+
+        with patch('events.tasks.upload_image_derivatives', side_effect=drain_then_build):
+            tasks.upload_event_image(second.id, self.banner())
+
+        second.refresh_from_db()
+        self.assertEqual(utils.s3_key_from_url(str(second.image)), key)
+        self.assertIn(key, self.s3.objects)
+        for urls in second.image_variants.values():
+            for url in urls.values():
+                self.assertIn(utils.s3_key_from_url(url), self.s3.objects)
+        self.assertEqual(StoredImage.objects.get(key=key).ref_count, 1)
+        self.assertFalse(PendingDeletion.objects.exists())
+
+    def test_reserving_waits_for_an_in_flight_deletion(self):
+        url = self.store('media/events/busy.jpg')
+        PendingDeletion.objects.create(
+            key='media/events/busy.jpg', source_key='media/events/busy.jpg',
+            claimed_until=timezone.now() + timedelta(minutes=5),
+        )
+
+        # The drain resolves its claim while the upload waits
+        with patch('events.utils.time.sleep', side_effect=lambda seconds: PendingDeletion.objects.all().delete()) as sleep:
+            stored, revived = utils.reserve_image(url)
+
+        sleep.assert_called_once()
+        self.assertFalse(revived)
+        self.assertEqual(stored.ref_count, 1)
+
+
+class DeletionDrainTransactionTest(TransactionTestCase):
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        s3_patcher = patch('events.utils.get_s3_client', return_value=self.s3)
+        s3_patcher.start()
+        self.addCleanup(s3_patcher.stop)
+
+    def test_no_transaction_is_open_during_the_s3_call(self):
+        utils.enqueue_s3_deletion(['media/events/a.jpg', 'media/events/b.jpg'])
+        delete_objects = self.s3.delete_objects
+        claimed = []
+
+        def check(**kwargs):
+            self.assertFalse(connection.in_atomic_block)
+            claimed.extend(PendingDeletion.objects.filter(claimed_until__isnull=False).values_list('key', flat=True))
+            return delete_objects(**kwargs)
+
+        with patch.object(self.s3, 'delete_objects', side_effect=check):
+            self.assertEqual(utils.drain_pending_deletions(), (2, 0))
+
+        self.assertEqual(sorted(claimed), ['media/events/a.jpg', 'media/events/b.jpg'])
+        self.assertFalse(PendingDeletion.objects.exists())
+
+
+class ConcurrentRSVPTest(TransactionTestCase):
+    threads = 8
+    rounds = 20
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'clicker{i}', password='testpassword')
+            for i in range(self.threads)
+        ]
+        self.event = Event.objects.create(
+            title='Hot Event', description='Concurrency test', location='Test Venue',
+            date=timezone.now() + timedelta(days=1), created_by=self.users[0],
+        )
+
+    def hammer(self, worker):
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def run(index):
+            try:
+                barrier.wait()
+                for round_number in range(self.rounds):
+                    worker(index, round_number)
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def assertCounterMatches(self):
+        self.event.refresh_from_db()
+        self.assertEqual(
+            self.event.attendee_count,
+            RSVP.objects.filter(event=self.event, status=RSVP.Status.GOING).count(),
+        )
+
+    def test_many_users_toggling_one_event(self):
+        self.hammer(lambda index, _: set_rsvp(self.users[index], self.event.id))
+        self.assertCounterMatches()
+        # Every user toggled an even number of times
+        self.assertEqual(self.event.attendee_count, 0)
+
+    def test_double_submits_from_one_user(self):
+        user = self.users[0]
+        self.hammer(lambda index, round_number: set_rsvp(user, self.event.id, attend=round_number % 2 == 0))
+        self.assertCounterMatches()
+        self.assertLessEqual(RSVP.objects.filter(event=self.event).count(), 1)
+
+    def test_capacity_is_never_exceeded(self):
+        self.event.capacity = 3
+        self.event.save()
+        overbooked = []
+
+        def worker(index, round_number):
+            # Alternate cancel/attend so seats keep changing hands; the last round attends
+            set_rsvp(self.users[index], self.event.id, attend=round_number % 2 == 1)
+            count = Event.objects.values_list('attendee_count', flat=True).get(pk=self.event.pk)
+            if count > 3:
+                overbooked.append(count)
+
+        self.hammer(worker)
+        self.assertEqual(overbooked, [])
+        self.assertCounterMatches()
+        # Every user wants in: the seats are full and nobody is stranded on the waitlist
+        self.assertEqual(self.event.attendee_count, 3)
+        self.assertEqual(
+            RSVP.objects.filter(event=self.event, status=RSVP.Status.WAITLISTED).count(),
+            self.threads - 3,
+        )
+
+    def test_cancellations_promote_the_waitlist(self):
+        self.event.capacity = 2
+        self.event.save()
+        for user in self.users:
+            set_rsvp(user, self.event.id, attend=True)
+
+        going = set(RSVP.objects.filter(event=self.event, status=RSVP.Status.GOING).values_list('user', flat=True))
+
+        def worker(index, _):
+            # Attendees cancel while the waitlist repeatedly re-submits
+            user = self.users[index]
+            set_rsvp(user, self.event.id, attend=user.pk not in going)
+
+        self.hammer(worker)
+        self.assertCounterMatches()
+        self.assertEqual(self.event.attendee_count, 2)
+        self.assertEqual(RSVP.objects.filter(event=self.event).count(), self.threads - 2)
+
+
+class WaitlistTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organiser = User.objects.create_user(username='organiser', password='testpassword')
+        self.users = [
+            User.objects.create_user(username=f'guest{i}', password='testpassword')
+            for i in range(4)
+        ]
+        self.event = Event.objects.create(
+            title='Small Event', description='Two seats', location='Test Venue',
+            date=timezone.now() + timedelta(days=1), created_by=self.organiser, capacity=2,
+        )
+
+    def statuses(self):
+        return dict(RSVP.objects.filter(event=self.event).values_list('user__username', 'status'))
+
+    def test_full_event_waitlists_new_rsvps(self):
+        self.assertEqual(set_rsvp(self.users[0], self.event.id, attend=True), RSVP.Status.GOING)
+        self.assertEqual(set_rsvp(self.users[1], self.event.id, attend=True), RSVP.Status.GOING)
+        self.assertEqual(set_rsvp(self.users[2], self.event.id, attend=True), RSVP.Status.WAITLISTED)
+        # A repeated submit keeps the waitlist place
+        self.assertEqual(set_rsvp(self.users[2], self.event.id, attend=True), RSVP.Status.WAITLISTED)
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 2)
+
+    def test_cancellation_promotes_earliest_waitlisted(self):
+        for user in self.users:
+            set_rsvp(user, self.event.id, attend=True)
+        # guest3 joined the waitlist before guest2
+        RSVP.objects.filter(user=self.users[3]).update(timestamp=timezone.now() - timedelta(minutes=5))
+
+        self.assertIsNone(set_rsvp(self.users[0], self.event.id, attend=False))
+
+        self.assertEqual(self.statuses(), {
+            'guest1': RSVP.Status.GOING,
+            'guest2': RSVP.Status.WAITLISTED,
+            'guest3': RSVP.Status.GOING,
+        })
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 2)
+
+    def test_leaving_the_waitlist_keeps_the_count(self):
+        for user in self.users[:3]:
+            set_rsvp(user, self.event.id, attend=True)
+
+        self.assertIsNone(set_rsvp(self.users[2], self.event.id))
+
+        self.assertNotIn('guest2', self.statuses())
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 2)
+
+    def test_raising_capacity_promotes_waitlist(self):
+        for user in self.users:
+            set_rsvp(user, self.event.id, attend=True)
+        self.client.login(username='organiser', password='testpassword')
+
+        response = self.client.post(reverse('update_event', args=[self.event.id]), {
+            'title': self.event.title,
+            'description': self.event.description,
+            'date': (timezone.now() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M'),
+            'location': self.event.location,
+            'capacity': 3,
+        })
+
+        self.assertRedirects(response, reverse('event_detail', args=[self.event.id]))
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 3)
+        self.assertEqual(list(self.statuses().values()).count(RSVP.Status.WAITLISTED), 1)
+
+    def test_detail_page_offers_the_waitlist(self):
+        for user in self.users[:2]:
+            set_rsvp(user, self.event.id, attend=True)
+        self.client.login(username='guest2', password='testpassword')
+
+        response = self.client.get(reverse('event_detail', args=[self.event.id]))
+        self.assertContains(response, 'Join Waitlist')
+        self.assertContains(response, '2 of 2 spots taken')
+
+        response = self.client.post(reverse('toggle_rsvp', args=[self.event.id]), {'action': 'attend'}, follow=True)
+        self.assertContains(response, "You're on the waitlist")
+        self.assertContains(response, 'Leave Waitlist')
+
+    def test_rebuild_counts_ignores_waitlist(self):
+        for user in self.users:
+            set_rsvp(user, self.event.id, attend=True)
+        Event.objects.filter(pk=self.event.pk).update(attendee_count=0)
+
+        call_command('rebuild_attendee_counts', stdout=io.StringIO())
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 2)
+
+
+class EventAPITest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='apiuser', password='testpassword')
+        now = timezone.now()
+        self.events = [
+            Event.objects.create(
+                title=f'API Event {i}', description='Polled by the app', location='Test Venue',
+                date=now + timedelta(days=i + 1), created_by=self.user,
+            )
+            for i in range(3)
+        ]
+        self.past = Event.objects.create(
+            title='Old Event', description='Over', location='Test Venue',
+            date=now - timedelta(days=1), created_by=self.user,
+        )
+
+    def test_list_returns_upcoming_events(self):
+        response = self.client.get(reverse('api_event_list'))
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([row['title'] for row in data['results']], ['API Event 0', 'API Event 1', 'API Event 2'])
+        self.assertEqual(data['results'][0]['attendee_count'], 0)
+        self.assertIsNone(data['results'][0]['image'])
+        self.assertIsNone(data['next'])
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        data = self.client.get(reverse('api_event_list'), {'include_past': '1'}).json()
+        self.assertEqual(data['results'][0]['title'], 'Old Event')
+
+    @patch('events.api.EVENTS_PER_PAGE', 2)
+    def test_list_links_to_next_page(self):
+        data = self.client.get(reverse('api_event_list')).json()
+        self.assertEqual(len(data['results']), 2)
+
+        data = self.client.get(data['next']).json()
+        self.assertEqual([row['title'] for row in data['results']], ['API Event 2'])
+        self.assertIsNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+
+    def test_detail(self):
+        event = self.events[0]
+        response = self.client.get(reverse('api_event_detail', args=[event.id]))
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['id'], event.id)
+        self.assertEqual(data['description'], 'Polled by the app')
+        self.assertEqual(data['organiser'], 'apiuser')
+
+    def test_detail_not_found(self):
+        response = self.client.get(reverse('api_event_detail', args=[9999]))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('error', response.json())
+
+    def test_read_only(self):
+        response = self.client.post(reverse('api_event_list'))
+        self.assertEqual(response.status_code, 405)
+
+    def test_uses_values_projection(self):
+        with patch.object(Event, 'from_db', side_effect=AssertionError('model instance built')):
+            self.assertEqual(self.client.get(reverse('api_event_list')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('api_event_detail', args=[self.events[0].id])).status_code, 200)
+
+    def test_if_none_match_returns_304_with_one_query(self):
+        url = reverse('api_event_list')
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1), patch('events.api._serialize') as serialize:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        serialize.assert_not_called()
+
+        detail_url = reverse('api_event_detail', args=[self.events[0].id])
+        etag = self.client.get(detail_url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since_returns_304(self):
+        url = reverse('api_event_detail', args=[self.events[0].id])
+        last_modified = self.client.get(url)['Last-Modified']
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_rsvp_changes_validators(self):
+        list_url = reverse('api_event_list')
+        detail_url = reverse('api_event_detail', args=[self.events[0].id])
+        list_etag = self.client.get(list_url)['ETag']
+        detail_etag = self.client.get(detail_url)['ETag']
+
+        set_rsvp(self.user, self.events[0].id, attend=True)
+
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['attendee_count'], 1)
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.organiser = User.objects.create_user(username='organiser', password='testpassword')
+        self.other = User.objects.create_user(username='other', password='testpassword')
+        self.event = Event.objects.create(
+            title='Exported Event', description='Export me', location='Test Venue',
+            date=timezone.now() + timedelta(days=1), created_by=self.organiser,
+        )
+        Event.objects.create(
+            title='Someone Else', description='Not mine', location='Elsewhere',
+            date=timezone.now() + timedelta(days=2), created_by=self.other,
+        )
+        for i in range(5):
+            user = User.objects.create_user(username=f'attendee{i}', email=f'a{i}@example.com', password='testpassword')
+            set_rsvp(user, self.event.id, attend=True)
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_attendees_csv(self):
+        self.client.login(username='organiser', password='testpassword')
+        response = self.client.get(reverse('export_attendees', args=[self.event.id]))
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        lines = self.content(response).splitlines()
+        self.assertEqual(lines[0], 'username,email,status,rsvped_at')
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[1].startswith('attendee0,a0@example.com,going,'))
+
+    def test_csv_cells_cannot_start_formulas(self):
+        Event.objects.filter(pk=self.event.pk).update(title='=HYPERLINK("http://evil")', location='-2+3')
+        self.client.login(username='organiser', password='testpassword')
+        response = self.client.get(reverse('export_events'))
+
+        row = next(csv.DictReader(io.StringIO(self.content(response))))
+        self.assertEqual(row['title'], '\'=HYPERLINK("http://evil")')
+        self.assertEqual(row['location'], "'-2+3")
+        self.assertEqual(row['attendee_count'], '5')
+
+    def test_ndjson_values_are_not_escaped(self):
+        Event.objects.filter(pk=self.event.pk).update(title='=SUM(A1)')
+        self.client.login(username='organiser', password='testpassword')
+        response = self.client.get(reverse('export_events'), {'format': 'ndjson'})
+
+        self.assertEqual(json.loads(self.content(response).splitlines()[0])['title'], '=SUM(A1)')
+
+    def test_export_attendees_ndjson(self):
+        self.client.login(username='organiser', password='testpassword')
+        response = self.client.get(reverse('export_attendees', args=[self.event.id]), {'format': 'ndjson'})
+
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['username'] for row in rows], [f'attendee{i}' for i in range(5)])
+
+    def test_export_attendees_is_organiser_only(self):
+        self.client.login(username='other', password='testpassword')
+        response = self.client.get(reverse('export_attendees', args=[self.event.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_export_rejects_unknown_format(self):
+        self.client.login(username='organiser', password='testpassword')
+        response = self.client.get(reverse('export_events'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_events_only_lists_own_events(self):
+        self.client.login(username='organiser', password='testpassword')
+        response = self.client.get(reverse('export_events'), {'format': 'ndjson'})
+
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Exported Event'])
+        self.assertEqual(rows[0]['attendee_count'], 5)
+
+    @patch('events.exports.EXPORT_CHUNK_SIZE', 2)
+    def test_rows_are_fetched_in_chunks(self):
+        # Rows are streamed from a server-side cursor with the user joined in,
+        # so the export costs one query however many attendees there are
+        with self.assertNumQueries(1):
+            lines = list(exports.export_attendees(self.event.id, 'csv'))
+        self.assertEqual(len(lines), 6)
+
+    def test_management_command(self):
+        out = io.StringIO()
+        call_command('export_events', '--attendees', str(self.event.id), '--format', 'ndjson', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 5)
+
+        out = io.StringIO()
+        call_command('export_events', '--organiser', 'other', stdout=out)
+        self.assertEqual(out.getvalue().splitlines()[1].split(',')[1], 'Someone Else')
+
+
+class ImportEventsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organiser = User.objects.create_user(username='importer', password='testpassword')
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w', newline='') as f:
+            f.write(content)
+        return path
+
+    def csv_rows(self, count, start=0):
+        lines = ['title,description,date,location,capacity,created_by']
+        for i in range(start, start + count):
+            lines.append(f'Imported {i},Row {i},2030-01-{i % 28 + 1:02d} 18:00,Hall {i},,importer')
+        return '\n'.join(lines) + '\n'
+
+    def test_imports_csv_in_batches(self):
+        path = self.write('events.csv', self.csv_rows(7))
+        out = io.StringIO()
+
+        # One username lookup, then one INSERT per batch of three
+        with self.assertNumQueries(1 + 3 * 3):
+            call_command('import_events', path, '--batch-size', '3', stdout=out)
+
+        self.assertEqual(Event.objects.filter(created_by=self.organiser).count(), 7)
+        self.assertIn('Imported 7 event(s)', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+
+    def test_imports_ndjson(self):
+        rows = [
+            {'title': 'NDJSON Event', 'description': 'From JSON', 'date': '2030-05-01T10:00:00+00:00',
+             'location': 'Online', 'capacity': 50, 'created_by': 'importer'},
+        ]
+        path = self.write('events.ndjson', ''.join(json.dumps(row) + '\n' for row in rows))
+
+        call_command('import_events', path, stdout=io.StringIO())
+
+        event = Event.objects.get(title='NDJSON Event')
+        self.assertEqual(event.capacity, 50)
+        self.assertEqual(event.created_by, self.organiser)
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        path = self.write('events.csv', (
+            'title,description,date,location,capacity,created_by\n'
+            'Good,Fine,2030-01-01 10:00,Hall,,importer\n'
+            ',No title,2030-01-01 10:00,Hall,,importer\n'
+            'Bad date,Oops,not a date,Hall,,importer\n'
+            'Nobody,Unknown organiser,2030-01-01 10:00,Hall,,ghost\n'
+        ))
+        out, err = io.StringIO(), io.StringIO()
+
+        call_command('import_events', path, stdout=out, stderr=err)
+
+        self.assertEqual(list(Event.objects.values_list('title', flat=True)), ['Good'])
+        self.assertIn('3 invalid row(s) skipped', out.getvalue())
+        self.assertIn('Row 2 skipped: title', err.getvalue())
+        self.assertIn('Row 4 skipped: created_by: Unknown username.', err.getvalue())
+
+    def test_resumes_from_checkpoint(self):
+        path = self.write('events.csv', self.csv_rows(6))
+        checkpoint = 'events.csv'
+
+        # Fail while inserting the second batch
+        original = Event.objects.bulk_create
+        calls = []
+
+        def flaky_bulk_create(objs, *args, **kwargs):
+            calls.append(len(objs))
+            if len(calls) == 2:
+                raise RuntimeError('database went away')
+            return original(objs, *args, **kwargs)
+
+        with patch.object(Event.objects, 'bulk_create', side_effect=flaky_bulk_create):
+            with self.assertRaises(RuntimeError):
+                call_command('import_events', path, '--batch-size', '2', '--checkpoint', checkpoint, stdout=io.StringIO())
+        self.assertEqual(Event.objects.count(), 2)
+        self.assertEqual(ImportCheckpoint.objects.get(name=checkpoint).position, 2)
+
+        out = io.StringIO()
+        call_command('import_events', path, '--batch-size', '2', '--checkpoint', checkpoint, stdout=out)
+
+        self.assertIn('Resuming after row 2', out.getvalue())
+        self.assertEqual(
+            sorted(Event.objects.values_list('title', flat=True)),
+            [f'Imported {i}' for i in range(6)],
+        )
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_unreadable_ndjson_lines_are_reported_and_skipped(self):
+        good = {'title': 'Good', 'description': 'Fine', 'date': '2030-01-01T10:00:00+00:00',
+                'location': 'Hall', 'created_by': 'importer'}
+        path = self.write('events.ndjson', '{"title": "Broken"\n[1, 2]\n' + json.dumps(good) + '\n')
+        out, err = io.StringIO(), io.StringIO()
+
+        call_command('import_events', path, stdout=out, stderr=err)
+
+        self.assertEqual(list(Event.objects.values_list('title', flat=True)), ['Good'])
+        self.assertIn('2 invalid row(s) skipped', out.getvalue())
+        self.assertIn('Row 1 skipped: line: Invalid JSON', err.getvalue())
+        self.assertIn('Row 2 skipped: line: Expected a JSON object.', err.getvalue())
+
+    def test_failed_checkpoint_write_rolls_the_batch_back(self):
+        path = self.write('events.csv', self.csv_rows(4))
+        checkpoint = 'events.csv'
+        original = ImportCommand.write_checkpoint
+        calls = []
+
+        def flaky_write_checkpoint(command, checkpoint, position):
+            calls.append(position)
+            if len(calls) == 2:
+                raise OSError('disk full')
+            original(command, checkpoint, position)
+
+        with patch.object(ImportCommand, 'write_checkpoint', flaky_write_checkpoint):
+            with self.assertRaises(OSError):
+                call_command('import_events', path, '--batch-size', '2', '--checkpoint', checkpoint, stdout=io.StringIO())
+
+        # The database never runs ahead of the checkpoint
+        self.assertEqual(Event.objects.count(), 2)
+        self.assertEqual(ImportCheckpoint.objects.get(name=checkpoint).position, 2)
+
+    def test_import_invalidates_home_cache(self):
+        self.client.get(reverse('home'))
+        path = self.write('events.csv', self.csv_rows(1))
+
+        call_command('import_events', path, stdout=io.StringIO())
+
+        self.assertContains(self.client.get(reverse('home')), 'Imported 0')
+
+
+
+class ImportCommitTest(TransactionTestCase):
+    def test_failed_commit_does_not_advance_the_checkpoint(self):
+        User.objects.create_user(username='importer', password='testpassword')
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'events.csv')
+        with open(path, 'w', newline='') as f:
+            f.write('title,description,date,location,created_by\n')
+            f.writelines(f'Imported {i},Row {i},2030-01-01 18:00,Hall,importer\n' for i in range(4))
+        original = connection.commit
+        calls = []
+
+        def flaky_commit():
+            calls.append(1)
+            if len(calls) == 2:
+                raise OperationalError('server closed the connection')
+            original()
+
+        with patch.object(connection, 'commit', side_effect=flaky_commit):
+            with self.assertRaises(OperationalError):
+                call_command('import_events', path, '--batch-size', '2', '--checkpoint', 'events.csv',
+                             stdout=io.StringIO())
+
+        # The checkpoint rolled back with the batch it described
+        self.assertEqual(Event.objects.count(), 2)
+        self.assertEqual(ImportCheckpoint.objects.get(name='events.csv').position, 2)
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', password='testpassword')
+
+    def create(self, title, description='Something', location='Somewhere', days=1):
+        return Event.objects.create(
+            title=title, description=description, location=location,
+            date=timezone.now() + timedelta(days=days), created_by=self.user,
+        )
+
+    def results(self, query, **params):
+        response = self.client.get(reverse('search'), {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [event.title for event in response.context['page_obj']]
+
+    def test_ranks_title_matches_first(self):
+        self.create('Garden party', description='Bring a jazz record')
+        self.create('Jazz night')
+        self.create('Board games')
+
+        self.assertEqual(self.results('jazz'), ['Jazz night', 'Garden party'])
+
+    def test_matches_location_and_prefixes(self):
+        self.create('Meetup', location='Amsterdam')
+
+        self.assertEqual(self.results('amster'), ['Meetup'])
+        self.assertEqual(self.results('Amsterdam meetup'), ['Meetup'])
+
+    def test_hides_past_events_unless_requested(self):
+        self.create('Old jazz', days=-1)
+
+        self.assertEqual(self.results('jazz'), [])
+        self.assertEqual(self.results('jazz', include_past='1'), ['Old jazz'])
+
+    def test_index_follows_updates_and_deletes(self):
+        event = self.create('Salsa class')
+        event.title = 'Tango class'
+        event.save()
+        self.assertEqual(self.results('salsa'), [])
+        self.assertEqual(self.results('tango'), ['Tango class'])
+
+        event.delete()
+        self.assertEqual(self.results('tango'), [])
+
+    def test_query_syntax_is_escaped(self):
+        self.create('Rock concert')
+
+        self.assertEqual(self.results('rock" OR (NEAR'), [])
+        self.assertEqual(self.results('"rock"'), ['Rock concert'])
+        response = self.client.get(reverse('search'), {'q': '*** ()'})
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_uses_the_index_and_cursor_pagination(self):
+        for i in range(7):
+            self.create(f'Jazz session {i}')
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('search'), {'q': 'jazz'})
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 5)
+        self.assertTrue(page.has_next)
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertIn('@@' if connection.vendor == 'postgresql' else 'MATCH', sql)
+        self.assertNotIn('LIKE', sql)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('search'), {'q': 'jazz', 'after': page.next_cursor})
+        second = response.context['page_obj']
+        self.assertEqual(len(second), 2)
+        self.assertFalse(second.has_next)
+        self.assertNotIn('OFFSET', ' '.join(q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(
+            {event.title for event in page} | {event.title for event in second},
+            {f'Jazz session {i}' for i in range(7)},
+        )
+
+        response = self.client.get(reverse('search'), {'q': 'jazz', 'before': second.previous_cursor})
+        self.assertEqual([e.id for e in response.context['page_obj']], [e.id for e in page])
+
+    @skipUnless(settings.DATABASE_ENGINE != 'postgresql', 'FTS5 triggers only exist on SQLite')
+    def test_missing_triggers_are_repaired(self):
+        # What a migration that rebuilds events_event on SQLite leaves behind
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER events_event_fts_insert')
+        self.create('Blues jam')
+
+        self.assertTrue(repair_sqlite_search_index(connection))
+        self.assertFalse(repair_sqlite_search_index(connection))
+        self.assertEqual(self.results('blues'), ['Blues jam'])
+
+    def test_home_has_search_box(self):
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, f'action="{reverse("search")}"')
+
+
+class GeoTest(TestCase):
+    # Amsterdam Centraal
+    lat, lon = 52.3791, 4.9003
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='geouser', password='testpassword')
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.table = os.path.join(self.tmpdir, 'places.csv')
+        with open(self.table, 'w', newline='') as f:
+            f.write('location,latitude,longitude\nAmsterdam,52.3676,4.9041\nUtrecht,52.0907,5.1214\n')
+        geo.load_geocoding_table.cache_clear()
+        self.addCleanup(geo.load_geocoding_table.cache_clear)
+
+    def create(self, title, lat, lon, days=1):
+        return Event.objects.create(
+            title=title, description='Geo', location='Somewhere', latitude=lat, longitude=lon,
+            date=timezone.now() + timedelta(days=days), created_by=self.user,
+        )
+
+    def test_encode_geohash(self):
+        self.assertEqual(geo.encode_geohash(57.64911, 10.40744), 'u4pruydqq')
+        self.assertEqual(geo.encode_geohash(57.64911, 10.40744, precision=5), 'u4pru')
+
+    def test_geohash_follows_coordinates(self):
+        event = self.create('Located', self.lat, self.lon)
+        self.assertEqual(event.geohash, geo.encode_geohash(self.lat, self.lon))
+
+        event.latitude = event.longitude = None
+        event.save()
+        self.assertEqual(event.geohash, '')
+
+    def test_nearby_sorted_by_distance(self):
+        self.create('Dam Square', 52.3731, 4.8926)
+        self.create('Utrecht', 52.0907, 5.1214)
+        self.create('Vondelpark', 52.3580, 4.8686)
+        self.create('Past', 52.3791, 4.9004, days=-1)
+        self.create('Unknown place', None, None)
+
+        rows = geo.nearby_events(Event.objects.all(), self.lat, self.lon, radius_km=10, limit=10)
+
+        self.assertEqual([row['title'] for row in rows], ['Dam Square', 'Vondelpark'])
+        self.assertLess(rows[0]['distance_km'], rows[1]['distance_km'])
+        self.assertAlmostEqual(rows[0]['distance_km'], 0.85, places=2)
+
+    def test_matches_brute_force_across_cell_boundaries(self):
+        rng = random.Random(17)
+        for i in range(300):
+            self.create(f'Event {i}', self.lat + rng.uniform(-0.5, 0.5), self.lon + rng.uniform(-0.8, 0.8))
+
+        for radius in (1, 5, 20, 60):
+            expected = sorted(
+                (round(geo.haversine_km(self.lat, self.lon, e.latitude, e.longitude), 3), e.id)
+                for e in Event.objects.all()
+                if geo.haversine_km(self.lat, self.lon, e.latitude, e.longitude) <= radius
+            )
+            rows = geo.nearby_events(Event.objects.all(), self.lat, self.lon, radius_km=radius, limit=1000)
+            self.assertEqual([(row['distance_km'], row['id']) for row in rows], expected)
+
+    def test_cells_are_about_the_radius_across(self):
+        # 25 km picks ~20 km cells rather than ~156 km ones
+        self.assertEqual(geo.precision_for_radius(self.lat, self.lon, 25), 4)
+        for radius in (1, 5, 25, 60, 500):
+            precision = geo.precision_for_radius(self.lat, self.lon, radius)
+            cells = geo.covering_cells(self.lat, self.lon, radius, precision)
+            self.assertLessEqual(len(cells), geo.MAX_COVER_CELLS)
+            self.assertIn(geo.encode_geohash(self.lat, self.lon, precision), cells)
+
+    def test_search_crosses_the_antimeridian(self):
+        self.create('East', -17.0, 179.95)
+        self.create('West', -17.0, -179.95)
+
+        rows = geo.nearby_events(Event.objects.all(), -17.0, 179.99, radius_km=20, limit=10)
+
+        self.assertEqual({row['title'] for row in rows}, {'East', 'West'})
+
+    def test_query_uses_geohash_ranges(self):
+        with CaptureQueriesContext(connection) as ctx:
+            geo.nearby_events(Event.objects.all(), self.lat, self.lon, radius_km=5, limit=10)
+        self.assertIn('"geohash" >=', ctx.captured_queries[0]['sql'])
+
+    def test_table_geocoder(self):
+        with override_settings(EVENTS_GEOCODING_TABLE=self.table):
+            self.assertEqual(geo.geocode('amsterdam'), (52.3676, 4.9041))
+            self.assertEqual(geo.geocode('Science Park 904,  Amsterdam'), (52.3676, 4.9041))
+            self.assertIsNone(geo.geocode('Atlantis'))
+        self.assertIsNone(geo.geocode('Amsterdam'))
+
+    def test_event_form_geocodes_location(self):
+        self.client.login(username='geouser', password='testpassword')
+        with override_settings(EVENTS_GEOCODING_TABLE=self.table):
+            self.client.post(reverse('create_event'), {
+                'title': 'Canal tour', 'description': 'Boats', 'location': 'Amsterdam',
+                'date': (timezone.now() + timedelta(days=3)).strftime('%Y-%m-%d %H:%M'),
+            })
+            event = Event.objects.get(title='Canal tour')
+            self.assertEqual((event.latitude, event.longitude), (52.3676, 4.9041))
+            self.assertEqual(event.geohash, geo.encode_geohash(52.3676, 4.9041))
+
+            self.client.post(reverse('update_event', args=[event.id]), {
+                'title': 'Canal tour', 'description': 'Boats', 'location': 'Utrecht',
+                'date': (timezone.now() + timedelta(days=3)).strftime('%Y-%m-%d %H:%M'),
+            })
+        event.refresh_from_db()
+        self.assertEqual(event.latitude, 52.0907)
+
+    def test_imported_events_are_found_nearby(self):
+        rows = [{'title': 'Imported canal tour', 'description': 'Boats', 'location': 'Amsterdam',
+                 'date': (timezone.now() + timedelta(days=3)).isoformat(), 'created_by': 'geouser'}]
+        with override_settings(EVENTS_GEOCODING_TABLE=self.table):
+            import_events(rows)
+
+        event = Event.objects.get(title='Imported canal tour')
+        self.assertEqual(event.geohash, geo.encode_geohash(52.3676, 4.9041))
+        rows = geo.nearby_events(Event.objects.all(), self.lat, self.lon, radius_km=5, limit=10)
+        self.assertEqual([row['title'] for row in rows], ['Imported canal tour'])
+
+    def test_geocode_events_command(self):
+        for location in ('Amsterdam', 'Amsterdam', 'Utrecht', 'Atlantis'):
+            Event.objects.create(
+                title=location, description='Backfill', location=location,
+                date=timezone.now() + timedelta(days=1), created_by=self.user,
+            )
+        out = io.StringIO()
+
+        with override_settings(EVENTS_GEOCODING_TABLE=self.table):
+            call_command('geocode_events', stdout=out)
+
+        self.assertIn('Geocoded 3 event(s) at 2 location(s); 1 location(s) not found.', out.getvalue())
+        self.assertEqual(Event.objects.exclude(geohash='').count(), 3)
+
+    def test_nearby_api(self):
+        self.create('Dam Square', 52.3731, 4.8926)
+
+        response = self.client.get(reverse('api_events_nearby'), {'lat': self.lat, 'lon': self.lon, 'radius': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['title'] for row in response.json()['results']], ['Dam Square'])
+
+        self.assertEqual(self.client.get(reverse('api_events_nearby'), {'lat': 'x', 'lon': 1}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_events_nearby'), {'lat': 91, 'lon': 1}).status_code, 400)
+        self.assertEqual(
+            self.client.get(reverse('api_events_nearby'), {'lat': 1, 'lon': 1, 'radius': 5000}).status_code, 400,
+        )
+
+
+class CalendarFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organiser = User.objects.create_user(username='organiser', password='testpassword')
+        self.attendee = User.objects.create_user(username='attendee', password='testpassword')
+        self.events = [
+            Event.objects.create(
+                title=f'Feed Event {i}', description='Line one\nLine two; with, punctuation',
+                location='Main Hall', date=timezone.now() + timedelta(days=i + 1), created_by=self.organiser,
+            )
+            for i in range(3)
+        ]
+        set_rsvp(self.attendee, self.events[0].id, attend=True)
+        set_rsvp(self.attendee, self.events[2].id, attend=True)
+        self.feed_url = reverse('attending_calendar', args=[ics.feed_token(self.attendee)])
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_attending_feed(self):
+        response = self.client.get(self.feed_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        body = self.content(response)
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertTrue(body.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+        self.assertIn(f'UID:event-{self.events[0].id}@eventplanner', body)
+        self.assertNotIn('SUMMARY:Feed Event 1', body)
+        self.assertIn('DESCRIPTION:Line one\\nLine two\\; with\\, punctuation', body)
+
+    def test_bad_token_is_404(self):
+        response = self.client.get(reverse('attending_calendar', args=['not-a-token']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_organiser_feed(self):
+        response = self.client.get(reverse('organiser_calendar', args=['organiser']))
+        self.assertEqual(self.content(response).count('BEGIN:VEVENT'), 3)
+
+        self.assertEqual(self.client.get(reverse('organiser_calendar', args=['nobody'])).status_code, 404)
+
+    def test_conditional_get_is_one_query(self):
+        response = self.client.get(self.feed_url)
+        self.content(response)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.feed_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(self.feed_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_feed_changes_with_rsvps(self):
+        etag = self.client.get(self.feed_url)['ETag']
+
+        set_rsvp(self.attendee, self.events[1].id, attend=True)
+
+        response = self.client.get(self.feed_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response).count('BEGIN:VEVENT'), 3)
+
+    def test_vevents_are_cached_per_event_version(self):
+        url = reverse('organiser_calendar', args=['organiser'])
+        self.content(self.client.get(url))
+
+        with patch('events.ics.render_vevent', wraps=ics.render_vevent) as render:
+            self.content(self.client.get(url))
+            render.assert_not_called()
+
+            event = self.events[1]
+            event.title = 'Renamed'
+            event.save()
+            body = self.content(self.client.get(url))
+        self.assertEqual(render.call_count, 1)
+        self.assertIn('SUMMARY:Renamed', body)
+
+    def test_long_lines_are_folded(self):
+        line = 'DESCRIPTION:' + 'é' * 100
+        folded = ics.fold_line(line)
+
+        self.assertTrue(all(len(part.encode()) <= 75 for part in folded.split('\r\n')))
+        self.assertEqual(folded.replace('\r\n ', '').rstrip('\r\n'), line)
+
+
+@override_settings(EVENTS_QUERY_BUDGET_STRICT=True, EVENTS_TASK_BACKEND='sync')
+class QueryBudgetTest(TestCase):
+    """Drives every budgeted view; a view over its EVENTS_QUERY_BUDGETS entry raises."""
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.user = User.objects.create_user(username='budget', password='testpassword')
+        self.events = [
+            Event.objects.create(
+                title=f'Budget Event {i}', description='Counted', location='Hall',
+                latitude=52.37, longitude=4.89,
+                date=timezone.now() + timedelta(days=i + 1), created_by=self.user,
+            )
+            for i in range(8)
+        ]
+        for event in self.events[::2]:
+            set_rsvp(self.user, event.id, attend=True)
+
+    def visit_every_view(self):
+        event = self.events[0]
+        date = (timezone.now() + timedelta(days=2)).strftime('%Y-%m-%d %H:%M')
+        self.client.get(reverse('home'))
+        self.client.get(reverse('search'), {'q': 'budget'})
+        self.client.get(reverse('event_detail', args=[event.id]))
+        self.client.get(reverse('api_event_list'))
+        self.client.get(reverse('api_event_detail', args=[event.id]))
+        self.client.get(reverse('api_events_nearby'), {'lat': 52.37, 'lon': 4.89})
+        self.client.get(reverse('organiser_calendar', args=['budget']))
+        self.client.get(reverse('attending_calendar', args=[ics.feed_token(self.user)]))
+        self.client.get(reverse('export_events'))
+        self.client.get(reverse('export_attendees', args=[event.id]))
+        self.client.get(reverse('create_event'))
+        self.client.post(reverse('create_event'), {
+            'title': 'Created', 'description': 'Counted', 'location': 'Hall', 'date': date,
+        })
+        self.client.post(reverse('update_event', args=[event.id]), {
+            'title': 'Renamed', 'description': 'Counted', 'location': 'Hall', 'date': date,
+        })
+        self.client.get(reverse('rsvp_status', args=[event.id]))
+        self.client.post(reverse('toggle_rsvp', args=[self.events[1].id]), {'action': 'attend'})
+        self.client.post(reverse('toggle_rsvp', args=[self.events[1].id]), {'action': 'cancel'})
+        self.client.post(reverse('delete_event', args=[self.events[-1].id]))
+
+    def test_views_stay_within_query_budgets(self):
+        self.visit_every_view()
+        self.client.login(username='budget', password='testpassword')
+        self.visit_every_view()
+
+        visited = metrics.registry.snapshot()
+        self.assertLessEqual(set(settings.EVENTS_QUERY_BUDGETS), set(visited))
+
+    def test_exceeding_a_budget_fails(self):
+        with override_settings(EVENTS_QUERY_BUDGETS={'event_detail': 0}):
+            with self.assertRaises(metrics.QueryBudgetExceeded):
+                self.client.get(reverse('event_detail', args=[self.events[0].id]))
+
+
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.user = User.objects.create_user(username='timed', password='testpassword')
+        self.event = Event.objects.create(
+            title='Timed Event', description='Measured', location='Hall',
+            date=timezone.now() + timedelta(days=1), created_by=self.user,
+        )
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('event_detail', args=[self.event.id]))
+
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="1 queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_records_per_view_totals(self):
+        self.client.get(reverse('event_detail', args=[self.event.id]))
+        self.client.get(reverse('event_detail', args=[self.event.id]))
+        self.client.get('/no-such-page/')
+
+        views = metrics.registry.snapshot()
+        self.assertEqual(views['event_detail']['requests'], 2)
+        self.assertEqual(views['event_detail']['queries'], 2)
+        self.assertGreater(views['event_detail']['template'], 0)
+        self.assertGreaterEqual(views['event_detail']['wall'], views['event_detail']['template'])
+        self.assertEqual(views['unresolved']['requests'], 1)
+
+    @override_settings(EVENTS_METRICS_TOKEN='scrape-token')
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('event_detail', args=[self.event.id]))
+
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer scrape-token'})
+
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('eventplanner_requests_total{view="event_detail"} 1', body)
+        self.assertIn('eventplanner_db_queries_total{view="event_detail"} 1', body)
+        self.assertIn('eventplanner_request_duration_seconds_bucket{view="event_detail",le="+Inf"} 1', body)
+
+    @override_settings(EVENTS_METRICS_TOKEN='scrape-token')
+    def test_metrics_endpoint_needs_the_token(self):
+        for headers in ({}, {'Authorization': 'Bearer wrong'}, {'Authorization': 'scrape-token'}):
+            response = self.client.get(reverse('metrics'), headers=headers)
+            self.assertEqual(response.status_code, 404, headers)
+
+    def test_metrics_endpoint_is_disabled_without_a_token(self):
+        # Even from the loopback address a proxy forwards from
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1', headers={'Authorization': 'Bearer '})
+        self.assertEqual(response.status_code, 404)
+
+    def test_async_requests(self):
+        async def run():
+            return await self.async_client.get(reverse('api_event_list'))
+
+        response = async_to_sync(run)()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.assertEqual(metrics.registry.snapshot()['api_event_list']['queries'], 1)
+
+
+@override_settings(ROOT_URLCONF='config.urls_asgi', EVENTS_QUERY_BUDGET_STRICT=True)
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='async', password='testpassword')
+        self.events = [
+            Event.objects.create(
+                title=f'Async Event {i}', description='Awaited', location='Hall', capacity=1,
+                date=timezone.now() + timedelta(days=i + 1), created_by=self.user,
+            )
+            for i in range(7)
+        ]
+        set_rsvp(self.user, self.events[0].id, attend=True)
+        other = User.objects.create_user(username='other', password='testpassword')
+        set_rsvp(other, self.events[1].id, attend=True)
+        set_rsvp(self.user, self.events[1].id, attend=True)
+
+    async def test_home(self):
+        response = await self.async_client.get(reverse('home'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event.title for event in response.context['page_obj']], [
+            f'Async Event {i}' for i in range(5)
+        ])
+        self.assertIsNone(response.context.get('calendar_token'))
+
+    async def test_home_signed_in_marks_attending_events(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+
+        response = await self.async_client.get(reverse('home'))
+
+        self.assertEqual(response.context['rsvped_event_ids'], {self.events[0].id})
+        self.assertContains(response, 'Hello, async')
+        self.assertIsNotNone(response.context['calendar_token'])
+
+    async def test_home_follows_cursors(self):
+        first = await self.async_client.get(reverse('home'))
+
+        second = await self.async_client.get(reverse('home'), {'after': first.context['page_obj'].next_cursor})
+
+        self.assertEqual([event.title for event in second.context['page_obj']], ['Async Event 5', 'Async Event 6'])
+
+    def test_home_matches_the_sync_view(self):
+        async def get_home():
+            return await self.async_client.get(reverse('home'))
+
+        self.client.force_login(self.user)
+        # Pagination cursors are signed with a timestamp; keep it fixed so the
+        # pages match when the test crosses a second boundary
+        with patch('django.core.signing.TimestampSigner.timestamp', return_value='0'):
+            async_page = async_to_sync(get_home)()
+            self.async_client.force_login(self.user)
+            signed_in_async_page = async_to_sync(get_home)()
+
+            with override_settings(ROOT_URLCONF='config.urls'):
+                cache.clear()
+                sync_page = self.client.get(reverse('home'))
+                self.client.logout()
+                anonymous_sync_page = self.client.get(reverse('home'))
+
+        self.assertEqual(signed_in_async_page.content, sync_page.content)
+        self.assertEqual(async_page.content, anonymous_sync_page.content)
+
+    def test_asgi_settings_route_to_the_async_views(self):
+        self.assertEqual(settings_asgi.ROOT_URLCONF, 'config.urls_asgi')
+        self.assertEqual(settings_asgi.MIDDLEWARE, settings.MIDDLEWARE)
+
+    async def test_event_detail(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+
+        going = await self.async_client.get(reverse('event_detail', args=[self.events[0].id]))
+        waitlisted = await self.async_client.get(reverse('event_detail', args=[self.events[1].id]))
+
+        self.assertTrue(going.context['has_rsvped'])
+        self.assertEqual(going.context['rsvped_event_ids'], {self.events[0].id})
+        self.assertTrue(waitlisted.context['is_waitlisted'])
+        self.assertContains(waitlisted, 'Leave Waitlist')
+
+    async def test_event_detail_missing(self):
+        response = await self.async_client.get(reverse('event_detail', args=[999]))
+
+        self.assertEqual(response.status_code, 404)
+
+    async def test_rsvp_status(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+
+        going = await self.async_client.get(reverse('rsvp_status', args=[self.events[0].id]))
+        waitlisted = await self.async_client.get(reverse('rsvp_status', args=[self.events[1].id]))
+        none = await self.async_client.get(reverse('rsvp_status', args=[self.events[2].id]))
+
+        self.assertEqual(going.json(), {
+            'event': self.events[0].id, 'status': 'going', 'attendee_count': 1, 'capacity': 1,
+        })
+        self.assertEqual(waitlisted.json()['status'], 'waitlisted')
+        self.assertIsNone(none.json()['status'])
+
+    async def test_rsvp_status_anonymous_and_missing(self):
+        anonymous = await self.async_client.get(reverse('rsvp_status', args=[self.events[0].id]))
+        missing = await self.async_client.get(reverse('rsvp_status', args=[999]))
+        posted = await self.async_client.post(reverse('rsvp_status', args=[self.events[0].id]))
+
+        self.assertIsNone(anonymous.json()['status'])
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(posted.status_code, 405)
+
+
+@override_settings(EVENTS_DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(TestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='organiser', password='testpassword')
+        self.event = Event.objects.create(
+            title='Fresh title', description='On the primary', location='Hall',
+            date=timezone.now() + timedelta(days=1), created_by=self.user,
+        )
+        # The replica has not caught up with the latest edit yet
+        User.objects.using('replica').create(id=self.user.id, username='organiser')
+        Event.objects.using('replica').create(
+            id=self.event.id, title='Stale title', description='On the replica', location='Hall',
+            date=self.event.date, created_by_id=self.user.id,
+        )
+
+    def test_home_reads_events_from_a_replica(self):
+        response = self.client.get(reverse('home'))
+
+        self.assertContains(response, 'Stale title')
+        self.assertNotContains(response, 'Fresh title')
+
+    def test_event_detail_reads_events_from_a_replica(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('event_detail', args=[self.event.id]))
+
+        self.assertContains(response, 'Stale title')
+        # The session and user still come from the primary
+        self.assertTrue(response.context['user'].is_authenticated)
+
+    def test_other_views_read_from_the_primary(self):
+        response = self.client.get(reverse('api_event_detail', args=[self.event.id]))
+
+        self.assertEqual(response.json()['title'], 'Fresh title')
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        self.client.force_login(self.user)
+
+        response = self.client.post(reverse('toggle_rsvp', args=[self.event.id]), {'action': 'attend'})
+        pin = response.cookies[routers.PIN_COOKIE]
+        detail = self.client.get(reverse('event_detail', args=[self.event.id]))
+
+        self.assertEqual(pin['max-age'], settings.EVENTS_REPLICA_PIN_SECONDS)
+        self.assertContains(detail, 'Fresh title')
+        self.assertTrue(detail.context['has_rsvped'])
+
+        # Once the pin expires, reads go back to the replica
+        del self.client.cookies[routers.PIN_COOKIE]
+        detail = self.client.get(reverse('event_detail', args=[self.event.id]))
+        self.assertContains(detail, 'Stale title')
+
+    def test_waitlist_changes_pin_the_client_to_the_primary(self):
+        # Joining a full event and leaving its waitlist are raw SQL only
+        other = User.objects.create_user(username='attendee', password='testpassword')
+        Event.objects.filter(pk=self.event.id).update(capacity=1)
+        set_rsvp(other, self.event.id, attend=True)
+        self.client.force_login(self.user)
+
+        joined = self.client.post(reverse('toggle_rsvp', args=[self.event.id]), {'action': 'attend'})
+        self.client.cookies.pop(routers.PIN_COOKIE, None)
+        left = self.client.post(reverse('toggle_rsvp', args=[self.event.id]), {'action': 'cancel'})
+
+        self.assertTrue(RSVP.objects.filter(user=other, status=RSVP.Status.GOING).exists())
+        self.assertFalse(RSVP.objects.filter(user=self.user).exists())
+        self.assertIn(routers.PIN_COOKIE, joined.cookies)
+        self.assertIn(routers.PIN_COOKIE, left.cookies)
+
+    def test_reads_do_not_pin(self):
+        response = self.client.get(reverse('event_detail', args=[self.event.id]))
+
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_no_pin_without_replicas(self):
+        self.client.force_login(self.user)
+
+        with override_settings(EVENTS_DATABASE_REPLICAS=[]):
+            response = self.client.post(reverse('toggle_rsvp', args=[self.event.id]))
+            detail = self.client.get(reverse('event_detail', args=[self.event.id]))
+
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+        self.assertContains(detail, 'Fresh title')
+
+    @override_settings(ROOT_URLCONF='config.urls_asgi')
+    async def test_async_event_detail_reads_from_a_replica(self):
+        response = await self.async_client.get(reverse('event_detail', args=[self.event.id]))
+
+        self.assertContains(response, 'Stale title')
+
+    def test_outside_requests_everything_uses_the_primary(self):
+        self.assertEqual(router.db_for_read(Event), 'default')
+        self.assertEqual(router.db_for_write(Event), 'default')
+        self.assertEqual(Event.objects.get(pk=self.event.id).title, 'Fresh title')
+
+
+
+@skipUnless('replica_0' in settings.DATABASES, 'Needs a streaming replica in DATABASE_REPLICA_HOSTS')
+@override_settings(EVENTS_DATABASE_REPLICAS=['replica_0'])
+class StreamingReplicaTest(TransactionTestCase):
+    """
+    ReplicaRoutingTest fakes the lag with a second database; this pauses
+    WAL replay on the real standby instead.
+    """
+    databases = {'default'} | {'replica_0'} & set(settings.DATABASES)
+
+    def setUp(self):
+        cache.clear()
+        # The mirror shares the primary's settings; point it at the standby
+        replica = connections['replica_0']
+        mirrored = replica.settings_dict
+        replica.close()
+        replica.settings_dict = dict(
+            mirrored, HOST=settings.DATABASES['replica_0']['HOST'], PORT=settings.DATABASES['replica_0']['PORT'],
+        )
+        self.addCleanup(setattr, replica, 'settings_dict', mirrored)
+        self.addCleanup(replica.close)
+
+        self.user = User.objects.create_user(username='organiser', password='testpassword')
+        self.event = Event.objects.create(
+            title='Replicated title', description='On both', location='Hall',
+            date=timezone.now() + timedelta(days=1), created_by=self.user,
+        )
+        self.wait_for(lambda: Event.objects.using('replica_0').filter(pk=self.event.id).exists())
+
+    def wait_for(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail('The standby did not catch up')
+            time.sleep(0.05)
+
+    def replay(self, action):
+        with connections['replica_0'].cursor() as cursor:
+            cursor.execute(f'SELECT pg_wal_replay_{action}()')
+
+    def replay_state(self):
+        with connections['replica_0'].cursor() as cursor:
+            cursor.execute('SELECT pg_get_wal_replay_pause_state()')
+            return cursor.fetchone()[0]
+
+    def test_pinned_clients_read_their_writes_while_the_standby_lags(self):
+        self.replay('pause')
+        self.addCleanup(self.replay, 'resume')
+        self.wait_for(lambda: self.replay_state() == 'paused')
+        self.event.title = 'Fresh title'
+        self.event.save()
+        self.client.force_login(self.user)
+
+        stale = self.client.get(reverse('event_detail', args=[self.event.id]))
+        response = self.client.post(reverse('toggle_rsvp', args=[self.event.id]), {'action': 'attend'})
+        fresh = self.client.get(reverse('event_detail', args=[self.event.id]))
+
+        self.assertContains(stale, 'Replicated title')
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        self.assertContains(fresh, 'Fresh title')
+        self.assertTrue(fresh.context['has_rsvped'])
+
+        # Once replay resumes, unpinned reads catch up
+        self.replay('resume')
+        self.wait_for(lambda: Event.objects.using('replica_0').get(pk=self.event.id).title == 'Fresh title')
+        del self.client.cookies[routers.PIN_COOKIE]
+        self.assertContains(self.client.get(reverse('event_detail', args=[self.event.id])), 'Fresh title')
+
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_seed_uses_bulk_inserts(self):
+        with CaptureQueriesContext(connection) as queries:
+            benchmarks.seed(users=4, events=30, rsvps=50)
+
+        self.assertEqual(User.objects.count(), 4)
+        self.assertEqual(Event.objects.count(), 30)
+        self.assertEqual(RSVP.objects.count(), 50)
+        self.assertEqual(sum(Event.objects.values_list('attendee_count', flat=True)), 50)
+        # The query count does not grow with the number of rows
+        self.assertLess(len(queries), 15)
+
+    def test_seed_caps_rsvps_at_every_pair(self):
+        benchmarks.seed(users=2, events=3, rsvps=100)
+
+        self.assertEqual(RSVP.objects.count(), 6)
+
+    def test_run_benchmarks_reports_every_scenario(self):
+        benchmarks.seed(users=3, events=40, rsvps=20)
+
+        results = benchmarks.run_benchmarks(benchmarks.load_data(), requests=5, warmup=1)
+
+        self.assertEqual(list(results), [name for name, *_ in benchmarks.SCENARIOS])
+        for name, result in results.items():
+            self.assertEqual(result['requests'], 5, name)
+            self.assertEqual(result['errors'], 0, name)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertLessEqual(result['p95_ms'], result['p99_ms'])
+        # The session and user come from the cache after the warmup
+        self.assertEqual(results['event_detail']['queries_per_request'], 2)
+        self.assertEqual(Event.objects.filter(title='Benchmark upload').count(), 6)
+
+    def test_only_selected_scenarios_run(self):
+        benchmarks.seed(users=1, events=5, rsvps=0)
+
+        results = benchmarks.run_benchmarks(benchmarks.load_data(), requests=2, warmup=0, scenarios=['event_detail'])
+
+        self.assertEqual(list(results), ['event_detail'])
+
+    def test_percentile_uses_nearest_rank(self):
+        samples = list(range(1, 101))
+
+        self.assertEqual(benchmarks.percentile(samples, 0.5), 50)
+        self.assertEqual(benchmarks.percentile(samples, 0.99), 99)
+        self.assertEqual(benchmarks.percentile([7], 0.95), 7)
+        self.assertIsNone(benchmarks.percentile([], 0.5))
+
+    def test_compare_flags_regressions(self):
+        baseline = {'results': {
+            'home': {'p50_ms': 10.0, 'p95_ms': 20.0, 'queries_per_request': 3},
+            'removed': {'p50_ms': 1.0, 'p95_ms': 1.0, 'queries_per_request': 1},
+        }}
+        report = {'results': {
+            'home': {'p50_ms': 11.0, 'p95_ms': 30.0, 'queries_per_request': 4},
+            'added': {'p50_ms': 1.0, 'p95_ms': 1.0, 'queries_per_request': 1},
+        }}
+
+        rows = benchmarks.compare(baseline, report, tolerance=0.2)
+
+        self.assertEqual(rows, [
+            ('home', 'p50_ms', 10.0, 11.0, False),
+            ('home', 'p95_ms', 20.0, 30.0, True),
+            ('home', 'queries_per_request', 3, 4, True),
+        ])
+
+    def test_report_records_parameters_and_environment(self):
+        report = benchmarks.build_report({'events': 10}, {})
+
+        self.assertEqual(report['parameters'], {'events': 10})
+        self.assertEqual(report['environment']['database'], connection.vendor)
+        self.assertIn('revision', report)
+
+
+class ConcurrentBenchmarkTest(TransactionTestCase):
+    def test_compares_wsgi_and_asgi(self):
+        benchmarks.seed(users=2, events=20, rsvps=10)
+
+        results = benchmarks.run_concurrency_benchmarks(benchmarks.load_data(), concurrency=3, requests=7)
+
+        self.assertEqual(set(results), {
+            f'{name}@{transport}' for name in benchmarks.CONCURRENT_SCENARIOS for transport in ('wsgi', 'asgi')
+        })
+        for name, result in results.items():
+            self.assertEqual(result['requests'], 7, name)
+            self.assertEqual(result['errors'], 0, name)
+            self.assertLessEqual(result['queries_per_request'], 4, name)
+
+    @skipUnless(settings.DATABASE_ENGINE != 'postgresql', 'The contention profiles are SQLite options')
+    def test_write_contention_runs_both_profiles(self):
+        benchmarks.seed(users=6, events=10, rsvps=5)
+
+        results = benchmarks.run_write_contention(benchmarks.load_data(), writers=2, requests=6)
+
+        self.assertEqual(set(results), {
+            f'{role}@{profile}' for role in benchmarks.CONTENTION_ROLES for profile in ('default', 'tuned')
+        })
+        for role in benchmarks.CONTENTION_ROLES:
+            self.assertEqual(results[f'{role}@tuned']['errors'], 0, role)
+        # The connection is back on the configured options
+        self.assertEqual(connection.settings_dict['OPTIONS'], settings.SQLITE_OPTIONS)
+
+
+@skipUnless(settings.DATABASE_ENGINE != 'postgresql', 'Runs against the SQLite backend only')
+class SQLiteBackendTest(TransactionTestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_to_new_connections(self):
+        connection.close()
+
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('cache_size'), -32000)
+        self.assertEqual(self.pragma('foreign_keys'), 1)
+
+    def test_pragmas_and_begin_are_not_counted_as_request_queries(self):
+        connection.close()
+        request_metrics = metrics.RequestMetrics()
+        token = metrics._current.set(request_metrics)
+        try:
+            with transaction.atomic():
+                User.objects.count()
+        finally:
+            metrics._current.reset(token)
+
+        self.assertEqual(request_metrics.queries, 1)
+
+    def test_atomic_begins_immediate_transactions(self):
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                User.objects.count()
+
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+    def test_unknown_transaction_mode_is_rejected(self):
+        options = dict(connection.settings_dict['OPTIONS'], transaction_mode='LAZY')
+        with patch.dict(connection.settings_dict, OPTIONS=options):
+            with self.assertRaises(ImproperlyConfigured):
+                connection.transaction_mode
+
+
+class CachedAuthTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cached', password='testpass123')
+        self.client.force_login(self.user)
+
+    def test_signed_in_requests_read_no_session_or_user_rows(self):
+        self.client.get(reverse('home'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+
+        self.assertTrue(response.context['user'].is_authenticated)
+        tables = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('django_session', tables)
+        self.assertNotIn('auth_user', tables)
+
+    def test_backend_serves_users_from_the_cache(self):
+        backend = CachedModelBackend()
+        backend.get_user(self.user.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(backend.get_user(self.user.pk), self.user)
+
+    def test_password_change_signs_out_other_sessions(self):
+        self.assertEqual(self.client.get(reverse('create_event')).status_code, 200)
+
+        self.user.set_password('changed-pass123')
+        self.user.save()
+
+        self.assertRedirects(
+            self.client.get(reverse('create_event')), '/login/?next=/event/create/', fetch_redirect_response=False,
+        )
+
+    def test_deleted_user_is_signed_out(self):
+        self.client.get(reverse('home'))
+
+        self.user.delete()
+
+        self.assertFalse(self.client.get(reverse('home')).context['user'].is_authenticated)
+
+    def test_sessions_signed_in_before_the_cached_backend_still_resolve(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+
+        self.assertTrue(self.client.get(reverse('home')).context['user'].is_authenticated)
+
+    def test_deploy_check_warns_about_a_local_memory_cache(self):
+        self.assertEqual([warning.id for warning in checks.check_shared_cache(None)], ['events.W001'])
+
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+
+class StaticAssetsTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.css = b'body { color: #333; }\n' * 40
+
+    def collect(self, files):
+        source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source)
+        for name, data in files.items():
+            os.makedirs(os.path.dirname(os.path.join(source, name)), exist_ok=True)
+            with open(os.path.join(source, name), 'wb') as f:
+                f.write(data)
+        with override_settings(
+            STATIC_ROOT=self.root, STATICFILES_DIRS=[source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STORAGES=dict(settings.STORAGES, staticfiles={
+                'BACKEND': 'events.staticfiles.CompressedManifestStaticFilesStorage',
+            }),
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.root, 'staticfiles.json')) as f:
+            return json.load(f)['paths']
+
+    def call(self, path, method='GET', **headers):
+        app = staticfiles.PrecompressedStaticFiles(
+            lambda environ, start_response: start_response('404 Not Found', []) or [b'app'],
+            root=self.root, prefix='/static/',
+        )
+        environ = {'REQUEST_METHOD': method, 'PATH_INFO': path, **headers}
+        response = {}
+
+        def start_response(status, response_headers):
+            response['status'] = status
+            response['headers'] = dict(response_headers)
+
+        response['body'] = b''.join(app(environ, start_response))
+        return response
+
+    def test_collectstatic_writes_hashed_and_compressed_copies(self):
+        paths = self.collect({'events/app.css': self.css, 'events/tiny.css': b'a{}'})
+
+        hashed = paths['events/app.css']
+        self.assertNotEqual(hashed, 'events/app.css')
+        for name in (hashed, 'events/app.css'):
+            with open(os.path.join(self.root, name + '.gz'), 'rb') as f:
+                self.assertEqual(gzip.decompress(f.read()), self.css)
+            self.assertEqual(
+                os.path.exists(os.path.join(self.root, name + '.br')), staticfiles.brotli is not None,
+            )
+        # Too small to be worth it
+        self.assertFalse(os.path.exists(os.path.join(self.root, paths['events/tiny.css'] + '.gz')))
+
+    def test_serves_gzip_copy_of_hashed_file_as_immutable(self):
+        hashed = self.collect({'events/app.css': self.css})['events/app.css']
+
+        response = self.call(f'/static/{hashed}', HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(response['status'], '200 OK')
+        self.assertEqual(response['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(response['headers']['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['headers']['Content-Type'], 'text/css; charset=utf-8')
+        self.assertEqual(response['headers']['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(gzip.decompress(response['body']), self.css)
+
+    def test_prefers_brotli_and_honours_refused_encodings(self):
+        hashed = self.collect({'events/app.css': self.css})['events/app.css']
+        with open(os.path.join(self.root, hashed + '.br'), 'wb') as f:
+            f.write(b'brotli bytes')
+
+        response = self.call(f'/static/{hashed}', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['headers']['Content-Encoding'], 'br')
+        self.assertEqual(response['body'], b'brotli bytes')
+
+        response = self.call(f'/static/{hashed}', HTTP_ACCEPT_ENCODING='br;q=0, gzip;q=0')
+        self.assertNotIn('Content-Encoding', response['headers'])
+        self.assertEqual(response['body'], self.css)
+
+    def test_unhashed_names_get_a_short_max_age(self):
+        self.collect({'events/app.css': self.css})
+
+        response = self.call('/static/events/app.css', method='HEAD')
+
+        self.assertEqual(response['headers']['Cache-Control'], f'public, max-age={settings.EVENTS_STATIC_MAX_AGE}')
+        self.assertEqual(response['headers']['Content-Length'], str(len(self.css)))
+        self.assertEqual(response['body'], b'')
+
+    def test_not_modified_since_last_modified(self):
+        hashed = self.collect({'events/app.css': self.css})['events/app.css']
+        last_modified = self.call(f'/static/{hashed}')['headers']['Last-Modified']
+
+        response = self.call(f'/static/{hashed}', HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response['status'], '304 Not Modified')
+        self.assertEqual(response['body'], b'')
+
+    def test_other_requests_reach_the_application(self):
+        hashed = self.collect({'events/app.css': self.css})['events/app.css']
+
+        for path, method in (
+            # Compressed copies are only served through Content-Encoding
+            (f'/static/{hashed}.gz', 'GET'),
+            ('/static/events/app.css.gz', 'GET'),
+            ('/static/events/missing.css', 'GET'),
+            ('/static/../../etc/passwd', 'GET'),
+            ('/static/events/app.css', 'POST'),
+            ('/events/app.css', 'GET'),
+        ):
+            response = self.call(path, method=method)
+            self.assertEqual(response['body'], b'app', path)
+
+    def test_pages_link_vendored_bootstrap(self):
+        response = self.client.get(reverse('login'))
+
+        self.assertContains(response, '/static/events/vendor/bootstrap/css/bootstrap.min.css')
+        self.assertContains(response, '/static/events/vendor/bootstrap/js/bootstrap.bundle.min.js')
+        self.assertNotContains(response, 'cdn.jsdelivr.net')
+
+    def test_vendored_bootstrap_is_committed_and_verified(self):
+        for url, path, integrity in staticfiles.VENDOR_ASSETS:
+            found = finders.find(f'events/vendor/{path}')
+            self.assertIsNotNone(found, path)
+            with open(found, 'rb') as f:
+                data = f.read()
+            # vendor_assets only strips the trailing source map comment
+            self.assertNotIn(b'sourceMappingURL', data)
+            self.assertGreater(len(data), 50000, path)
+
+    def test_pages_render_with_the_manifest_storage(self):
+        manifest_storage = dict(settings.STORAGES, staticfiles={
+            'BACKEND': 'events.staticfiles.CompressedManifestStaticFilesStorage',
+        })
+        with override_settings(STATIC_ROOT=self.root, STORAGES=manifest_storage):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            response = self.client.get(reverse('login'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response.content.decode(), r'/static/events/vendor/bootstrap/css/bootstrap\.min\.\w{12}\.css')
+
+    def test_vendor_assets_checks_integrity(self):
+        with patch('urllib.request.urlopen', return_value=io.BytesIO(b'tampered')):
+            with self.assertRaisesMessage(CommandError, 'does not match its pinned hash'):
+                call_command('vendor_assets', stdout=io.StringIO())
+
+    def test_source_map_comments_are_stripped(self):
+        self.assertEqual(
+            staticfiles.strip_source_map(b'a{}\n/*# sourceMappingURL=bootstrap.min.css.map */'), b'a{}\n',
+        )
+        self.assertEqual(
+            staticfiles.strip_source_map(b'f();\n//# sourceMappingURL=bootstrap.bundle.min.js.map\n'), b'f();\n',
+        )
+        self.assertEqual(
+            staticfiles.sri_hash(b''), 'sha384-OLBgp1GsljhM2TJ+sbHjaiH9txEUvgdDTAzHv2P24donTt6/529l+9Ua0vFImLlb',
+        )
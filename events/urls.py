@@ -1,8 +1,9 @@
 from django.urls import path
-from . import views
+from . import api, metrics, views
 
 urlpatterns = [
     path('', views.home, name='home'),
+    path('search/', views.search, name='search'),
     path('event/<int:event_id>/', views.event_detail, name='event_detail'),
     path('register/', views.register_view, name='register'),
     path('login/', views.login_view, name='login'),
@@ -12,7 +13,25 @@ urlpatterns = [
     path('event/create/', views.create_event, name='create_event'),
     path('event/<int:event_id>/update/', views.update_event, name='update_event'),
     path('event/<int:event_id>/delete/', views.delete_event, name='delete_event'),
+    path('event/image/presign/', views.presign_image_upload, name='presign_image_upload'),
     
-    # RSVP URL
+    # RSVP URLs
     path('event/<int:event_id>/rsvp/', views.toggle_rsvp, name='toggle_rsvp'),
+    path('event/<int:event_id>/rsvp/status/', views.rsvp_status, name='rsvp_status'),
+
+    # Streaming exports
+    path('events/export/', views.export_events, name='export_events'),
+    path('event/<int:event_id>/attendees/export/', views.export_attendees, name='export_attendees'),
+
+    # iCalendar feeds
+    path('calendar/<str:token>.ics', views.attending_calendar, name='attending_calendar'),
+    path('calendar/organiser/<str:username>.ics', views.organiser_calendar, name='organiser_calendar'),
+
+    # Prometheus-style request metrics
+    path('metrics/', metrics.metrics_view, name='metrics'),
+
+    # Read-only JSON API
+    path('api/events/', api.event_list, name='api_event_list'),
+    path('api/events/<int:event_id>/', api.event_detail, name='api_event_detail'),
+    path('api/events/nearby/', api.nearby, name='api_events_nearby'),
 ]
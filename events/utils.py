@@ -1,39 +1,313 @@
+import base64
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+import time
 import uuid
+from datetime import timedelta
+
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import PendingDeletion, StoredImage
+
+logger = logging.getLogger(__name__)
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    # boto3 clients are thread-safe once built (sessions are not), so one
+    # client with a connection pool is shared by request and worker threads
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                session = boto3.session.Session(
+                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                    region_name=settings.AWS_S3_REGION_NAME,
+                )
+                _s3_client = session.client(
+                    's3',
+                    config=Config(max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS),
+                )
+    return _s3_client
+
+
+def s3_url_for_key(key):
+    return f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/{key}"
+
+
+def s3_key_from_url(s3_url):
+    return s3_url.replace(f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/", "")
+
+
+def head_s3_object(key):
+    # Returns the object's metadata, with any checksum S3 verified on
+    # upload, or None when it does not exist
+    try:
+        return get_s3_client().head_object(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key, ChecksumMode='ENABLED',
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+
 
-def upload_image_to_s3(file, folder="media/events"):
-    # Generate a unique filename
-    filename = f"{folder}/{uuid.uuid4()}_{file.name}"
+def s3_object_exists(key):
+    return head_s3_object(key) is not None
 
-    # Upload to S3 using boto3
-    s3 = boto3.client(
-        's3',
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME,
+
+def sha256_checksum(digest):
+    # S3 checksums are the base64 of the raw digest, not hex
+    return base64.b64encode(bytes.fromhex(digest)).decode()
+
+
+def s3_object_sha256(head):
+    # Hex SHA-256 of an object from its HEAD, if it was uploaded with a
+    # whole-object checksum (multipart checksums end in "-<parts>")
+    checksum = (head or {}).get('ChecksumSHA256')
+    if not checksum or '-' in checksum:
+        return None
+    return base64.b64decode(checksum).hex()
+
+
+def direct_upload_prefix(user):
+    return f"uploads/{user.pk}/"
+
+
+def create_presigned_upload(user, content_type, method='post', sha256=None):
+    """
+    Presign a browser upload straight to S3 for ``user``.
+
+    POST uploads are limited by a signed content-length-range condition; PUT
+    uploads sign the content type only, so their size is checked with a
+    HEAD when the form referencing the key is submitted. With the file's
+    hex ``sha256`` the checksum is signed too, so S3 rejects any other bytes.
+    """
+    extension = settings.EVENTS_IMAGE_CONTENT_TYPES[content_type]
+    key = f"{direct_upload_prefix(user)}{uuid.uuid4()}{extension}"
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    expires = settings.EVENTS_PRESIGNED_UPLOAD_EXPIRY
+
+    checksum = sha256_checksum(sha256) if sha256 else None
+
+    if method == 'put':
+        params = {'Bucket': bucket, 'Key': key, 'ContentType': content_type}
+        headers = {'Content-Type': content_type}
+        if checksum:
+            params['ChecksumSHA256'] = headers['x-amz-checksum-sha256'] = checksum
+        url = get_s3_client().generate_presigned_url('put_object', Params=params, ExpiresIn=expires)
+        return {'method': 'PUT', 'url': url, 'key': key, 'headers': headers}
+
+    fields = {'Content-Type': content_type}
+    if checksum:
+        fields.update({'x-amz-checksum-algorithm': 'SHA256', 'x-amz-checksum-sha256': checksum})
+    presigned = get_s3_client().generate_presigned_post(
+        Bucket=bucket,
+        Key=key,
+        Fields=fields,
+        Conditions=[
+            *({name: value} for name, value in fields.items()),
+            ['content-length-range', 1, settings.EVENTS_IMAGE_MAX_UPLOAD_SIZE],
+        ],
+        ExpiresIn=expires,
     )
+    return {'method': 'POST', 'url': presigned['url'], 'fields': presigned['fields'], 'key': key}
+
+
+def hash_file(file, chunk_size=64 * 1024):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(chunk_size), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
 
-    s3.upload_fileobj(file, settings.AWS_STORAGE_BUCKET_NAME, filename)
+def content_key(digest, name, folder="media/events"):
+    return f"{folder}/{digest}{os.path.splitext(name)[1].lower()}"
 
-    # Return the full S3 URL
-    return f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/{filename}"
+
+def upload_image_to_s3(file, folder="media/events", digest=None):
+    """
+    Store ``file`` under the SHA-256 of its content and return its URL, with
+    one reference to it held for the caller (see ``reserve_image()``).
+
+    Re-uploading the same banner (e.g. for a recurring event) reuses the
+    stored object, unless its deletion had been queued in the meantime.
+    """
+    if digest is None:
+        digest = hash_file(file)
+    filename = content_key(digest, file.name, folder)
+    s3_url = s3_url_for_key(filename)
+
+    # Reserved before deciding to skip the upload, so the deletion queue
+    # cannot remove the object this upload reuses
+    _, revived = reserve_image(s3_url)
+    try:
+        if revived or not s3_object_exists(filename):
+            file.seek(0)
+            content_type = mimetypes.guess_type(file.name)[0] or 'application/octet-stream'
+            get_s3_client().upload_fileobj(
+                file, settings.AWS_STORAGE_BUCKET_NAME, filename,
+                ExtraArgs={'ContentType': content_type},
+            )
+    except Exception:
+        delete_image_from_s3(s3_url)
+        raise
+    return s3_url
+
+
+def upload_bytes_to_s3(data, key, content_type):
+    get_s3_client().put_object(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=key,
+        Body=data,
+        ContentType=content_type,
+        CacheControl='public, max-age=31536000, immutable',
+    )
+    return s3_url_for_key(key)
+
+
+def iter_s3_object(key, chunk_size=64 * 1024):
+    body = get_s3_client().get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)['Body']
+    return body.iter_chunks(chunk_size)
+
+
+def acquire_image(s3_url, variants=None):
+    # Record one more Event using this object (and its derivatives)
+    key = s3_key_from_url(s3_url)
+    with transaction.atomic():
+        stored, created = StoredImage.objects.select_for_update().get_or_create(
+            key=key, defaults={'ref_count': 1, 'variants': variants or {}},
+        )
+        if not created:
+            stored.ref_count = F('ref_count') + 1
+            if variants and not stored.variants:
+                stored.variants = variants
+            stored.save(update_fields=['ref_count', 'variants'])
+            stored.refresh_from_db()
+    return stored
+
+
+def reserve_image(s3_url, poll_interval=0.2):
+    """
+    Take a reference to a content-addressed image before (re)uploading it,
+    dropping any queued deletions of its objects in the same transaction.
+
+    Returns ``(stored, revived)``; ``revived`` means deletions were queued,
+    so the objects may already be gone and must be uploaded again. Keys a
+    drain is deleting right now are waited for rather than revived, since
+    its S3 call could otherwise land after the new upload.
+    """
+    key = s3_key_from_url(s3_url)
+    while True:
+        with transaction.atomic():
+            pending = PendingDeletion.objects.select_for_update().filter(Q(key=key) | Q(source_key=key))
+            if not pending.filter(claimed_until__gt=timezone.now()).exists():
+                revived = pending.delete()[0] > 0
+                return acquire_image(s3_url), revived
+        time.sleep(poll_interval)
 
 
 def delete_image_from_s3(s3_url):
-    # Extract the object key from the S3 URL
-    bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-    domain = settings.AWS_S3_CUSTOM_DOMAIN
-    object_key = s3_url.replace(f"https://{domain}/", "")
-    
-    s3 = boto3.client(
-        's3',
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME,
+    # Drop one reference; once no Event uses the image any more its objects
+    # are queued for deletion rather than deleted inline
+    object_key = s3_key_from_url(s3_url)
+    with transaction.atomic():
+        stored = StoredImage.objects.select_for_update().filter(key=object_key).first()
+        if stored is not None and stored.ref_count > 1:
+            StoredImage.objects.filter(pk=stored.pk).update(ref_count=F('ref_count') - 1)
+            return
+
+        # Last reference, or an image stored before reference counting
+        keys = [object_key]
+        if stored is not None:
+            keys += [s3_key_from_url(url) for urls in stored.variants.values() for url in urls.values()]
+            stored.delete()
+        enqueue_s3_deletion(keys, source_key=object_key)
+
+
+def enqueue_s3_deletion(keys, source_key=''):
+    PendingDeletion.objects.bulk_create(
+        [PendingDeletion(key=key, source_key=source_key) for key in keys],
+        ignore_conflicts=True,
     )
 
-    try:
-        s3.delete_object(Bucket=bucket_name, Key=object_key)
-    except Exception as e:
-        print(f"Error deleting image from S3: {e}")
+
+def _retry_delay(attempts):
+    delay = settings.EVENTS_DELETION_RETRY_BASE * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.EVENTS_DELETION_RETRY_MAX))
+
+
+def drain_pending_deletions(batch_size=1000, now=None):
+    """
+    Delete one batch of due keys from the PendingDeletion queue.
+
+    Keys go out in a single ``delete_objects`` call (S3 accepts up to 1000).
+    Failed keys stay queued with an exponential backoff. Keys whose source
+    image has been referenced again in the meantime are dropped unsent.
+    Returns ``(resolved, failed)``: queue entries removed and entries retried.
+
+    The keys are claimed in one short transaction and resolved in another,
+    so no transaction (or SQLite write lock) is held during the S3 call.
+    """
+    now = now or timezone.now()
+    batch_size = min(batch_size, 1000)
+    claimed_until = now + timedelta(seconds=settings.EVENTS_DELETION_CLAIM_SECONDS)
+    with transaction.atomic():
+        rows = list(
+            PendingDeletion.objects.select_for_update(skip_locked=True)
+            .filter(next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'pk')[:batch_size]
+        )
+        if not rows:
+            return 0, 0
+
+        live = set(
+            StoredImage.objects.filter(key__in={row.source_key for row in rows}, ref_count__gt=0)
+            .values_list('key', flat=True)
+        )
+        revived = [row.pk for row in rows if row.source_key in live]
+        rows = [row for row in rows if row.source_key not in live]
+        PendingDeletion.objects.filter(pk__in=revived).delete()
+        # Pushing next_attempt_at past the claim keeps other drains away
+        PendingDeletion.objects.filter(pk__in=[row.pk for row in rows]).update(
+            claimed_until=claimed_until, next_attempt_at=claimed_until,
+        )
+
+    errors = {}
+    if rows:
+        try:
+            response = get_s3_client().delete_objects(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Delete={'Objects': [{'Key': row.key} for row in rows], 'Quiet': True},
+            )
+            errors = {error['Key']: error.get('Message', error.get('Code', '')) for error in response.get('Errors', [])}
+        except Exception as e:
+            logger.warning('Batch delete of %d S3 objects failed: %s', len(rows), e)
+            errors = {row.key: str(e) for row in rows}
+
+    failed = [row for row in rows if row.key in errors]
+    done = [row.pk for row in rows if row.key not in errors]
+    with transaction.atomic():
+        PendingDeletion.objects.filter(pk__in=done).delete()
+        for row in failed:
+            row.attempts += 1
+            row.last_error = errors[row.key][:255]
+            row.next_attempt_at = now + _retry_delay(row.attempts)
+            row.claimed_until = None
+        PendingDeletion.objects.bulk_update(failed, ['attempts', 'last_error', 'next_attempt_at', 'claimed_until'])
+
+    return len(done) + len(revived), len(failed)
@@ -1,33 +1,161 @@
+import re
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.decorators import login_required
-from events.utils import upload_image_to_s3, delete_image_from_s3
+from django.contrib.auth.models import User
+from events.utils import delete_image_from_s3
+from . import exports, ics
+from .exports import EXPORT_FORMATS
 from .forms import RegisterForm, EventForm
+from .cache import ahome_page_cache_key, home_page_cache_key
 from .models import Event, RSVP
+from .pagination import KeysetPaginator
+from .search import RankedPaginator, search_events
+from .rsvp import arsvp_statuses, arsvped_event_ids, fill_waitlist, rsvp_statuses, rsvped_event_ids, set_rsvp
+from .tasks import process_direct_upload, run_in_background, spool_upload, upload_event_image
+from .utils import create_presigned_upload
 from django.contrib import messages
-from django.core.paginator import Paginator
 from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponseBadRequest, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.http import urlencode
+from django.views.decorators.http import condition, require_GET, require_POST
+from django.db import transaction
+
+def schedule_image_upload(event, image_file=None, image_key=None):
+    if image_key:
+        transaction.on_commit(lambda: run_in_background(process_direct_upload, event.pk, image_key))
+    else:
+        spooled = spool_upload(image_file)
+        transaction.on_commit(lambda: run_in_background(upload_event_image, event.pk, spooled))
 
-def home(request):
-    events_list = Event.objects.order_by('date')
-    paginator = Paginator(events_list, 5)  # Show 5 events per page
 
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+def _home_paginator(request):
+    include_past = request.GET.get('include_past') == '1'
+    events_list = Event.objects.all() if include_past else Event.objects.upcoming()
+    return include_past, KeysetPaginator(events_list, 5)  # Show 5 events per page
 
-    return render(request, 'events/home.html', {'page_obj': page_obj})
 
+def _render_home_grid(context, page_obj, rsvped_ids):
+    context['page_obj'] = page_obj
+    context['rsvped_event_ids'] = rsvped_ids
+    context['page_query'] = 'include_past=1' if context['include_past'] else ''
+    return render_to_string('events/event_grid.html', context)
 
-def event_detail(request, event_id):
-    # Fetch the event with the given event_id or return a 404 error if not found
-    event = get_object_or_404(Event, pk=event_id)
-    has_rsvped = False
+
+def _render_home(request, context, grid):
+    context['grid'] = grid
     if request.user.is_authenticated:
-        has_rsvped = RSVP.objects.filter(user=request.user, event=event).exists()
+        context['calendar_token'] = ics.feed_token(request.user)
+    return render(request, 'events/home.html', context)
+
+
+def home(request):
+    include_past, paginator = _home_paginator(request)
+    context = {'include_past': include_past}
+
+    # The card grid is the same for every anonymous visitor, so it is cached
+    # per page. Messages and the auth-dependent navbar are rendered outside of
+    # it; signed-in users get "attending" badges and skip the shared cache.
+    use_cache = not request.user.is_authenticated
+    cache_key = home_page_cache_key(request.GET)
+    grid = cache.get(cache_key) if use_cache else None
+    if grid is None:
+        page_obj = paginator.get_page(request.GET)
+        grid = _render_home_grid(context, page_obj, rsvped_event_ids(request, [event.id for event in page_obj]))
+        if use_cache:
+            cache.set(cache_key, grid, settings.EVENTS_HOME_CACHE_TIMEOUT)
+    return _render_home(request, context, grid)
+
+
+async def aload_user(request):
+    # request.user is lazy and loading it reads the session and user tables
+    # with the sync ORM, so it is loaded on a worker thread
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+async def home_async(request):
+    """``home`` for ASGI servers, on the async cache and ORM APIs."""
+    include_past, paginator = _home_paginator(request)
+    context = {'include_past': include_past}
+
+    use_cache = not (await aload_user(request)).is_authenticated
+    cache_key = await ahome_page_cache_key(request.GET)
+    grid = await cache.aget(cache_key) if use_cache else None
+    if grid is None:
+        page_obj = await paginator.aget_page(request.GET)
+        grid = _render_home_grid(context, page_obj, await arsvped_event_ids(request, [event.id for event in page_obj]))
+        if use_cache:
+            await cache.aset(cache_key, grid, settings.EVENTS_HOME_CACHE_TIMEOUT)
+    return _render_home(request, context, grid)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    include_past = request.GET.get('include_past') == '1'
+    context = {'query': query, 'include_past': include_past}
+
+    if query:
+        events_list = Event.objects.all() if include_past else Event.objects.upcoming()
+        paginator = RankedPaginator(search_events(events_list, query), 5)
+        page_obj = paginator.get_page(request.GET)
+        params = {'q': query}
+        if include_past:
+            params['include_past'] = '1'
+        context.update({
+            'page_obj': page_obj,
+            'rsvped_event_ids': rsvped_event_ids(request, [event.id for event in page_obj]),
+            'page_query': urlencode(params),
+        })
+    return render(request, 'events/search.html', context)
+
+
+def _render_event_detail(request, event, rsvp_status):
     return render(request, 'events/event_detail.html', {
         'event': event,
-        'has_rsvped': has_rsvped,
+        'has_rsvped': rsvp_status is not None,
+        'is_waitlisted': rsvp_status == RSVP.Status.WAITLISTED,
+        'rsvped_event_ids': {event.id} if rsvp_status == RSVP.Status.GOING else set(),
+    })
+
+
+def event_detail(request, event_id):
+    # Fetch the event with the given event_id or return a 404 error if not found
+    event = get_object_or_404(Event.objects.select_related('created_by'), pk=event_id)
+    return _render_event_detail(request, event, rsvp_statuses(request, [event.id]).get(event.id))
+
+
+async def event_detail_async(request, event_id):
+    """``event_detail`` for ASGI servers, on the async ORM."""
+    await aload_user(request)
+    try:
+        event = await Event.objects.select_related('created_by').aget(pk=event_id)
+    except Event.DoesNotExist:
+        raise Http404('No Event matches the given query.')
+    statuses = await arsvp_statuses(request, [event.id])
+    return _render_event_detail(request, event, statuses.get(event.id))
+
+
+async def rsvp_status(request, event_id):
+    """The current user's RSVP status for an event and its seat count, as JSON."""
+    # require_GET cannot wrap coroutines before Django 5.0
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    await aload_user(request)
+    event = await Event.objects.filter(pk=event_id).values('attendee_count', 'capacity').afirst()
+    if event is None:
+        return JsonResponse({'error': 'No Event matches the given query.'}, status=404)
+    statuses = await arsvp_statuses(request, [event_id])
+    return JsonResponse({
+        'event': event_id,
+        'status': statuses.get(event_id),
+        'attendee_count': event['attendee_count'],
+        'capacity': event['capacity'],
     })
 
 
@@ -37,7 +165,7 @@ def register_view(request):
         if form.is_valid():
             user = form.save()
             # Log the user in automatically after registration
-            login(request, user)
+            login(request, user, backend='events.auth.CachedModelBackend')
             messages.success(request, 'Welcome! You have successfully registered!')
             return redirect('home')
     else:
@@ -74,21 +202,27 @@ def logout_view(request):
 @login_required(login_url='/login/')
 def create_event(request):
     if request.method == 'POST':
-        form = EventForm(request.POST, request.FILES)
+        form = EventForm(request.POST, request.FILES, user=request.user)
         if form.is_valid():
             event = form.save(commit=False)
             event.created_by = request.user
-
-            image_file = request.FILES.get('image')
-            if image_file:
-                s3_url = upload_image_to_s3(image_file)
-                event.image = s3_url
-
-            event.save()
+            event.image = None
+
+            # Either a presigned upload that is already in S3, or the file itself
+            image_key = form.cleaned_data.get('image_key')
+            image_file = None if image_key else request.FILES.get('image')
+            if image_key or image_file:
+                # Save right away; the worker fills in the S3 URL later
+                event.image_status = Event.ImageStatus.PENDING
+
+            with transaction.atomic():
+                event.save()
+                if image_key or image_file:
+                    schedule_image_upload(event, image_file, image_key)
             messages.success(request, 'Event created successfully!')
             return redirect('home')
     else:
-        form = EventForm()
+        form = EventForm(user=request.user)
     return render(request, 'events/create_event.html', {
         'form': form,
         'is_update': False
@@ -99,23 +233,40 @@ def create_event(request):
 @login_required(login_url='/login/')
 def update_event(request, event_id):
     event = get_object_or_404(Event, pk=event_id, created_by=request.user)
+    current_image = event.image.name or None
+    current_capacity = event.capacity
 
     if request.method == 'POST':
-        form = EventForm(request.POST, request.FILES, instance=event)
+        form = EventForm(request.POST, request.FILES, instance=event, user=request.user)
         if form.is_valid():
             event = form.save(commit=False)
-
-            image_file = request.FILES.get('image')
-            if image_file:
-                # Upload new image and update the S3 URL
-                s3_url = upload_image_to_s3(image_file)
-                event.image = s3_url  # This overwrites old image URL
-
-            event.save()
+            image_key = form.cleaned_data.get('image_key')
+            image_file = None if image_key else request.FILES.get('image')
+            # ClearableFileInput cleans a ticked "Clear" box to False
+            cleared = not (image_key or image_file) and form.cleaned_data.get('image') is False
+            if cleared:
+                event.image = None
+                event.image_variants = {}
+                event.image_status = Event.ImageStatus.NONE
+            else:
+                # Keep serving the current image until the new upload completes
+                event.image = current_image
+            if image_key or image_file:
+                event.image_status = Event.ImageStatus.PENDING
+
+            with transaction.atomic():
+                event.save()
+                if cleared and current_image:
+                    delete_image_from_s3(current_image)
+                if event.capacity != current_capacity:
+                    # Raising or removing the capacity opens seats for the waitlist
+                    fill_waitlist(event.id)
+                if image_key or image_file:
+                    schedule_image_upload(event, image_file, image_key)
             messages.success(request, 'Event updated successfully!')
             return redirect('event_detail', event_id=event.id)
     else:
-        form = EventForm(instance=event)
+        form = EventForm(instance=event, user=request.user)
 
     return render(request, 'events/create_event.html', {
         'form': form,
@@ -124,6 +275,29 @@ def update_event(request, event_id):
     })
 
 
+# Presigned direct-to-S3 image upload (Authenticated User)
+@login_required(login_url='/login/')
+@require_POST
+def presign_image_upload(request):
+    content_type = request.POST.get('content_type', '')
+    if content_type not in settings.EVENTS_IMAGE_CONTENT_TYPES:
+        return JsonResponse({'error': 'Unsupported image type.'}, status=400)
+    try:
+        size = int(request.POST.get('size', 0))
+    except ValueError:
+        size = 0
+    if not 0 < size <= settings.EVENTS_IMAGE_MAX_UPLOAD_SIZE:
+        return JsonResponse({'error': 'Image is empty or too large.'}, status=400)
+
+    # Optional hex SHA-256 of the file; S3 then verifies the bytes on upload
+    sha256 = request.POST.get('sha256', '').lower()
+    if sha256 and not re.fullmatch(r'[0-9a-f]{64}', sha256):
+        return JsonResponse({'error': 'Invalid checksum.'}, status=400)
+
+    method = 'put' if request.POST.get('method') == 'put' else 'post'
+    return JsonResponse(create_presigned_upload(request.user, content_type, method, sha256 or None))
+
+
 # Event Delete (Authenticated User)
 @login_required(login_url='/login/')
 def delete_event(request, event_id):
@@ -134,8 +308,9 @@ def delete_event(request, event_id):
         if event.image:
             delete_image_from_s3(str(event.image))
 
-        # Delete the event from DB
-        event.delete()
+        # Delete the event from DB; the cascade to RSVPs is one transaction
+        with transaction.atomic():
+            event.delete()
         messages.success(request, 'Event deleted successfully!')
         return redirect('home')
 
@@ -143,15 +318,95 @@ def delete_event(request, event_id):
 
 # RSVP to Event
 @login_required(login_url='/login/')
+@require_POST
 def toggle_rsvp(request, event_id):
-    event = get_object_or_404(Event, id=event_id)
+    # The form says which state it wants, so a double submit is idempotent;
+    # without an action the RSVP is toggled
+    attend = {'attend': True, 'cancel': False}.get(request.POST.get('action'))
+    try:
+        status = set_rsvp(request.user, event_id, attend)
+    except Event.DoesNotExist:
+        raise Http404('No Event matches the given query.')
+
+    if status == RSVP.Status.WAITLISTED:
+        messages.info(request, "This event is full. You're on the waitlist and will be added if a spot opens up.")
+
+    return redirect('event_detail', event_id=event_id)
+
+
+def _streaming_export(lines, filename, export_format):
+    response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
+
+
+# Export the organiser's events (Authenticated User)
+@login_required(login_url='/login/')
+def export_events(request):
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('Unsupported export format.')
+    return _streaming_export(exports.export_events(request.user, export_format), 'events', export_format)
+
+
+# Export an event's attendee list (Event creator only)
+@login_required(login_url='/login/')
+def export_attendees(request, event_id):
+    event = get_object_or_404(Event, pk=event_id, created_by=request.user)
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('Unsupported export format.')
+    lines = exports.export_attendees(event.id, export_format)
+    return _streaming_export(lines, f'event-{event.id}-attendees', export_format)
+
+
+# iCalendar feeds: the ETag/Last-Modified come from one aggregate query, so
+# a polling calendar client that is up to date gets a 304 without rendering
+
+def _feed_events(request, token=None, username=None):
+    if '_feed_events' not in request.__dict__:
+        if username is not None:
+            events = ics.organised_events(username)
+        else:
+            user_id = ics.user_from_feed_token(token)
+            events = ics.attending_events(user_id) if user_id is not None else None
+        request._feed_events = events
+    return request._feed_events
+
+
+def _feed_state(request, **kwargs):
+    if '_feed_state' not in request.__dict__:
+        events = _feed_events(request, **kwargs)
+        request._feed_state = ics.feed_state(events) if events is not None else (None, None)
+    return request._feed_state
+
+
+def _feed_etag(request, **kwargs):
+    return _feed_state(request, **kwargs)[0]
+
+
+def _feed_last_modified(request, **kwargs):
+    return _feed_state(request, **kwargs)[1]
+
+
+def _calendar_response(request, events, name):
+    base_url = request.build_absolute_uri('/').rstrip('/')
+    response = StreamingHttpResponse(ics.iter_calendar(events, name, base_url), content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = 'inline; filename="events.ics"'
+    return response
 
-    rsvp, created = RSVP.objects.get_or_create(user=request.user, event=event)
 
-    if not created:
-        # Already exists -> user wants to un-RSVP
-        rsvp.delete()
-    # If created, RSVP was added successfully
+@require_GET
+@condition(etag_func=_feed_etag, last_modified_func=_feed_last_modified)
+def attending_calendar(request, token):
+    events = _feed_events(request, token=token)
+    if events is None:
+        raise Http404('Unknown calendar feed.')
+    return _calendar_response(request, events, 'My EventPlanner events')
 
-    return redirect('event_detail', event_id=event.id)
 
+@require_GET
+@condition(etag_func=_feed_etag, last_modified_func=_feed_last_modified)
+def organiser_calendar(request, username):
+    organiser = get_object_or_404(User, username=username)
+    return _calendar_response(request, _feed_events(request, username=username), f'Events by {organiser.username}')